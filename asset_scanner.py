@@ -3,16 +3,20 @@ import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+from template_bank import TemplateBank
+from template_cache import TemplateCache
+
 
 logger = logging.getLogger(__name__)
 
 
 class AssetScanner:
-    def __init__(self, image_matcher, max_workers=None):
+    def __init__(self, image_matcher, max_workers=None, cache_dir=None):
         self.image_matcher = image_matcher
         cpu_count = os.cpu_count() or 1
         self.max_workers = max_workers or min(32, cpu_count + 4)
         self._template_cache = {}
+        self.disk_cache = TemplateCache(cache_dir) if cache_dir else None
 
     def scan(self, assets_dir, required_templates=None):
         assets_path = Path(assets_dir)
@@ -25,14 +29,26 @@ class AssetScanner:
 
         templates = {}
         if not template_files:
-            return templates
+            return TemplateBank()
+
+        if self.disk_cache is not None:
+            self.disk_cache.load()
+            uncached_files = []
+            for template_file in template_files:
+                template_data = self._cached_template(template_file)
+                if template_data is None:
+                    uncached_files.append(template_file)
+                    continue
+                templates[template_file.stem] = template_data
+                logger.info(f"Loaded template: {template_file.stem} (cached)")
+            template_files = uncached_files
 
         if len(template_files) == 1:
             template_name, template_data = self._load_template(template_files[0])
             if template_data is not None:
                 templates[template_name] = template_data
                 logger.info(f"Loaded template: {template_name}")
-        else:
+        elif template_files:
             with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
                 futures = {
                     executor.submit(self._load_template, template_file): template_file
@@ -52,12 +68,19 @@ class AssetScanner:
                     templates[template_name] = template_data
                     logger.info(f"Loaded template: {template_name}")
 
+        if self.disk_cache is not None:
+            self.disk_cache.save()
+
         if required_set:
             missing = sorted(required_set.difference(templates.keys()))
             if missing:
                 logger.warning(f"Missing {len(missing)} required templates: {', '.join(missing)}")
 
-        return templates
+        masked = sorted(name for name, template in templates.items() if template.mask is not None)
+        if masked:
+            logger.info(f"{len(masked)} templates keep an alpha mask (masked match path): {', '.join(masked)}")
+
+        return TemplateBank(templates[name] for name in sorted(templates))
 
     def _collect_template_files(self, assets_path, required_set):
         if required_set:
@@ -80,6 +103,23 @@ class AssetScanner:
         template_files.sort()
         return template_files
 
+    def _cached_template(self, template_file):
+        try:
+            mtime = template_file.stat().st_mtime
+        except OSError:
+            mtime = None
+
+        cached = self._template_cache.get(str(template_file))
+        if cached and cached["mtime"] == mtime:
+            return cached["data"]
+
+        if self.disk_cache is None:
+            return None
+        compiled = self.disk_cache.get(template_file, self.disk_cache.stat_key(template_file))
+        if compiled is not None:
+            self._template_cache[str(template_file)] = {"mtime": mtime, "data": compiled}
+        return compiled
+
     def _load_template(self, template_file):
         template_name = template_file.stem
         try:
@@ -91,6 +131,9 @@ class AssetScanner:
         if cached and cached["mtime"] == mtime:
             return template_name, cached["data"]
 
-        template_img = self.image_matcher.load_template(template_file)
-        self._template_cache[str(template_file)] = {"mtime": mtime, "data": template_img}
-        return template_name, template_img
+        template_img, mask = self.image_matcher.load_template(template_file)
+        compiled = self.image_matcher.compile_template(template_img, mask, name=template_name)
+        if self.disk_cache is not None:
+            self.disk_cache.put(template_file, self.disk_cache.stat_key(template_file), compiled)
+        self._template_cache[str(template_file)] = {"mtime": mtime, "data": compiled}
+        return template_name, compiled
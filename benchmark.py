@@ -0,0 +1,663 @@
+"""
+Vision pipeline benchmarks
+
+Usage:
+    python benchmark.py red-icons [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py pyramid [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py incremental [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py workers [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py service [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py startup [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py cascade [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py verify [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py masks [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py capture [--frames DIR] [--count N] [--repeat N]
+    python benchmark.py bgra [--frames DIR] [--count N] [--repeat N]
+
+Frames are read from DIR (defaults to config.SCREENSHOTS_DIR). When no frames
+are available, synthetic 360x660 frames with pasted red icon templates are used
+so the benchmarks also run on machines without the game. The incremental
+benchmark treats the frames as a capture sequence; synthetic sequences animate
+a few small patches per frame on top of a static scene. The cascade benchmark
+learns the template order from full scans of the first half of the frames and
+checks recall on the second half. The capture benchmark replays the frames as
+32-bit bitmaps through the old per-frame allocating readback and through the
+reusable capture ring, holding recent frames the way the bot's caches do, and
+compares full-frame polls with region polls. The bgra benchmark weighs the
+per-frame colour conversion against the detectors it feeds, running them on
+converted frames and on the raw 32-bit bitmaps the capture ring hands over.
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import config
+from asset_scanner import AssetScanner
+from frame_source import CaptureRing, FileFrameSource, SyntheticFrameSource
+from image_matcher import ImageMatcher
+from incremental_detector import IncrementalDetector
+from red_icon_cascade import cascade_order, cascade_red_icon_bank
+from vision_corpus import (FIXED_UI_TEMPLATES, gate_red_icon_hits, load_frames, load_templates, recall, red_icon_bank,
+                           red_icon_hits, synthetic_sequence, vote)
+from vision_service import VisionService, match_red_icon_bank
+
+
+def load_raw_templates(image_matcher, names):
+    # The PNG as stored, with the alpha channel always turned into a match mask.
+    raw_templates = {}
+    for name in names:
+        image = cv2.imread(str(Path(config.ASSETS_DIR) / f"{name}.png"), cv2.IMREAD_UNCHANGED)
+        mask = None
+        if image.ndim == 3 and image.shape[2] == 4:
+            mask = np.where(image[:, :, 3] > 0, 255, 0).astype(np.uint8)
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        raw_templates[name] = (image, mask)
+    return raw_templates
+
+
+def masked_find_all(image_matcher, frame, template, mask, threshold, min_distance):
+    result = cv2.matchTemplate(frame, template, cv2.TM_SQDIFF_NORMED, mask=mask)
+    h, w = template.shape[:2]
+    matches = image_matcher.extract_matches(result, threshold, w, h)
+    return image_matcher.match_tuples(image_matcher.non_max_suppression(matches, min_distance))
+
+
+def measure(label, func, frames, repeat, unit="scans"):
+    func(frames[0])
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            func(frame)
+    elapsed = time.perf_counter() - start
+    scans = repeat * len(frames)
+    rate = scans / elapsed if elapsed > 0 else float("inf")
+    print(f"{label:<32} {rate:8.1f} {unit}/s  {elapsed / scans * 1000:8.2f} ms each")
+    return rate
+
+
+def bench_red_icons(args):
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    bank = red_icon_bank(templates)
+    frames = load_frames(args.frames, args.count, templates)
+    threshold = config.RED_ICON_THRESHOLD
+
+    raw_templates = load_raw_templates(image_matcher, bank.names())
+
+    def loop_scan(frame):
+        return [
+            (name, masked_find_all(image_matcher, frame, template, mask, threshold, 80))
+            for name, (template, mask) in raw_templates.items()
+        ]
+
+    def bank_scan(frame):
+        return image_matcher.find_all_templates_multi(frame, bank, threshold=threshold, min_distance=80)
+
+    def bank_scan_direct(frame):
+        return image_matcher.find_all_templates_multi(
+            frame, bank, threshold=threshold, min_distance=80, use_fft=False,
+        )
+
+    extent = bank.max_extent()
+
+    def gated_scan(frame):
+        rois = image_matcher.red_candidate_rois(
+            frame,
+            padding=extent,
+            size=config.RED_ICON_COLOR_SAMPLE_SIZE,
+            min_ratio=config.RED_ICON_COLOR_MIN_RATIO,
+            min_mean=config.RED_ICON_COLOR_MIN_MEAN,
+            min_area=config.RED_ICON_CANDIDATE_MIN_AREA,
+            max_size=config.RED_ICON_CANDIDATE_MAX_SIZE,
+        )
+        return image_matcher.find_all_templates_in_rois(frame, bank, rois, threshold=threshold, min_distance=80)
+
+    print(f"Red icon scan: {len(bank)} templates, {len(frames)} frames x {args.repeat}")
+    baseline = measure("per-template masked loop", loop_scan, frames, args.repeat)
+    for label, func in (
+        ("multi-template (fft)", bank_scan),
+        ("multi-template (direct)", bank_scan_direct),
+        ("red candidate gated", gated_scan),
+    ):
+        rate = measure(label, func, frames, args.repeat)
+        print(f"{'':<32} speedup x{rate / baseline:.2f}")
+
+
+def bench_pyramid(args):
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    frames = load_frames(args.frames, args.count, templates)
+
+    for name in FIXED_UI_TEMPLATES:
+        if name not in templates:
+            continue
+        template = templates[name]
+        print(f"{name} {template.width}x{template.height}")
+        for levels in (0, 1, 2):
+            def check(frame, levels=levels):
+                return image_matcher.find_template(frame, template, template_name=name, pyramid_levels=levels)
+
+            agree = sum(
+                check(frame)[2:] == image_matcher.find_template(frame, template)[2:]
+                for frame in frames
+            )
+            measure(f"  pyramid_levels={levels}", check, frames, args.repeat, unit="checks")
+            print(f"{'':<32} location agrees with full search on {agree}/{len(frames)} frames")
+
+
+def bench_incremental(args):
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    bank = red_icon_bank(templates)
+    frames = load_frames(args.frames, args.count, templates, synthetic=synthetic_sequence)
+
+    detector = IncrementalDetector(
+        image_matcher,
+        tile_size=config.INCREMENTAL_TILE_SIZE,
+        diff_threshold=config.INCREMENTAL_DIFF_THRESHOLD,
+        max_dirty_ratio=config.INCREMENTAL_MAX_DIRTY_RATIO,
+    )
+    ratios = [detector.dirty_tiles(previous, frame).ratio for previous, frame in zip(frames, frames[1:])]
+    print(f"Dirty tile ratio over {len(ratios)} frame pairs ({config.INCREMENTAL_TILE_SIZE}px tiles): "
+          f"mean {np.mean(ratios):.1%}, max {np.max(ratios):.1%}")
+
+    threshold = config.RED_ICON_THRESHOLD
+    checks = [
+        (
+            "red icon bank",
+            lambda frame: image_matcher.find_all_templates_multi(frame, bank, threshold=threshold, min_distance=80),
+            lambda frame: detector.find_all_templates_multi(
+                "red_icons", frame, bank, threshold=threshold, min_distance=80,
+                base_threshold=config.AI_RED_ICON_THRESHOLD_MIN,
+            ),
+            lambda result: [(name, sorted(hit[1:] for hit in hits)) for name, hits in result],
+        ),
+    ]
+    for name in FIXED_UI_TEMPLATES:
+        if name in templates:
+            checks.append((
+                name,
+                lambda frame, name=name: image_matcher.find_template(frame, templates[name], template_name=name),
+                lambda frame, name=name: detector.find_template(name, frame, templates[name], template_name=name),
+                lambda result: (result[0], result[2:]),
+            ))
+
+    for label, full, incremental, locations in checks:
+        print(label)
+        detector.reset()
+        agree = sum(locations(full(frame)) == locations(incremental(frame)) for frame in frames)
+        full_rate = measure("  full detection", full, frames, args.repeat, unit="frames")
+        detector.reset()
+        incremental_rate = measure("  incremental", incremental, frames, args.repeat, unit="frames")
+        print(f"{'':<32} speedup x{incremental_rate / full_rate:.2f}, results agree on {agree}/{len(frames)} frames")
+
+    stats = detector.stats
+    print(f"Incremental passes: {stats['reused']} reused, {stats['incremental']} incremental, {stats['full']} full")
+
+
+def bench_workers(args):
+    cpu_count = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cpu_count} & set(range(1, cpu_count + 1)))
+    threshold = config.RED_ICON_THRESHOLD
+    baseline = None
+    for workers in counts:
+        image_matcher = ImageMatcher(config.MATCH_THRESHOLD, workers=workers)
+        templates = load_templates(image_matcher)
+        bank = red_icon_bank(templates)
+        frames = load_frames(args.frames, args.count, templates)
+
+        def bank_scan(frame):
+            return image_matcher.find_all_templates_multi(frame, bank, threshold=threshold, min_distance=80)
+
+        def roi_maps(frame):
+            return image_matcher.score_maps(frame, bank, region=(0, 0, 200, 200))
+
+        print(f"workers={workers} (OpenCV threads {cv2.getNumThreads()})")
+        rate = measure("  red icon bank scan", bank_scan, frames, args.repeat)
+        measure("  score maps 200x200 ROI", roi_maps, frames, args.repeat)
+        baseline = baseline or rate
+        print(f"{'':<32} bank scan speedup x{rate / baseline:.2f}")
+        image_matcher.shutdown()
+
+
+def pacing_jitter(func, frames, repeat, interval=0.004):
+    lateness = []
+    stop = threading.Event()
+
+    def pace():
+        target = time.perf_counter()
+        while not stop.is_set():
+            target += interval
+            time.sleep(max(0.0, target - time.perf_counter()))
+            now = time.perf_counter()
+            lateness.append(now - target)
+            target = max(target, now)
+
+    pacer = threading.Thread(target=pace, daemon=True)
+    pacer.start()
+    for _ in range(repeat):
+        for frame in frames:
+            func(frame)
+    stop.set()
+    pacer.join()
+    return np.asarray(lateness) * 1000
+
+
+def bench_service(args):
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    bank = red_icon_bank(templates)
+    frames = load_frames(args.frames, args.count, templates)
+    threshold = config.RED_ICON_THRESHOLD
+
+    def in_process(frame):
+        return match_red_icon_bank(image_matcher, frame, bank, threshold)
+
+    service = VisionService(
+        bank.names(),
+        workers=config.VISION_SERVICE_WORKERS,
+        slots=config.VISION_SERVICE_SLOTS,
+        max_shape=frames[0].shape,
+        timeout=30.0,
+    )
+    service.start()
+    try:
+        def offloaded(frame):
+            return service.match_red_icon_bank(frame, threshold)[0]
+
+        agree = sum(in_process(frame) == offloaded(frame) for frame in frames)
+        print(f"Vision service results agree with in-process matching on {agree}/{len(frames)} frames")
+        for label, func in (("in-process", in_process), ("vision service", offloaded)):
+            measure(label, func, frames, args.repeat)
+            lateness = pacing_jitter(func, frames, args.repeat)
+            print(f"{'':<32} 4ms pacing loop lateness p50 {np.percentile(lateness, 50):.2f} ms, "
+                  f"p99 {np.percentile(lateness, 99):.2f} ms, max {lateness.max():.2f} ms")
+    finally:
+        service.stop()
+
+
+def bench_startup(args):
+    reference = load_templates(ImageMatcher(config.MATCH_THRESHOLD))
+    frame = load_frames(args.frames, 1, reference)[0]
+    first_template = "newLevel" if "newLevel" in reference else reference.names()[0]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for label, cache, runs in (
+            ("cold start (decode PNGs)", None, args.repeat),
+            ("cache build", cache_dir, 1),
+            ("warm start (mapped cache)", cache_dir, args.repeat),
+        ):
+            scan_times = []
+            detect_times = []
+            identical = True
+            for _ in range(runs):
+                start = time.perf_counter()
+                image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+                templates = AssetScanner(image_matcher, cache_dir=cache).scan(config.ASSETS_DIR)
+                scanned = time.perf_counter()
+                image_matcher.find_template(frame, templates[first_template], template_name=first_template)
+                detected = time.perf_counter()
+                scan_times.append(scanned - start)
+                detect_times.append(detected - start)
+                identical = identical and all(
+                    np.array_equal(templates[name].image, reference[name].image)
+                    and templates[name].anchor == reference[name].anchor
+                    for name in reference.names()
+                )
+            print(f"{label:<32} scan {np.median(scan_times) * 1000:8.2f} ms  "
+                  f"first detection {np.median(detect_times) * 1000:8.2f} ms  "
+                  f"({len(templates)} templates, {'identical' if identical else 'DIFFERENT'})")
+
+
+def bench_cascade(args):
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    bank = red_icon_bank(templates)
+    frames = load_frames(args.frames, max(2, args.count), templates)
+    training, evaluation = frames[:len(frames) // 2], frames[len(frames) // 2:]
+    threshold = config.RED_ICON_THRESHOLD
+    min_matches = config.RED_ICON_MIN_MATCHES
+    stage_size = config.RED_ICON_CASCADE_STAGE_SIZE
+    names = bank.names()
+
+    def full_scan(frame):
+        hits = red_icon_hits(image_matcher, frame, match_red_icon_bank(image_matcher, frame, bank, threshold), names)
+        return vote(image_matcher, hits, names, min_matches)
+
+    stats = {
+        name: {"full_scans": 0, "full_hits": 0, "full_votes": 0, "full_time": 0.0}
+        for name in names
+    }
+    voter_sets = []
+    for frame in training:
+        image_matcher.pop_template_timings()
+        hits = red_icon_hits(image_matcher, frame, match_red_icon_bank(image_matcher, frame, bank, threshold), names)
+        timings = image_matcher.pop_template_timings()
+        for name in names:
+            stats[name]["full_scans"] += 1
+            stats[name]["full_time"] += timings.get(name, 0.0)
+        for index in hits["template"].tolist():
+            stats[names[index]]["full_hits"] += 1
+        for _, _, voters in vote(image_matcher, hits, names, min_matches):
+            voter_sets.append(voters)
+            for name in voters:
+                stats[name]["full_votes"] += 1
+
+    order, cover_size = cascade_order(names, stats, voter_sets)
+    stage_size = max(min_matches, stage_size, cover_size)
+    evaluated = []
+
+    def cascade_scan(frame):
+        hits, stage_names = cascade_red_icon_bank(
+            image_matcher,
+            frame,
+            bank,
+            order,
+            threshold,
+            min_matches,
+            stage_size,
+            names=names,
+            gate=lambda frame, found: gate_red_icon_hits(image_matcher, frame, found),
+            padding=config.RED_ICON_CASCADE_PADDING,
+        )
+        evaluated.append(len(stage_names))
+        return vote(image_matcher, hits, names, min_matches)
+
+    reference = [full_scan(frame) for frame in evaluation]
+    found = [cascade_scan(frame) for frame in evaluation]
+    cascade_recall, extra = recall(reference, found)
+
+    print(f"Red icon cascade: {len(bank)} templates, trained on {len(training)} frames, "
+          f"evaluated on {len(evaluation)} frames x {args.repeat}")
+    print(f"Learned order: {', '.join(order)}")
+    baseline = measure("full bank", full_scan, evaluation, args.repeat)
+    rate = measure("cascade", cascade_scan, evaluation, args.repeat)
+    print(f"{'':<32} speedup x{rate / baseline:.2f}")
+    print(f"{'':<32} first-stage templates {stage_size}/{len(bank)}, "
+          f"ROI templates per frame {np.mean(evaluated) - stage_size:.1f}")
+    print(f"{'':<32} recall {cascade_recall:.3f} of {sum(len(icons) for icons in reference)} detections, "
+          f"{extra} extra")
+
+
+def bench_verify(args):
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    bank = red_icon_bank(templates)
+    frames = load_frames(args.frames, args.count, templates)
+    stack = image_matcher.stacked_templates(bank)
+    rng = np.random.default_rng(7)
+
+    for label, radius in (
+        ("refine", config.RED_ICON_REFINE_RADIUS),
+        ("verify", config.RED_ICON_VERIFY_PADDING),
+    ):
+        rois = []
+        for frame in frames:
+            for _ in range(4):
+                x = int(rng.integers(radius, frame.shape[1] - radius))
+                y = int(rng.integers(radius, frame.shape[0] - radius))
+                rois.append(frame[y - radius:y + radius, x - radius:x + radius])
+
+        def loop_scores(roi):
+            return [
+                cv2.matchTemplate(roi, compiled.image, cv2.TM_SQDIFF_NORMED, mask=compiled.mask)
+                for compiled in bank
+            ]
+
+        worst = max(
+            float(np.abs(batched - looped).max())
+            for roi in rois
+            for batched, looped in zip(stack.score(roi), loop_scores(roi))
+        )
+        size = 2 * radius
+        print(f"Red icon {label} window {size}x{size}: {len(bank)} templates, {len(rois)} windows x {args.repeat}, "
+              f"max score difference {worst:.2e}")
+        baseline = measure("per-template matchTemplate", loop_scores, rois, args.repeat, unit="verifies")
+        rate = measure("stacked batch", stack.score, rois, args.repeat, unit="verifies")
+        print(f"{'':<32} speedup x{rate / baseline:.2f}")
+
+
+def bench_masks(args):
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    frames = load_frames(args.frames, args.count, templates)
+    raw_templates = load_raw_templates(image_matcher, templates.names())
+
+    print(f"Masked PNG vs compiled template: {len(frames)} frames x {args.repeat}")
+    print("Only mask-free templates can use the frame spectra shared across a bank scan (fft column).")
+    print(f"{'template':<16} {'raw size':>9} {'compiled':>9} {'masked ms':>10} {'direct ms':>10} {'fft ms':>8} "
+          f"{'speedup':>8} {'same centre':>12} {'max conf diff':>14}")
+    for name in templates.names():
+        image, mask = raw_templates[name]
+        compiled = templates[name]
+        raw_h, raw_w = image.shape[:2]
+
+        def masked(frame):
+            result = cv2.matchTemplate(frame, image, cv2.TM_SQDIFF_NORMED, mask=mask)
+            min_val, _, min_loc, _ = cv2.minMaxLoc(result)
+            return 1 - min_val, min_loc[0] + raw_w // 2, min_loc[1] + raw_h // 2
+
+        def fast(frame):
+            min_val, min_loc = image_matcher.best_match(frame, compiled)
+            return 1 - min_val, min_loc[0] + compiled.anchor[0], min_loc[1] + compiled.anchor[1]
+
+        def shared_fft(frame):
+            return image_matcher.find_template_peaks(frame, [compiled], use_fft=compiled.mask is None)
+
+        for frame in frames:
+            image_matcher.frame_features(frame).precompute(image_matcher.frame_features(frame).dft_shape())
+
+        timings = []
+        for func in (masked, fast, shared_fft):
+            func(frames[0])
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for frame in frames:
+                    func(frame)
+            timings.append((time.perf_counter() - start) / (args.repeat * len(frames)))
+
+        same = 0
+        conf_diff = 0.0
+        for frame in frames:
+            masked_conf, masked_x, masked_y = masked(frame)
+            fast_conf, fast_x, fast_y = fast(frame)
+            same += (masked_x, masked_y) == (fast_x, fast_y)
+            conf_diff = max(conf_diff, abs(masked_conf - fast_conf))
+
+        print(f"{name:<16} {f'{raw_w}x{raw_h}':>9} {f'{compiled.width}x{compiled.height}':>9} "
+              f"{timings[0] * 1000:10.2f} {timings[1] * 1000:10.2f} {timings[2] * 1000:8.2f} "
+              f"{timings[0] / min(timings[1:]):7.2f}x "
+              f"{f'{same}/{len(frames)}':>12} {conf_diff:14.2e}"
+              f"{'' if mask is not None else '  (no alpha)'}")
+
+
+def bench_capture(args):
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    frames = load_frames(args.frames, args.count, templates)
+    bitmaps = [cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA) for frame in frames]
+    held = deque(maxlen=image_matcher.FEATURE_CACHE_SIZE)
+    ring = CaptureRing(config.CAPTURE_RING_SLOTS)
+
+    def allocating(bitmap):
+        # GetBitmapBits hands back a new bytes object, then the alpha slice is made contiguous.
+        image = np.frombuffer(bitmap.tobytes(), dtype=np.uint8).reshape(bitmap.shape)
+        held.append(np.ascontiguousarray(image[:, :, :3]))
+
+    def ring_buffer(bitmap):
+        frame = ring.acquire(bitmap.shape[:2] + (3,))
+        cv2.cvtColor(bitmap, cv2.COLOR_BGRA2BGR, dst=frame)
+        held.append(frame)
+
+    print(f"Bitmap readback: {len(frames)} frames x {args.repeat}, holding the last {held.maxlen} frames")
+    allocating_rate = measure("allocating readback", allocating, bitmaps, args.repeat, unit="frames")
+    held.clear()
+    ring_rate = measure("capture ring", ring_buffer, bitmaps, args.repeat, unit="frames")
+    print(f"{'':<32} speedup x{ring_rate / allocating_rate:.2f}, {ring.allocations} buffers allocated, "
+          f"{ring.reuses} reused, {ring.overflows} overflows")
+    held.clear()
+
+    height, width = frames[0].shape[:2]
+    sources = [("synthetic source", SyntheticFrameSource(width, height, slots=config.CAPTURE_RING_SLOTS))]
+    if args.frames and Path(args.frames).is_dir():
+        try:
+            sources.append(("file source", FileFrameSource(args.frames, slots=config.CAPTURE_RING_SLOTS, limit=args.count)))
+        except FileNotFoundError:
+            pass
+    for label, source in sources:
+        measure(label, lambda _: held.append(source.capture()), frames, args.repeat, unit="frames")
+        stats = source.stats()
+        print(f"{'':<32} mean latency {stats['mean_latency'] * 1000:.3f} ms, {stats['allocations']} buffers allocated, "
+              f"{stats['reuses']} reused, {stats['overflows']} overflows")
+        held.clear()
+
+    # A new-level poll reads the red icon strip and one learned button spot instead of the whole frame.
+    regions = [
+        (config.NEW_LEVEL_RED_ICON_X_MIN - 12, config.NEW_LEVEL_RED_ICON_Y_MIN - 12,
+         config.NEW_LEVEL_RED_ICON_X_MAX + 12, config.NEW_LEVEL_RED_ICON_Y_MAX + 12),
+        (8, height - 112, 152, height - 37),
+    ]
+    source = SyntheticFrameSource(width, height, slots=config.CAPTURE_RING_SLOTS, patches=0)
+    full_rate = measure("full frame poll", lambda _: held.append(source.capture()), frames, args.repeat, unit="polls")
+    region_rate = measure("region poll", lambda _: held.append(source.capture_regions(regions)), frames, args.repeat,
+                          unit="polls")
+    region_bytes = sum(crop.nbytes for crop in source.capture_regions(regions))
+    print(f"{'':<32} speedup x{region_rate / full_rate:.2f}, {region_bytes / 1024:.1f} KB vs "
+          f"{frames[0].nbytes / 1024:.1f} KB per poll")
+    held.clear()
+
+
+def bench_bgra(args):
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    bank = red_icon_bank(templates)
+    fixed = [templates[name] for name in FIXED_UI_TEMPLATES if name in templates]
+    frames = load_frames(args.frames, args.count, templates)
+    bitmaps = [cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA) for frame in frames]
+    ring = CaptureRing(config.CAPTURE_RING_SLOTS)
+
+    def sliced_copy(bitmap):
+        return np.ascontiguousarray(bitmap[:, :, :3])
+
+    def ring_convert(bitmap):
+        frame = ring.acquire(bitmap.shape[:2] + (3,))
+        cv2.cvtColor(bitmap, cv2.COLOR_BGRA2BGR, dst=frame)
+        return frame
+
+    def detect(frame):
+        # A fresh view stands in for a new capture, so features cached for the previous pass are not reused.
+        frame = frame[:]
+        match_red_icon_bank(image_matcher, frame, bank, config.RED_ICON_THRESHOLD)
+        for template in fixed:
+            image_matcher.find_template(frame, template, template_name=template.name,
+                                        pyramid_levels=config.PYRAMID_SEARCH_LEVELS)
+
+    height, width = frames[0].shape[:2]
+    print(f"Colour copy vs matching: {width}x{height}, {len(frames)} frames x {args.repeat}")
+    sliced_ms = 1000 / measure("alpha slice + contiguous copy", sliced_copy, bitmaps, args.repeat, unit="frames")
+    ring_ms = 1000 / measure("BGRA to BGR into capture ring", ring_convert, bitmaps, args.repeat, unit="frames")
+
+    def timed(item):
+        start = time.perf_counter()
+        detect(item)
+        return (time.perf_counter() - start) * 1000
+
+    # Alternating the two inputs frame by frame keeps machine noise from landing on one side only.
+    detect(frames[0])
+    samples = [(timed(frame), timed(bitmap)) for _ in range(args.repeat) for frame, bitmap in zip(frames, bitmaps)]
+    bgr_ms, bgra_ms = (float(np.median(times)) for times in zip(*samples))
+    print(f"{'detectors on BGR frames':<32} {bgr_ms:8.2f} ms median")
+    print(f"{'detectors on raw BGRA frames':<32} {bgra_ms:8.2f} ms median")
+    agree = sum(
+        match_red_icon_bank(image_matcher, frame, bank, config.RED_ICON_THRESHOLD)
+        == match_red_icon_bank(image_matcher, bitmap, bank, config.RED_ICON_THRESHOLD)
+        for frame, bitmap in zip(frames, bitmaps)
+    )
+    print(f"{'':<32} red icon results agree on {agree}/{len(frames)} frames")
+
+    if fixed:
+        # BGRA templates with a zero alpha channel score exactly like BGR ones against a zero-alpha frame,
+        # but every match then reads a fourth channel.
+        template = fixed[0]
+        template_bgra = cv2.cvtColor(template.image, cv2.COLOR_BGR2BGRA)
+        template_bgra[:, :, 3] = 0
+        zeroed = [bitmap.copy() for bitmap in bitmaps]
+        for bitmap in zeroed:
+            bitmap[:, :, 3] = 0
+        three_ms = 1000 / measure(
+            f"{template.name} match, BGR",
+            lambda frame: cv2.matchTemplate(frame, template.image, cv2.TM_SQDIFF_NORMED),
+            frames,
+            args.repeat,
+            unit="matches",
+        )
+        four_ms = 1000 / measure(
+            f"{template.name} match, BGRA template",
+            lambda bitmap: cv2.matchTemplate(bitmap, template_bgra, cv2.TM_SQDIFF_NORMED),
+            zeroed,
+            args.repeat,
+            unit="matches",
+        )
+        print(f"{'':<32} {four_ms - three_ms:+.2f} ms per match against a {ring_ms:.2f} ms frame conversion")
+
+    print(f"\nPer frame: {sliced_ms:.2f} ms sliced copy, {ring_ms:.2f} ms ring conversion, {bgr_ms:.2f} ms detection "
+          f"({ring_ms / bgr_ms:.1%} of detection); raw BGRA hand-off {bgra_ms - bgr_ms:+.2f} ms detection, "
+          f"{bgra_ms - bgr_ms - ring_ms:+.2f} ms end to end")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eatventure bot vision benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    red_icons = subparsers.add_parser("red-icons", help="Full-frame red icon scan throughput")
+    red_icons.set_defaults(func=bench_red_icons)
+
+    pyramid = subparsers.add_parser("pyramid", help="Full-resolution vs coarse-to-fine fixed UI template checks")
+    pyramid.set_defaults(func=bench_pyramid)
+
+    incremental = subparsers.add_parser("incremental", help="Full vs dirty-tile incremental re-detection on a frame sequence")
+    incremental.set_defaults(func=bench_incremental)
+
+    workers = subparsers.add_parser("workers", help="Template fan-out scaling with the matcher thread pool size")
+    workers.set_defaults(func=bench_workers)
+
+    service = subparsers.add_parser("service", help="In-process vs out-of-process red icon matching and pacing jitter")
+    service.set_defaults(func=bench_service)
+
+    startup = subparsers.add_parser("startup", help="Cold vs warm template loading and time to first detection")
+    startup.set_defaults(func=bench_startup)
+
+    cascade = subparsers.add_parser("cascade", help="Full red icon bank vs learned-order cascade recall and throughput")
+    cascade.set_defaults(func=bench_cascade)
+
+    verify = subparsers.add_parser("verify", help="Per-template vs stacked batch scoring of red icon verify/refine windows")
+    verify.set_defaults(func=bench_verify)
+
+    masks = subparsers.add_parser("masks", help="Per-template masked PNG matching vs compiled (cropped) templates")
+    masks.set_defaults(func=bench_masks)
+
+    capture = subparsers.add_parser("capture", help="Allocating bitmap readback vs the reusable capture ring")
+    capture.set_defaults(func=bench_capture)
+
+    bgra = subparsers.add_parser("bgra", help="Per-frame colour copy vs match time on BGR and raw BGRA frames")
+    bgra.set_defaults(func=bench_bgra)
+
+    for subparser in (red_icons, pyramid, incremental, workers, service, startup, cascade, verify, masks, capture, bgra):
+        subparser.add_argument("--frames", default=config.SCREENSHOTS_DIR)
+        subparser.add_argument("--count", type=int, default=8)
+        subparser.add_argument("--repeat", type=int, default=3)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,23 @@
+import itertools
 import json
 import os
 import time
 import logging
 import threading
+from collections import deque
 from datetime import datetime
+from pathlib import Path
+
+import numpy as np
 
 from window_capture import WindowCapture, ForbiddenAreaOverlay
 from image_matcher import ImageMatcher
+from incremental_detector import IncrementalDetector
+from detection_cache import DetectionCache, FrameRegistry
+from frame_source import FramePublisher, create_frame_source, crop_regions
+from session_recorder import RecordingFrameSource, SessionRecorder
+from vision_service import VisionService, match_red_icon_bank
+from red_icon_cascade import cascade_order, cascade_red_icon_bank
 from mouse_controller import MouseController
 from state_machine import StateMachine, State
 from telegram_notifier import TelegramNotifier
@@ -279,6 +290,228 @@ class VisionOptimizer:
         self.persistence.save({key: float(value) for key, value in state.items()})
 
 
+class LocationPriors:
+    def __init__(self, persistence=None):
+        self.enabled = config.LOCATION_PRIORS_ENABLED
+        self.padding = config.LOCATION_PRIORS_PADDING
+        self.max_spots = config.LOCATION_PRIORS_MAX_SPOTS
+        self.merge_radius = config.LOCATION_PRIORS_MERGE_RADIUS
+        self.persistence = persistence
+        self.spots = {}
+        self._lock = threading.Lock()
+
+    def search_rois(self, template_name, template, frame_shape):
+        if not self.enabled:
+            return []
+        height, width = frame_shape[:2]
+        anchor_x, anchor_y = template.anchor
+        rois = []
+        with self._lock:
+            spots = list(self.spots.get(template_name, []))
+        for x, y, _ in spots:
+            left = x - anchor_x
+            top = y - anchor_y
+            x1 = max(0, left - self.padding)
+            y1 = max(0, top - self.padding)
+            x2 = min(width, left + template.width + self.padding)
+            y2 = min(height, top + template.height + self.padding)
+            if x2 - x1 >= template.width and y2 - y1 >= template.height:
+                rois.append((x1, y1, x2, y2))
+        return rois
+
+    def record(self, template_name, x, y):
+        if not self.enabled:
+            return
+        with self._lock:
+            spots = self.spots.setdefault(template_name, [])
+            for spot in spots:
+                if abs(spot[0] - x) <= self.merge_radius and abs(spot[1] - y) <= self.merge_radius:
+                    spot[0], spot[1] = int(x), int(y)
+                    spot[2] += 1
+                    break
+            else:
+                spots.append([int(x), int(y), 1])
+            spots.sort(key=lambda spot: spot[2], reverse=True)
+            del spots[self.max_spots:]
+            state = {name: [list(spot) for spot in entries] for name, entries in self.spots.items()}
+        if self.persistence:
+            self.persistence.save(state)
+
+    def apply_persisted_state(self, state):
+        if not state:
+            return
+        for template_name, entries in state.items():
+            spots = []
+            for entry in entries:
+                if len(entry) != 3:
+                    continue
+                spots.append([int(entry[0]), int(entry[1]), int(entry[2])])
+            spots.sort(key=lambda spot: spot[2], reverse=True)
+            self.spots[template_name] = spots[:self.max_spots]
+
+
+class TemplateStats:
+    def __init__(self, persistence=None):
+        self.enabled = config.TEMPLATE_PRUNING_ENABLED
+        self.prune_window = config.TEMPLATE_PRUNE_WINDOW
+        self.prune_min_scans = config.TEMPLATE_PRUNE_MIN_SCANS
+        self.revalidate_interval = max(1, config.TEMPLATE_REVALIDATE_INTERVAL)
+        self.restore_margin = config.TEMPLATE_RESTORE_MARGIN
+        self.min_active = config.TEMPLATE_MIN_ACTIVE
+        self.persistence = persistence
+        self.scan_count = 0
+        self.templates = {}
+        self.demoted = set()
+        self.full_miss_rate = None
+        self._recent_misses = deque(maxlen=config.TEMPLATE_RESTORE_WINDOW)
+        self._voter_sets = deque(maxlen=config.RED_ICON_CASCADE_HISTORY)
+        self._lock = threading.Lock()
+
+    def is_revalidation_scan(self):
+        return (self.scan_count + 1) % self.revalidate_interval == 0
+
+    def select(self, bank):
+        with self._lock:
+            if not self.enabled or not self.demoted or self.is_revalidation_scan():
+                return bank, True
+            return bank.subset([name for name in bank.names() if name not in self.demoted]), False
+
+    def cascade_order(self, names, min_scans=0):
+        with self._lock:
+            if any(self.templates.get(name, {}).get("full_scans", 0) < min_scans for name in names):
+                return None, 0
+            return cascade_order(names, self.templates, self._voter_sets)
+
+    def record_scan(self, names, hits, voters, found, timings, full_bank, cascade=False):
+        votes = {}
+        for detection_voters in voters:
+            for name in detection_voters:
+                votes[name] = votes.get(name, 0) + 1
+        with self._lock:
+            self.scan_count += 1
+            if not cascade:
+                self._voter_sets.extend(sorted(set(detection_voters)) for detection_voters in voters)
+            for name in names:
+                entry = self._entry(name)
+                entry["scans"] += 1
+                entry["hits"] += hits.get(name, 0)
+                entry["votes"] += votes.get(name, 0)
+                entry["time"] += timings.get(name, 0.0)
+                if not cascade:
+                    entry["full_scans"] += 1
+                    entry["full_hits"] += hits.get(name, 0)
+                    entry["full_votes"] += votes.get(name, 0)
+                    entry["full_time"] += timings.get(name, 0.0)
+                if votes.get(name):
+                    entry["last_vote"] = self.scan_count
+
+            revived = sorted(name for name in self.demoted if votes.get(name))
+            if revived:
+                self.demoted.difference_update(revived)
+                logger.info(f"Template pruning: restored {', '.join(revived)} after a deciding vote")
+
+            miss = 0.0 if found else 1.0
+            if full_bank and not cascade:
+                if self.full_miss_rate is None:
+                    self.full_miss_rate = miss
+                else:
+                    self.full_miss_rate = 0.95 * self.full_miss_rate + 0.05 * miss
+            else:
+                self._recent_misses.append(miss)
+                if (
+                    len(self._recent_misses) == self._recent_misses.maxlen
+                    and sum(self._recent_misses) / len(self._recent_misses)
+                    > (self.full_miss_rate or 0.0) + self.restore_margin
+                ):
+                    logger.info(f"Template pruning: miss rate rose, restoring {len(self.demoted)} templates")
+                    self._restore_all()
+
+            if self.enabled:
+                self._demote_idle(names)
+            state = self._state()
+        if self.persistence:
+            self.persistence.save(state)
+
+    def _entry(self, name):
+        entry = self.templates.get(name)
+        if entry is None:
+            entry = {
+                "scans": 0,
+                "hits": 0,
+                "votes": 0,
+                "time": 0.0,
+                "full_scans": 0,
+                "full_hits": 0,
+                "full_votes": 0,
+                "full_time": 0.0,
+                "last_vote": self.scan_count,
+            }
+            self.templates[name] = entry
+        return entry
+
+    def _restore_all(self):
+        for name in self.demoted:
+            self.templates[name]["last_vote"] = self.scan_count
+        self.demoted.clear()
+        self._recent_misses.clear()
+
+    def _demote_idle(self, names):
+        # A short session cannot tell a rare template from a useless one, so nothing is demoted early on.
+        if self.scan_count < self.prune_min_scans:
+            return
+        active = [name for name in names if name not in self.demoted]
+        idle = sorted(
+            (
+                name for name in active
+                if self.templates[name]["scans"] >= self.prune_window
+                and self.scan_count - self.templates[name]["last_vote"] >= self.prune_window
+            ),
+            key=lambda name: (self.templates[name]["last_vote"], -self.templates[name]["time"]),
+        )
+        for name in idle:
+            if len(active) <= self.min_active:
+                break
+            self.demoted.add(name)
+            active.remove(name)
+            logger.info(
+                f"Template pruning: demoted {name} after {self.templates[name]['scans']} scans "
+                f"(no deciding vote in {self.prune_window} scans, {len(active)} templates still active)"
+            )
+
+    def _state(self):
+        return {
+            "scan_count": self.scan_count,
+            "full_miss_rate": self.full_miss_rate,
+            "demoted": sorted(self.demoted),
+            "voter_sets": list(self._voter_sets),
+            "templates": {name: dict(entry) for name, entry in self.templates.items()},
+        }
+
+    def apply_persisted_state(self, state):
+        if not state:
+            return
+        self.scan_count = int(state.get("scan_count", 0))
+        full_miss_rate = state.get("full_miss_rate")
+        self.full_miss_rate = None if full_miss_rate is None else float(full_miss_rate)
+        for name, entry in state.get("templates", {}).items():
+            self.templates[name] = {
+                "scans": int(entry.get("scans", 0)),
+                "hits": int(entry.get("hits", 0)),
+                "votes": int(entry.get("votes", 0)),
+                "time": float(entry.get("time", 0.0)),
+                "full_scans": int(entry.get("full_scans", 0)),
+                "full_hits": int(entry.get("full_hits", 0)),
+                "full_votes": int(entry.get("full_votes", 0)),
+                "full_time": float(entry.get("full_time", 0.0)),
+                "last_vote": int(entry.get("last_vote", self.scan_count)),
+            }
+        self._voter_sets.extend(list(voters) for voters in state.get("voter_sets", []))
+        if self.enabled and self.scan_count >= self.prune_min_scans:
+            self.demoted = {name for name in state.get("demoted", []) if name in self.templates}
+            if self.demoted:
+                logger.info(f"Template pruning: {len(self.demoted)} templates stay demoted from the last session")
+
+
 class VisionPersistence:
     def __init__(self, path, save_interval):
         self.path = path
@@ -316,16 +549,57 @@ class VisionPersistence:
 
 
 class EatventureBot:
-    def __init__(self):
+    def __init__(self, window_capture=None, mouse_controller=None, frame_source=None):
         logger.info("Initializing Eatventure Bot...")
         
-        self.window_capture = WindowCapture(config.WINDOW_TITLE, config.WINDOW_WIDTH, config.WINDOW_HEIGHT)
-        self.image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
-        self.mouse_controller = MouseController(
+        self.window_capture = window_capture or WindowCapture(
+            config.WINDOW_TITLE,
+            config.WINDOW_WIDTH,
+            config.WINDOW_HEIGHT,
+            slots=config.CAPTURE_RING_SLOTS,
+            bgra=config.CAPTURE_BGRA,
+        )
+        self.frame_source = frame_source or create_frame_source(
+            config.CAPTURE_BACKEND,
+            self.window_capture,
+            slots=config.CAPTURE_RING_SLOTS,
+            path=config.CAPTURE_FILE_PATH,
+            width=config.WINDOW_WIDTH,
+            height=config.WINDOW_HEIGHT,
+        )
+        self.image_matcher = ImageMatcher(config.MATCH_THRESHOLD, workers=config.MATCH_WORKERS)
+        self.mouse_controller = mouse_controller or MouseController(
             self.window_capture.hwnd,
             config.CLICK_DELAY
         )
+        self.session_recorder = None
+        if config.SAVE_SCREENSHOTS:
+            self.session_recorder = SessionRecorder(
+                Path(config.SCREENSHOTS_DIR) / f"session-{datetime.now():%Y%m%d-%H%M%S}.evs",
+                codec=config.SESSION_CODEC,
+                keyframe_interval=config.SESSION_KEYFRAME_INTERVAL,
+                queue_size=config.SESSION_QUEUE_SIZE,
+            )
+            self.frame_source = RecordingFrameSource(
+                self.frame_source,
+                self.session_recorder,
+                region_frame_interval=config.SESSION_REGION_FRAME_INTERVAL,
+            )
+            self.mouse_controller.input_listeners.append(self.session_recorder.record_input)
+        self.frame_publisher = None
+        if config.CAPTURE_THREAD_ENABLED:
+            self.frame_publisher = FramePublisher(
+                self.frame_source,
+                interval=config.CAPTURE_THREAD_INTERVAL,
+                timeout=config.CAPTURE_THREAD_TIMEOUT,
+            )
+            self.mouse_controller.input_listeners.append(lambda *_: self.frame_publisher.request())
         self.state_machine = StateMachine(State.FIND_RED_ICONS)
+        if self.session_recorder is not None:
+            self.session_recorder.record_state(State.FIND_RED_ICONS.name)
+            self.state_machine.transition_listeners.append(
+                lambda previous, current: self.session_recorder.record_state(current.name, previous=previous.name)
+            )
         
         self.register_states()
         self.state_machine.set_priority_resolver(self.resolve_priority_state)
@@ -334,8 +608,10 @@ class EatventureBot:
             "RedIcon7", "RedIcon8", "RedIcon9", "RedIcon10", "RedIcon11", "RedIcon12",
             "RedIcon13", "RedIcon14", "RedIcon15", "RedIconNoBG"
         ]
+        self.box_templates = [f"box{i}" for i in range(1, 6)]
         self.templates = self.load_templates()
         self.available_red_icon_templates = self._build_available_red_icon_templates()
+        self.available_box_templates = self.templates.subset(self.box_templates)
         self.running = False
         self.red_icon_cycle_count = 0
         self.red_icons = []
@@ -369,15 +645,47 @@ class EatventureBot:
         )
         self.vision_optimizer = VisionOptimizer(self.vision_persistence)
         self.vision_optimizer.apply_persisted_state(self.vision_persistence.load())
+        self.location_priors_persistence = VisionPersistence(
+            config.LOCATION_PRIORS_FILE,
+            config.AI_VISION_SAVE_INTERVAL,
+        )
+        self.location_priors = LocationPriors(self.location_priors_persistence)
+        self.location_priors.apply_persisted_state(self.location_priors_persistence.load())
+        # Template statistics are only kept on disk when pruning or the cascade will read them back.
+        self.template_stats_persistence = None
+        if config.TEMPLATE_PRUNING_ENABLED or config.RED_ICON_CASCADE_ENABLED:
+            self.template_stats_persistence = VisionPersistence(
+                config.TEMPLATE_STATS_FILE,
+                config.AI_VISION_SAVE_INTERVAL,
+            )
+        self.template_stats = TemplateStats(self.template_stats_persistence)
+        if self.template_stats_persistence:
+            self.template_stats.apply_persisted_state(self.template_stats_persistence.load())
+        self.incremental_detector = IncrementalDetector(
+            self.image_matcher,
+            tile_size=config.INCREMENTAL_TILE_SIZE,
+            diff_threshold=config.INCREMENTAL_DIFF_THRESHOLD,
+            max_dirty_ratio=config.INCREMENTAL_MAX_DIRTY_RATIO,
+        )
+        self.vision_service = None
+        if config.VISION_SERVICE_ENABLED:
+            self.vision_service = VisionService(
+                self.red_icon_templates,
+                workers=config.VISION_SERVICE_WORKERS,
+                slots=config.VISION_SERVICE_SLOTS,
+                timeout=config.VISION_SERVICE_TIMEOUT,
+            )
+            self.vision_service.start()
         self._capture_cache = {}
         self._capture_cache_ttl = config.CAPTURE_CACHE_TTL
-        self._new_level_cache = {"timestamp": 0.0, "result": (False, 0.0, 0, 0), "max_y": None}
-        self._new_level_red_icon_cache = {"timestamp": 0.0, "result": (False, 0.0, 0, 0), "max_y": None}
+        self.frame_registry = FrameRegistry(config.FRAME_REGISTRY_SIZE)
+        self.detection_cache = DetectionCache(config.DETECTION_CACHE_SIZE)
         self._capture_lock = threading.Lock()
         self._new_level_event = threading.Event()
         self._new_level_interrupt = None
         self._new_level_monitor_stop = threading.Event()
         self._new_level_monitor_thread = None
+        self._new_level_polls = itertools.count(1)
         self._last_upgrade_station_pos = None
         self._last_new_level_override_time = 0.0
 
@@ -397,7 +705,7 @@ class EatventureBot:
         ]
 
         self.overlay = None
-        if config.ShowForbiddenArea:
+        if config.ShowForbiddenArea and self.window_capture.hwnd:
             self.overlay = ForbiddenAreaOverlay(self.window_capture.hwnd, self.forbidden_zones)
             self.overlay.start()
             logger.info("Forbidden area overlay enabled and started")
@@ -429,12 +737,13 @@ class EatventureBot:
                 time.sleep(max(interval, 0.01))
                 continue
 
-            limited_screenshot = self._capture(max_y=config.MAX_SEARCH_Y, force=True)
+            screenshot, origin, prior_crops = self._capture_new_level_poll(config.MAX_SEARCH_Y, force=True)
 
             red_found, red_conf, red_x, red_y = self._detect_new_level_red_icon(
-                screenshot=limited_screenshot,
+                screenshot=screenshot,
                 max_y=config.MAX_SEARCH_Y,
                 force=True,
+                origin=origin,
             )
             if red_found:
                 logger.info(
@@ -446,8 +755,9 @@ class EatventureBot:
                 time.sleep(max(interval, 0.01))
                 continue
 
-            found, confidence, x, y = self._detect_new_level(
-                screenshot=limited_screenshot,
+            found, confidence, x, y = self._detect_new_level_polled(
+                screenshot,
+                prior_crops,
                 max_y=config.MAX_SEARCH_Y,
                 force=True,
             )
@@ -564,19 +874,86 @@ class EatventureBot:
     def _capture(self, max_y=None, force=False):
         cache_key = max_y if max_y is not None else "full"
         cached = self._capture_cache.get(cache_key)
+        if self._capture_thread_running():
+            frame, sequence = self._published_frame(force)
+            if cached and cached[2] == sequence:
+                return cached[1]
+            frame = frame if max_y is None else frame[:max_y]
+            self.frame_registry.register(frame)
+            self._capture_cache[cache_key] = (time.monotonic(), frame, sequence)
+            return frame
+
         now = time.monotonic()
-        if not force and cached and now - cached[0] <= self._capture_cache_ttl:
+        # A TTL of 0 turns the cache off, so every capture reads a new frame (used by sequential replay).
+        if not force and cached and self._capture_cache_ttl > 0 and now - cached[0] <= self._capture_cache_ttl:
             return cached[1]
 
         with self._capture_lock:
-            frame = self.window_capture.capture(max_y=max_y)
-        self._capture_cache[cache_key] = (now, frame)
+            frame = self.frame_source.capture(max_y=max_y)
+        self.frame_registry.register(frame)
+        self._capture_cache[cache_key] = (now, frame, None)
         return frame
 
+    def _capture_regions(self, regions, force=True):
+        if self._capture_thread_running():
+            return crop_regions(self._published_frame(force)[0], regions)
+        with self._capture_lock:
+            return self.frame_source.capture_regions(regions)
+
+    def _capture_thread_running(self):
+        return self.frame_publisher is not None and self.frame_publisher.running
+
+    def _published_frame(self, force=False):
+        # Without force the latest frame is returned at once; forced captures wait for a grab started after the call.
+        published = None if force else self.frame_publisher.latest()
+        if published is None:
+            published = self.frame_publisher.wait_newer(self.frame_publisher.request())
+        if published is None:
+            published = self.frame_publisher.latest()
+        if published is None:
+            raise RuntimeError("Capture thread has not produced a frame")
+        frame, sequence, _ = published
+        return frame, sequence
+
+    def _capture_new_level_poll(self, max_y, force=False):
+        # Between periodic full scans, pollers read only the red icon strip and the learned newLevel spots.
+        rois = []
+        if "newLevel" in self.templates:
+            rois = self.location_priors.search_rois(
+                "newLevel",
+                self.templates["newLevel"],
+                (max_y, config.WINDOW_WIDTH),
+            )
+        interval = config.NEW_LEVEL_FULL_SCAN_INTERVAL
+        if not rois or interval <= 1 or next(self._new_level_polls) % interval == 0:
+            return self._capture(max_y=max_y, force=force), (0, 0), None
+
+        strip = self._new_level_red_icon_region(max_y)
+        crops = self._capture_regions([strip] + rois)
+        return crops[0], strip[:2], list(zip(crops[1:], rois))
+
+    def _new_level_red_icon_region(self, max_y):
+        padding = config.RED_ICON_COLOR_SAMPLE_SIZE
+        y_min = max(0, config.NEW_LEVEL_RED_ICON_Y_MIN - padding)
+        return (
+            max(0, config.NEW_LEVEL_RED_ICON_X_MIN - padding),
+            y_min,
+            config.NEW_LEVEL_RED_ICON_X_MAX + padding,
+            max(y_min, min(max_y, config.NEW_LEVEL_RED_ICON_Y_MAX + padding)),
+        )
+
+    def _stats_upgrade_icon_region(self, max_y):
+        padding = config.STATS_ICON_PADDING + config.RED_ICON_COLOR_SAMPLE_SIZE
+        y_min = max(0, config.UPGRADE_RED_ICON_Y_MIN - padding)
+        return (
+            max(0, config.UPGRADE_RED_ICON_X_MIN - padding),
+            y_min,
+            config.UPGRADE_RED_ICON_X_MAX + padding,
+            max(y_min, min(max_y, config.UPGRADE_RED_ICON_Y_MAX + padding)),
+        )
+
     def _clear_capture_cache(self):
         self._capture_cache.clear()
-        self._new_level_cache = {"timestamp": 0.0, "result": (False, 0.0, 0, 0), "max_y": None}
-        self._new_level_red_icon_cache = {"timestamp": 0.0, "result": (False, 0.0, 0, 0), "max_y": None}
 
     def _sleep_until(self, target_time):
         now = time.monotonic()
@@ -605,113 +982,132 @@ class EatventureBot:
 
     def _detect_new_level(self, screenshot=None, max_y=None, force=False):
         target_max_y = max_y if max_y is not None else config.MAX_SEARCH_Y
-        now = time.monotonic()
-        cached = self._new_level_cache
-        if not force and cached["max_y"] == target_max_y and now - cached["timestamp"] <= self._capture_cache_ttl:
-            return cached["result"]
-
         if screenshot is None:
             screenshot = self._capture(max_y=target_max_y, force=force)
 
         threshold = self.vision_optimizer.new_level_threshold if self.vision_optimizer.enabled else config.NEW_LEVEL_THRESHOLD
+        cache_key = self.detection_cache.key(self.frame_registry.info(screenshot), "newLevel", threshold)
+        cached = self.detection_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         result = self._find_new_level(screenshot, threshold=threshold)
         if result[0]:
             self.vision_optimizer.update_new_level_confidence(result[1])
         else:
             self.vision_optimizer.update_new_level_miss()
-        self._new_level_cache = {"timestamp": now, "result": result, "max_y": target_max_y}
+        self.detection_cache.put(cache_key, result)
         return result
 
-    def _detect_new_level_red_icon(self, screenshot=None, max_y=None, force=False):
-        target_max_y = max_y if max_y is not None else config.MAX_SEARCH_Y
-        now = time.monotonic()
-        cached = self._new_level_red_icon_cache
-        cache_ttl = config.NEW_LEVEL_RED_ICON_CACHE_TTL
-        if not force and cached["max_y"] == target_max_y and now - cached["timestamp"] <= cache_ttl:
-            return cached["result"]
+    def _detect_new_level_polled(self, screenshot, prior_crops, max_y=None, force=False):
+        if prior_crops is not None:
+            result = self._detect_new_level_in_regions(prior_crops)
+            if result[0]:
+                return result
+            # The button is not on a learned spot, so the whole frame is searched now instead of at the next full poll.
+            screenshot = None
+        return self._detect_new_level(screenshot=screenshot, max_y=max_y, force=force)
 
+    def _detect_new_level_in_regions(self, crops):
+        if "newLevel" not in self.templates:
+            return False, 0.0, 0, 0
+
+        threshold = self.vision_optimizer.new_level_threshold if self.vision_optimizer.enabled else config.NEW_LEVEL_THRESHOLD
+        template = self.templates["newLevel"]
+        for crop, region in crops:
+            cache_key = self.detection_cache.key(self.frame_registry.info(crop), "newLevel", threshold, region)
+            result = self.detection_cache.get(cache_key)
+            if result is None:
+                found, confidence, x, y = self.image_matcher.find_template(
+                    crop,
+                    template,
+                    threshold=threshold,
+                    template_name="newLevel-prior",
+                )
+                result = (True, confidence, x + region[0], y + region[1]) if found else (False, 0.0, 0, 0)
+                self.detection_cache.put(cache_key, result)
+                if found:
+                    self.location_priors.record("newLevel", result[2], result[3])
+                    self.vision_optimizer.update_new_level_confidence(confidence)
+            if result[0]:
+                return result
+
+        # A miss is counted by the full-frame search that always follows it.
+        return False, 0.0, 0, 0
+
+    def _detect_new_level_red_icon(self, screenshot=None, max_y=None, force=False, origin=(0, 0)):
+        target_max_y = max_y if max_y is not None else config.MAX_SEARCH_Y
         if screenshot is None:
-            screenshot = self._capture(max_y=target_max_y, force=force)
+            region = self._new_level_red_icon_region(target_max_y)
+            screenshot = self._capture_regions([region])[0]
+            origin = region[:2]
 
         height, width = screenshot.shape[:2]
-        x_min = max(0, config.NEW_LEVEL_RED_ICON_X_MIN)
-        x_max = min(width, config.NEW_LEVEL_RED_ICON_X_MAX)
-        y_min = max(0, config.NEW_LEVEL_RED_ICON_Y_MIN)
-        y_max = min(height, config.NEW_LEVEL_RED_ICON_Y_MAX)
+        origin_x, origin_y = origin
+        x_min = max(origin_x, config.NEW_LEVEL_RED_ICON_X_MIN)
+        x_max = min(origin_x + width, config.NEW_LEVEL_RED_ICON_X_MAX)
+        y_min = max(origin_y, config.NEW_LEVEL_RED_ICON_Y_MIN)
+        y_max = min(origin_y + height, config.NEW_LEVEL_RED_ICON_Y_MAX)
 
         if x_min >= x_max or y_min >= y_max or not self.available_red_icon_templates:
-            result = (False, 0.0, 0, 0)
-            self._new_level_red_icon_cache = {
-                "timestamp": now,
-                "result": result,
-                "max_y": target_max_y,
-            }
-            return result
+            return False, 0.0, 0, 0
 
-        roi = screenshot[y_min:y_max, x_min:x_max]
-        detections = {}
-        buckets = {}
         threshold = (
             self.vision_optimizer.new_level_red_icon_threshold
             if self.vision_optimizer.enabled
             else config.NEW_LEVEL_RED_ICON_THRESHOLD
         )
+        cache_key = self.detection_cache.key(
+            self.frame_registry.info(screenshot),
+            "newLevelRedIcon",
+            threshold,
+            (x_min, y_min, x_max, y_max),
+        )
+        cached = self.detection_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-        for template_name, template, mask in self.available_red_icon_templates:
-            icons = self.image_matcher.find_all_templates(
-                roi,
-                template,
-                mask=mask,
-                threshold=threshold,
-                min_distance=80,
-                template_name=template_name,
-            )
-            for conf, x, y in icons:
-                abs_x = x + x_min
-                abs_y = y + y_min
-                if not self._passes_red_color_gate(screenshot, abs_x, abs_y):
-                    continue
-                self._merge_detection(
-                    detections,
-                    buckets,
-                    abs_x,
-                    abs_y,
-                    template_name,
-                    conf,
-                )
-
-        min_matches = config.NEW_LEVEL_RED_ICON_MIN_MATCHES
-        best_match = None
-        for (x, y), matches in detections.items():
-            if len(matches) >= min_matches:
-                max_conf = max(conf for _, conf in matches)
-                if best_match is None or max_conf > best_match[1]:
-                    best_match = (True, max_conf, x, y)
-
-        result = best_match or (False, 0.0, 0, 0)
+        bank_results = self._match_red_icon_bank(
+            screenshot,
+            threshold,
+            region=(x_min - origin_x, y_min - origin_y, x_max - origin_x, y_max - origin_y),
+        )
+        hits = self._red_icon_hits(screenshot, bank_results)
+        hits["x"] += origin_x
+        hits["y"] += origin_y
+        clusters, _ = self.image_matcher.aggregate_votes(hits)
+        clusters = clusters[clusters["votes"] >= config.NEW_LEVEL_RED_ICON_MIN_MATCHES]
+
+        result = (False, 0.0, 0, 0)
+        if clusters.size:
+            best = clusters[int(np.argmax(clusters["confidence"]))]
+            result = (True, float(best["confidence"]), int(best["x"]), int(best["y"]))
         if result[0]:
             self.vision_optimizer.update_new_level_red_icon_confidence(result[1])
         else:
             self.vision_optimizer.update_new_level_red_icon_miss()
 
-        self._new_level_red_icon_cache = {"timestamp": now, "result": result, "max_y": target_max_y}
+        self.detection_cache.put(cache_key, result)
         return result
 
     def _detect_new_level_priority(self, screenshot=None, max_y=None, force=False):
+        origin = (0, 0)
+        prior_crops = None
+        if screenshot is None:
+            target_max_y = max_y if max_y is not None else config.MAX_SEARCH_Y
+            screenshot, origin, prior_crops = self._capture_new_level_poll(target_max_y, force=force)
+
         red_found, red_conf, red_x, red_y = self._detect_new_level_red_icon(
             screenshot=screenshot,
             max_y=max_y,
             force=force,
+            origin=origin,
         )
         if red_found:
             self._mark_restaurant_completed("new level red icon", red_conf)
             return "new level red icon", red_conf, red_x, red_y
 
-        found, confidence, x, y = self._detect_new_level(
-            screenshot=screenshot,
-            max_y=max_y,
-            force=force,
-        )
+        found, confidence, x, y = self._detect_new_level_polled(screenshot, prior_crops, max_y=max_y, force=force)
         if found:
             self._mark_restaurant_completed("new level button", confidence)
             return "new level button", confidence, x, y
@@ -751,29 +1147,129 @@ class EatventureBot:
         if "newLevel" not in self.templates:
             return False, 0.0, 0, 0
 
-        template, mask = self.templates["newLevel"]
+        return self._find_fixed_template(
+            screenshot,
+            "newLevel",
+            threshold=threshold or config.NEW_LEVEL_THRESHOLD,
+            pyramid_levels=config.PYRAMID_SEARCH_LEVELS,
+        )
+
+    def _find_fixed_template(self, screenshot, template_name, threshold=None, check_color=False, pyramid_levels=0,
+                             record=True):
+        template = self.templates[template_name]
+        best = None
+        for x1, y1, x2, y2 in self.location_priors.search_rois(template_name, template, screenshot.shape):
+            roi = screenshot[y1:y2, x1:x2]
+            if template.height > roi.shape[0] or template.width > roi.shape[1]:
+                continue
+            min_val, min_loc = self.image_matcher.best_match(roi, template)
+            if best is None or min_val < best[0]:
+                best = (min_val, min_loc, roi, x1, y1)
+
+        if best is not None:
+            min_val, min_loc, roi, x1, y1 = best
+            found, confidence, x, y = self.image_matcher.evaluate_match(
+                roi,
+                template,
+                min_val,
+                min_loc,
+                threshold or self.image_matcher.threshold,
+                template_name=f"{template_name}-prior",
+                check_color=check_color,
+            )
+            if found:
+                if record:
+                    self.location_priors.record(template_name, x + x1, y + y1)
+                return True, confidence, x + x1, y + y1
+
+        result = self._search_fixed_template(screenshot, template_name, template, threshold, check_color, pyramid_levels)
+        if result[0] and record:
+            self.location_priors.record(template_name, result[2], result[3])
+        return result
+
+    def _search_fixed_template(self, screenshot, template_name, template, threshold, check_color, pyramid_levels):
+        if self.vision_service is not None and self.vision_service.running:
+            try:
+                return self.vision_service.find_template(
+                    screenshot,
+                    template_name,
+                    threshold=threshold,
+                    check_color=check_color,
+                    pyramid_levels=pyramid_levels,
+                )
+            except (RuntimeError, TimeoutError, ValueError) as e:
+                logger.warning(f"Vision service unavailable, matching in-process: {e}")
+
+        if config.INCREMENTAL_DETECTION_ENABLED:
+            return self.incremental_detector.find_template(
+                template_name,
+                screenshot,
+                template,
+                threshold=threshold,
+                template_name=template_name,
+                check_color=check_color,
+                pyramid_levels=pyramid_levels,
+            )
+
         return self.image_matcher.find_template(
             screenshot,
             template,
-            mask=mask,
-            threshold=threshold or config.NEW_LEVEL_THRESHOLD,
-            template_name="newLevel",
+            threshold=threshold,
+            template_name=template_name,
+            check_color=check_color,
+            pyramid_levels=pyramid_levels,
         )
 
-    def _has_stats_upgrade_icon(self, screenshot):
-        if not self.red_icon_templates:
+    def _detect_boxes(self, screenshot):
+        if not self.available_box_templates:
+            return [], []
+
+        # Boxes can appear anywhere and several at once, so they are found by a whole-frame pass rather
+        # than around location priors; unchanged tiles reuse the previous frame's peaks.
+        if config.INCREMENTAL_DETECTION_ENABLED:
+            instances = self.incremental_detector.find_all_instances(
+                "boxes",
+                screenshot,
+                self.available_box_templates,
+                threshold=config.BOX_THRESHOLD,
+                min_distance=config.BOX_NMS_DISTANCE,
+            )
+        else:
+            instances = self.image_matcher.find_all_instances(
+                screenshot,
+                self.available_box_templates,
+                threshold=config.BOX_THRESHOLD,
+                min_distance=config.BOX_NMS_DISTANCE,
+            )
+
+        boxes = []
+        blocked_boxes = []
+        for box_name, confidence, x, y in instances:
+            if self.mouse_controller.is_in_forbidden_zone(x, y):
+                blocked_boxes.append((box_name, confidence, x, y))
+            else:
+                boxes.append((box_name, confidence, x, y))
+        return boxes, blocked_boxes
+
+    def _has_stats_upgrade_icon(self, screenshot=None, origin=(0, 0)):
+        if not self.available_red_icon_templates:
             return False, 0.0
 
+        if screenshot is None:
+            region = self._stats_upgrade_icon_region(config.EXTENDED_SEARCH_Y)
+            screenshot = self._capture_regions([region])[0]
+            origin = region[:2]
+
         height, width = screenshot.shape[:2]
-        x_min = max(0, config.UPGRADE_RED_ICON_X_MIN - config.STATS_ICON_PADDING)
-        x_max = min(width, config.UPGRADE_RED_ICON_X_MAX + config.STATS_ICON_PADDING)
-        y_min = max(0, config.UPGRADE_RED_ICON_Y_MIN - config.STATS_ICON_PADDING)
-        y_max = min(height, config.UPGRADE_RED_ICON_Y_MAX + config.STATS_ICON_PADDING)
+        origin_x, origin_y = origin
+        x_min = max(0, config.UPGRADE_RED_ICON_X_MIN - config.STATS_ICON_PADDING - origin_x)
+        x_max = min(width, config.UPGRADE_RED_ICON_X_MAX + config.STATS_ICON_PADDING - origin_x)
+        y_min = max(0, config.UPGRADE_RED_ICON_Y_MIN - config.STATS_ICON_PADDING - origin_y)
+        y_max = min(height, config.UPGRADE_RED_ICON_Y_MAX + config.STATS_ICON_PADDING - origin_y)
 
         if x_min >= x_max or y_min >= y_max:
             return False, 0.0
 
-        roi = screenshot[y_min:y_max, x_min:x_max]
         threshold = (
             self.vision_optimizer.stats_upgrade_threshold
             if self.vision_optimizer.enabled
@@ -781,42 +1277,49 @@ class EatventureBot:
         )
         best_confidence = 0.0
 
-        for template_name in self.red_icon_templates:
-            if template_name not in self.templates:
-                continue
+        bank_results = self._match_red_icon_bank(
+            screenshot,
+            threshold,
+            region=(x_min, y_min, x_max, y_max),
+        )
+        hits = self._red_icon_hits(screenshot, bank_results)
+        if hits.size:
+            best_confidence = float(hits["confidence"].max())
 
-            template, mask = self.templates[template_name]
-            icons = self.image_matcher.find_all_templates(
-                roi,
-                template,
-                mask=mask,
+        return best_confidence > 0, best_confidence
+
+    def _match_red_icon_bank(self, screenshot, threshold, region=None, templates=None):
+        bank = self.available_red_icon_templates if templates is None else templates
+        if self.vision_service is not None and self.vision_service.running:
+            try:
+                results, timings = self.vision_service.match_red_icon_bank(
+                    screenshot, threshold, region=region, names=bank.names(),
+                )
+                self.image_matcher.add_template_timings(timings)
+                return results
+            except (RuntimeError, TimeoutError, ValueError) as e:
+                logger.warning(f"Vision service unavailable, matching in-process: {e}")
+
+        gating = config.RED_ICON_CANDIDATE_GATING and config.RED_ICON_COLOR_CHECK
+        if region is None and not gating and config.INCREMENTAL_DETECTION_ENABLED:
+            # Full and pruned banks keep separate state so revalidation scans do not invalidate each other.
+            return self.incremental_detector.find_all_templates_multi(
+                f"red_icons:{len(bank)}",
+                screenshot,
+                bank,
                 threshold=threshold,
                 min_distance=80,
-                template_name=template_name,
+                use_fft=config.RED_ICON_BANK_USE_FFT,
+                base_threshold=config.AI_RED_ICON_THRESHOLD_MIN,
             )
 
-            if icons:
-                for conf, x, y in icons:
-                    abs_x = x + x_min
-                    abs_y = y + y_min
-                    if not self._passes_red_color_gate(screenshot, abs_x, abs_y):
-                        continue
-                    best_confidence = max(best_confidence, conf)
-
-        return best_confidence > 0, best_confidence
-
-    def _merge_detection(self, detections, buckets, x, y, template_name, conf, proximity=10, bucket_size=10):
-        bucket_x = x // bucket_size
-        bucket_y = y // bucket_size
-        for dx in (-1, 0, 1):
-            for dy in (-1, 0, 1):
-                for px, py in buckets.get((bucket_x + dx, bucket_y + dy), []):
-                    if abs(x - px) < proximity and abs(y - py) < proximity:
-                        detections[(px, py)].append((template_name, conf))
-                        return
-
-        detections[(x, y)] = [(template_name, conf)]
-        buckets.setdefault((bucket_x, bucket_y), []).append((x, y))
+        return match_red_icon_bank(
+            self.image_matcher,
+            screenshot,
+            bank,
+            threshold,
+            region=region,
+        )
 
     def _refine_template_position(
         self,
@@ -833,7 +1336,7 @@ class EatventureBot:
         if screenshot is None:
             screenshot = self._capture(max_y=config.MAX_SEARCH_Y, force=True)
 
-        template, mask = self.templates[template_name]
+        template = self.templates[template_name]
         x, y = expected_pos
 
         x1 = max(0, x - search_radius)
@@ -848,7 +1351,6 @@ class EatventureBot:
         found, confidence, rx, ry = self.image_matcher.find_template(
             roi,
             template,
-            mask=mask,
             threshold=threshold,
             template_name=f"{template_name}-refine",
             check_color=check_color,
@@ -871,8 +1373,7 @@ class EatventureBot:
         x2 = min(screenshot.shape[1], x + search_radius)
         y2 = min(screenshot.shape[0], y + search_radius)
 
-        roi = screenshot[y1:y2, x1:x2]
-        if roi.size == 0:
+        if x1 >= x2 or y1 >= y2:
             return (x, y), False, 0.0
 
         base_threshold = (
@@ -883,18 +1384,10 @@ class EatventureBot:
         threshold = max(0.0, base_threshold - config.RED_ICON_REFINE_THRESHOLD_DROP)
         best_match = None
 
-        for template_name, template, mask in self.available_red_icon_templates:
-            found, confidence, rx, ry = self.image_matcher.find_template(
-                roi,
-                template,
-                mask=mask,
-                threshold=threshold,
-                template_name=f"{template_name}-refine",
-            )
+        score_maps = self.image_matcher.score_maps(screenshot, self.available_red_icon_templates, (x1, y1, x2, y2))
+        for _, (found, confidence, abs_x, abs_y) in score_maps.find_many((x1, y1, x2, y2), threshold):
             if not found:
                 continue
-            abs_x = rx + x1
-            abs_y = ry + y1
             if not self._passes_red_color_gate(screenshot, abs_x, abs_y):
                 continue
             if best_match is None or confidence > best_match[2]:
@@ -919,44 +1412,64 @@ class EatventureBot:
         if not self.available_red_icon_templates:
             return []
 
-        detections = {}
-        buckets = {}
-        if max_y is not None:
-            screenshot = screenshot[:max_y, :]
         threshold = (
             self.vision_optimizer.red_icon_threshold
             if self.vision_optimizer.enabled
             else config.RED_ICON_THRESHOLD
         )
+        cache_key = self.detection_cache.key(self.frame_registry.info(screenshot), "redIcons", threshold, max_y)
+        cached = self.detection_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
+        if max_y is not None:
+            screenshot = screenshot[:max_y, :]
 
-        for template_name, template, mask in self.available_red_icon_templates:
-            icons = self.image_matcher.find_all_templates(
+        bank, full_bank = self.template_stats.select(self.available_red_icon_templates)
+        order, cover_size = None, 0
+        if config.RED_ICON_CASCADE_ENABLED and not self.template_stats.is_revalidation_scan():
+            order, cover_size = self.template_stats.cascade_order(bank.names(), config.RED_ICON_CASCADE_WARMUP_SCANS)
+        cascade = order is not None
+        self.image_matcher.start_template_timings()
+        names = self.available_red_icon_templates.names()
+        if cascade:
+            hits, evaluated = cascade_red_icon_bank(
+                self.image_matcher,
                 screenshot,
-                template,
-                mask=mask,
-                threshold=threshold,
-                min_distance=80,
-                template_name=template_name,
+                bank,
+                order,
+                threshold,
+                config.RED_ICON_MIN_MATCHES,
+                max(config.RED_ICON_MIN_MATCHES, config.RED_ICON_CASCADE_STAGE_SIZE, cover_size),
+                names=names,
+                first_stage=lambda stage_bank: self._match_red_icon_bank(screenshot, threshold, templates=stage_bank),
+                gate=self._gate_red_icon_hits,
+                padding=config.RED_ICON_CASCADE_PADDING,
             )
+        else:
+            evaluated = bank.names()
+            hits = self._red_icon_hits(screenshot, self._match_red_icon_bank(screenshot, threshold, templates=bank))
+        timings = self.image_matcher.pop_template_timings()
+
+        clusters, labels = self.image_matcher.aggregate_votes(hits)
+        decided = np.flatnonzero(clusters["votes"] >= config.RED_ICON_MIN_MATCHES)
+        red_icons = [
+            (float(conf), int(x), int(y))
+            for conf, x, y in zip(
+                clusters["confidence"][decided].tolist(),
+                clusters["x"][decided].tolist(),
+                clusters["y"][decided].tolist(),
+            )
+        ]
 
-            for conf, x, y in icons:
-                if not self._passes_red_color_gate(screenshot, x, y):
-                    continue
-                self._merge_detection(
-                    detections,
-                    buckets,
-                    x,
-                    y,
-                    template_name,
-                    conf,
-                )
-
-        min_matches = config.RED_ICON_MIN_MATCHES
-        red_icons = []
-        for (x, y), matches in detections.items():
-            if len(matches) >= min_matches:
-                max_conf = max(conf for _, conf in matches)
-                red_icons.append((max_conf, x, y))
+        hit_counts = np.bincount(hits["template"], minlength=len(names))
+        hit_counts = {names[index]: int(hit_counts[index]) for index in np.flatnonzero(hit_counts)}
+        voters = [
+            [names[index] for index in np.unique(hits["template"][labels == label])]
+            for label in decided
+        ]
+        self.template_stats.record_scan(evaluated, hit_counts, voters, bool(red_icons), timings, full_bank, cascade)
+        self.detection_cache.put(cache_key, tuple(red_icons))
         return red_icons
 
     def _is_red_icon_present_at(self, x, y, screenshot=None):
@@ -988,23 +1501,18 @@ class EatventureBot:
         x2 = min(target_screenshot.shape[1], x + padding)
         y2 = min(target_screenshot.shape[0], y + padding)
 
-        roi = target_screenshot[y1:y2, x1:x2]
-        if roi.size == 0:
+        if x1 >= x2 or y1 >= y2:
             return False
 
-        for template_name, template, mask in self.available_red_icon_templates:
-            found, confidence, cx, cy = self.image_matcher.find_template(
-                roi,
-                template,
-                mask=mask,
-                threshold=threshold,
-                template_name=f"{template_name}-verify",
-            )
+        score_maps = self.image_matcher.score_maps(
+            target_screenshot,
+            self.available_red_icon_templates,
+            (x1, y1, x2, y2),
+        )
+        for _, (found, confidence, abs_x, abs_y) in score_maps.find_many((x1, y1, x2, y2), threshold):
             if not found:
                 continue
 
-            abs_x = cx + x1
-            abs_y = cy + y1
             if (
                 abs(abs_x - x) <= config.RED_ICON_VERIFY_TOLERANCE
                 and abs(abs_y - y) <= config.RED_ICON_VERIFY_TOLERANCE
@@ -1025,6 +1533,23 @@ class EatventureBot:
             min_mean=config.RED_ICON_COLOR_MIN_MEAN,
         )
 
+    def _red_icon_hits(self, screenshot, bank_results):
+        hits = self.image_matcher.collect_hits(bank_results, self.available_red_icon_templates.names())
+        return self._gate_red_icon_hits(screenshot, hits)
+
+    def _gate_red_icon_hits(self, screenshot, hits):
+        if hits.size == 0 or not config.RED_ICON_COLOR_CHECK:
+            return hits
+
+        passed = self.image_matcher.red_dominant_mask(
+            screenshot,
+            np.stack([hits["x"], hits["y"]], axis=1),
+            size=config.RED_ICON_COLOR_SAMPLE_SIZE,
+            min_ratio=config.RED_ICON_COLOR_MIN_RATIO,
+            min_mean=config.RED_ICON_COLOR_MIN_MEAN,
+        )
+        return hits[passed]
+
     def _filter_forbidden_red_icons(self, red_icons):
         filtered_icons = []
         forbidden_zone_count = 0
@@ -1109,22 +1634,19 @@ class EatventureBot:
     
     def load_templates(self):
         required_templates = self._required_template_names()
-        scanner = AssetScanner(self.image_matcher)
+        scanner = AssetScanner(
+            self.image_matcher,
+            cache_dir=config.TEMPLATE_CACHE_DIR if config.TEMPLATE_CACHE_ENABLED else None,
+        )
         return scanner.scan(config.ASSETS_DIR, required_templates=required_templates)
 
     def _build_available_red_icon_templates(self):
-        available = []
-        for template_name in self.red_icon_templates:
-            if template_name in self.templates:
-                template, mask = self.templates[template_name]
-                available.append((template_name, template, mask))
-        return available
+        return self.templates.subset(self.red_icon_templates)
 
     def _required_template_names(self):
-        box_names = [f"box{i}" for i in range(1, 6)]
         required = set(self.red_icon_templates)
         required.update(["newLevel", "unlock", "upgradeStation"])
-        required.update(box_names)
+        required.update(self.box_templates)
         return required
     
     def register_states(self):
@@ -1252,10 +1774,10 @@ class EatventureBot:
         limited_screenshot = self._capture(max_y=config.MAX_SEARCH_Y)
         
         if "unlock" in self.templates:
-            template, mask = self.templates["unlock"]
-            found, confidence, x, y = self.image_matcher.find_template(
-                limited_screenshot, template, mask=mask,
-                threshold=config.UNLOCK_THRESHOLD, template_name="unlock"
+            found, confidence, x, y = self._find_fixed_template(
+                limited_screenshot, "unlock",
+                threshold=config.UNLOCK_THRESHOLD,
+                pyramid_levels=config.PYRAMID_SEARCH_LEVELS,
             )
             
             if found:
@@ -1281,13 +1803,12 @@ class EatventureBot:
             limited_screenshot = self._capture(max_y=config.MAX_SEARCH_Y)
             
             if "upgradeStation" in self.templates:
-                template, mask = self.templates["upgradeStation"]
-                
                 current_threshold = base_threshold if attempt < 2 else relaxed_threshold
                 
-                found, confidence, x, y = self.image_matcher.find_template(
-                    limited_screenshot, template, mask=mask,
-                    threshold=current_threshold, template_name="upgradeStation"
+                found, confidence, x, y = self._find_fixed_template(
+                    limited_screenshot, "upgradeStation",
+                    threshold=current_threshold,
+                    pyramid_levels=config.PYRAMID_SEARCH_LEVELS,
                 )
                 
                 if found:
@@ -1401,11 +1922,12 @@ class EatventureBot:
                     limited_screenshot = self._capture(max_y=config.MAX_SEARCH_Y, force=True)
 
                     if "upgradeStation" in self.templates:
-                        template, mask = self.templates["upgradeStation"]
-                        found, confidence, found_x, found_y = self.image_matcher.find_template(
-                            limited_screenshot, template, mask=mask,
-                            threshold=hold_threshold, template_name="upgradeStation",
-                            check_color=config.UPGRADE_STATION_COLOR_CHECK
+                        found, confidence, found_x, found_y = self._find_fixed_template(
+                            limited_screenshot, "upgradeStation",
+                            threshold=hold_threshold,
+                            check_color=config.UPGRADE_STATION_COLOR_CHECK,
+                            pyramid_levels=config.PYRAMID_SEARCH_LEVELS,
+                            record=False,
                         )
 
                         if not found and not upgrade_missing_logged:
@@ -1447,8 +1969,7 @@ class EatventureBot:
         logger.info("⬆ Stats upgrade starting")
         self.mouse_controller.click(config.IDLE_CLICK_POS[0], config.IDLE_CLICK_POS[1], relative=True)
         
-        extended_screenshot = self._capture(max_y=config.EXTENDED_SEARCH_Y)
-        limited_screenshot = extended_screenshot[:config.MAX_SEARCH_Y, :]
+        limited_screenshot = self._capture(max_y=config.MAX_SEARCH_Y)
 
         found, confidence, x, y = self._detect_new_level(
             screenshot=limited_screenshot,
@@ -1458,7 +1979,7 @@ class EatventureBot:
             logger.info("New level detected during stats upgrade")
             return State.TRANSITION_LEVEL
         
-        has_stats_icon, stats_confidence = self._has_stats_upgrade_icon(extended_screenshot)
+        has_stats_icon, stats_confidence = self._has_stats_upgrade_icon()
         if not has_stats_icon:
             logger.info("✗ No stats icon, skipping")
             self.vision_optimizer.update_stats_upgrade_miss()
@@ -1514,23 +2035,13 @@ class EatventureBot:
             logger.info("New level found, transitioning")
             return State.TRANSITION_LEVEL
         
-        box_names = ["box1", "box2", "box3", "box4", "box5"]
-        boxes_found = 0
-        
-        for box_name in box_names:
-            if box_name in self.templates:
-                template, mask = self.templates[box_name]
-                found, confidence, x, y = self.image_matcher.find_template(
-                    limited_screenshot, template, mask=mask,
-                    threshold=config.BOX_THRESHOLD, template_name=box_name
-                )
-                
-                if found:
-                    if self.mouse_controller.is_in_forbidden_zone(x, y):
-                        logger.debug(f"{box_name} in forbidden zone, skipping")
-                    else:
-                        self.mouse_controller.click(x, y, relative=True)
-                        boxes_found += 1
+        boxes, blocked_boxes = self._detect_boxes(limited_screenshot)
+        for box_name, confidence, x, y in blocked_boxes:
+            logger.debug(f"{box_name} in forbidden zone at ({x}, {y}), skipping")
+
+        for box_name, confidence, x, y in boxes:
+            self.mouse_controller.click(x, y, relative=True)
+        boxes_found = len(boxes)
         
         if self._should_interrupt_for_new_level(
             max_y=config.MAX_SEARCH_Y,
@@ -1714,10 +2225,10 @@ class EatventureBot:
         screenshot = self._capture(max_y=config.MAX_SEARCH_Y)
 
         if "unlock" in self.templates:
-            template, mask = self.templates["unlock"]
-            found, confidence, x, y = self.image_matcher.find_template(
-                screenshot, template, mask=mask,
-                threshold=config.UNLOCK_THRESHOLD, template_name="unlock"
+            found, confidence, x, y = self._find_fixed_template(
+                screenshot, "unlock",
+                threshold=config.UNLOCK_THRESHOLD,
+                pyramid_levels=config.PYRAMID_SEARCH_LEVELS,
             )
 
             if found:
@@ -1744,6 +2255,9 @@ class EatventureBot:
             self.current_level_start_time = datetime.now()
             logger.info("Starting level timer at bot start")
 
+        if self.frame_publisher is not None:
+            self.frame_publisher.start()
+
         if self._new_level_monitor_thread is None or not self._new_level_monitor_thread.is_alive():
             self._new_level_monitor_stop.clear()
             self._new_level_monitor_thread = threading.Thread(
@@ -1763,6 +2277,8 @@ class EatventureBot:
                 
         except KeyboardInterrupt:
             logger.info("Bot stopped by user (Ctrl+C)")
+        except EOFError as e:
+            logger.info(f"Frame source finished: {e}")
         except Exception as e:
             logger.error(f"Bot error: {e}", exc_info=True)
         finally:
@@ -1778,6 +2294,14 @@ class EatventureBot:
         self._new_level_monitor_stop.set()
         if self._new_level_monitor_thread and self._new_level_monitor_thread.is_alive():
             self._new_level_monitor_thread.join(timeout=1.0)
+        if self.frame_publisher is not None:
+            self.frame_publisher.stop()
         if self.overlay:
             self.overlay.stop()
+        self.image_matcher.shutdown()
+        if self.vision_service is not None:
+            self.vision_service.stop()
+        self.frame_source.close()
+        if self.session_recorder is not None:
+            self.session_recorder.close()
         logger.info("Bot stopped")
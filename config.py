@@ -15,10 +15,20 @@ RED_ICON_COLOR_CHECK = True
 RED_ICON_COLOR_MIN_RATIO = 1.15
 RED_ICON_COLOR_MIN_MEAN = 35
 RED_ICON_COLOR_SAMPLE_SIZE = 12
+RED_ICON_CANDIDATE_GATING = True
+RED_ICON_CANDIDATE_MIN_AREA = 4
+RED_ICON_CANDIDATE_MAX_SIZE = 64
 RED_ICON_VERIFY_PADDING = 24
 RED_ICON_VERIFY_TOLERANCE = 12
 RED_ICON_REFINE_RADIUS = 18
 RED_ICON_REFINE_THRESHOLD_DROP = 0.02
+RED_ICON_BANK_USE_FFT = True
+RED_ICON_CASCADE_ENABLED = False
+RED_ICON_CASCADE_STAGE_SIZE = 2
+RED_ICON_CASCADE_PADDING = 8
+RED_ICON_CASCADE_WARMUP_SCANS = 10
+RED_ICON_CASCADE_HISTORY = 256
+MATCH_WORKERS = 0
 STATS_RED_ICON_THRESHOLD = 0.97
 SEARCH_INTERVAL = 0.35
 CLICK_DELAY = 0.05
@@ -40,12 +50,18 @@ MOUSE_TARGET_CORRECTION_DELAY = 0.001
 # Directory Paths
 TEMPLATES_DIR = "templates"
 ASSETS_DIR = "Assets"
+TEMPLATE_CACHE_ENABLED = True
+TEMPLATE_CACHE_DIR = "template_cache"
 LOGS_DIR = "logs"
 SCREENSHOTS_DIR = "screenshots"
 
 # Debug and Visualization Settings
 DEBUG = True
-SAVE_SCREENSHOTS = True
+SAVE_SCREENSHOTS = False
+SESSION_CODEC = "delta"
+SESSION_KEYFRAME_INTERVAL = 50
+SESSION_QUEUE_SIZE = 64
+SESSION_REGION_FRAME_INTERVAL = 10
 
 # ShowForbiddenArea: Enables a visual overlay showing forbidden zones in red
 # When True, displays red rectangles over areas where the bot won't click
@@ -87,8 +103,10 @@ NEW_LEVEL_BUTTON_POS = (30, 692)
 UPGRADE_STATION_THRESHOLD = 0.94
 UPGRADE_STATION_COLOR_CHECK = False
 BOX_THRESHOLD = 0.97
+BOX_NMS_DISTANCE = 20
 UNLOCK_THRESHOLD = 0.9
 NEW_LEVEL_THRESHOLD = 0.98
+PYRAMID_SEARCH_LEVELS = 0
 
 # Bot Behavior Configuration
 RED_ICON_CYCLE_COUNT = 3
@@ -96,12 +114,21 @@ STATS_UPGRADE_CLICK_DURATION = 2
 STATS_UPGRADE_CLICK_DELAY = 0.005
 STATS_ICON_PADDING = 20
 CAPTURE_CACHE_TTL = 0.03
-NEW_LEVEL_RED_ICON_CACHE_TTL = 0.03
+CAPTURE_BACKEND = "win32"
+CAPTURE_RING_SLOTS = 16
+CAPTURE_BGRA = False
+CAPTURE_FILE_PATH = SCREENSHOTS_DIR
+CAPTURE_THREAD_ENABLED = True
+CAPTURE_THREAD_INTERVAL = 0.02
+CAPTURE_THREAD_TIMEOUT = 1.0
+FRAME_REGISTRY_SIZE = 16
+DETECTION_CACHE_SIZE = 64
 UPGRADE_HOLD_DURATION = 3.0
 UPGRADE_CLICK_INTERVAL = 0.008
 SCROLL_UP_CYCLES = 2
 NEW_LEVEL_INTERRUPT_INTERVAL = 0.05
 NEW_LEVEL_MONITOR_INTERVAL = 0.02
+NEW_LEVEL_FULL_SCAN_INTERVAL = 10
 NEW_LEVEL_OVERRIDE_COOLDOWN = 0.25
 NO_ICON_SCROLL_UP_COUNT = 3
 NO_ICON_SCROLL_DOWN_COUNT = 3
@@ -181,6 +208,30 @@ AI_STATS_UPGRADE_MISS_WINDOW = 2
 AI_STATS_UPGRADE_MISS_STEP = 0.005
 AI_VISION_STATE_FILE = f"{LOGS_DIR}/vision_state.json"
 AI_VISION_SAVE_INTERVAL = 1.0
+LOCATION_PRIORS_ENABLED = True
+LOCATION_PRIORS_PADDING = 12
+LOCATION_PRIORS_MAX_SPOTS = 4
+LOCATION_PRIORS_MERGE_RADIUS = 10
+LOCATION_PRIORS_FILE = f"{LOGS_DIR}/location_priors.json"
+
+TEMPLATE_PRUNING_ENABLED = False
+TEMPLATE_PRUNE_WINDOW = 200
+TEMPLATE_PRUNE_MIN_SCANS = 1000
+TEMPLATE_REVALIDATE_INTERVAL = 25
+TEMPLATE_RESTORE_WINDOW = 20
+TEMPLATE_RESTORE_MARGIN = 0.2
+TEMPLATE_MIN_ACTIVE = 4
+TEMPLATE_STATS_FILE = f"{LOGS_DIR}/template_stats.json"
+
+INCREMENTAL_DETECTION_ENABLED = True
+INCREMENTAL_TILE_SIZE = 32
+INCREMENTAL_DIFF_THRESHOLD = 0
+INCREMENTAL_MAX_DIRTY_RATIO = 0.5
+
+VISION_SERVICE_ENABLED = False
+VISION_SERVICE_WORKERS = 2
+VISION_SERVICE_SLOTS = 4
+VISION_SERVICE_TIMEOUT = 2.0
 
 # Forbidden Zones Configuration
 # These zones prevent the bot from clicking on critical UI elements
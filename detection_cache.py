@@ -0,0 +1,74 @@
+import itertools
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+class FrameInfo:
+    def __init__(self, sequence, digest, timestamp):
+        self.sequence = sequence
+        self.digest = digest
+        self.timestamp = timestamp
+
+
+class FrameRegistry:
+    def __init__(self, max_frames=16):
+        self.max_frames = max_frames
+        self._frames = OrderedDict()
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def register(self, frame):
+        info = FrameInfo(next(self._sequence), self.digest(frame), time.monotonic())
+        with self._lock:
+            self._frames[id(frame)] = (weakref.ref(frame), info)
+            self._frames.move_to_end(id(frame))
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+        return info
+
+    def info(self, frame):
+        with self._lock:
+            entry = self._frames.get(id(frame))
+            if entry is not None and entry[0]() is frame:
+                return entry[1]
+        return self.register(frame)
+
+    def digest(self, frame):
+        return frame.shape, zlib.crc32(np.ascontiguousarray(frame))
+
+
+class DetectionCache:
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, frame_info, detector, threshold=None, roi=None):
+        return frame_info.digest, detector, threshold, roi
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
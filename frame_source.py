@@ -0,0 +1,365 @@
+import logging
+import threading
+import time
+import weakref
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureLease:
+    # Every view derived from a handed-out frame keeps its lease alive, so a dead lease means the slot is free.
+    __slots__ = ("__array_interface__", "buffer", "__weakref__")
+
+    def __init__(self, buffer, address, size):
+        self.buffer = buffer
+        self.__array_interface__ = {"shape": (size,), "typestr": "|u1", "data": (address, False), "version": 3}
+
+
+class CaptureRing:
+    ALIGNMENT = 64
+
+    def __init__(self, slots=16, allocate=None, release=None):
+        self.slots = max(1, slots)
+        self._allocate_buffer = allocate
+        self._release_buffer = release
+        self._buffers = []
+        self._leases = []
+        self._retired = []
+        self._next = 0
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+        self.overflows = 0
+
+    def acquire(self, shape):
+        shape = tuple(int(size) for size in shape)
+        size = int(np.prod(shape))
+        with self._lock:
+            slot = self._free_slot()
+            if self._retired:
+                self._release_retired()
+            if slot is None and len(self._buffers) < self.slots:
+                self._buffers.append(self._allocate(size))
+                self._leases.append(None)
+                slot = len(self._buffers) - 1
+            elif slot is None:
+                self.overflows += 1
+                if self.overflows == 1 or self.overflows % 100 == 0:
+                    logger.debug(f"All {self.slots} capture buffers are still referenced ({self.overflows} overflows)")
+                # Overflow frames are never recycled, so they always come from numpy rather than the allocator.
+                self.allocations += 1
+                return self._view(np.empty(size + self.ALIGNMENT, dtype=np.uint8), shape, size)[0]
+            elif memoryview(self._buffers[slot]).nbytes - self.ALIGNMENT < size:
+                self._retired.append((self._buffers[slot], self._leases[slot]))
+                self._buffers[slot] = self._allocate(size)
+                self._release_retired()
+            else:
+                self.reuses += 1
+            self._next = (slot + 1) % self.slots
+            # A fresh view per frame keeps id()/weakref keyed caches from confusing two captures.
+            frame, self._leases[slot] = self._view(self._buffers[slot], shape, size)
+            return frame
+
+    def in_use(self):
+        with self._lock:
+            return sum(self._leased(lease) for lease in self._leases)
+
+    def reset(self):
+        # Buffers that callers still hold are released once their last view goes away.
+        with self._lock:
+            self._retired.extend(zip(self._buffers, self._leases))
+            self._buffers = []
+            self._leases = []
+            self._next = 0
+            self._release_retired()
+            if self._retired:
+                logger.debug(f"{len(self._retired)} capture buffers are still referenced after reset")
+
+    def _free_slot(self):
+        count = len(self._buffers)
+        for step in range(count):
+            slot = (self._next + step) % count
+            if not self._leased(self._leases[slot]):
+                return slot
+        return None
+
+    def _release_retired(self):
+        if self._release_buffer is None:
+            self._retired = []
+            return
+        for index in reversed(range(len(self._retired))):
+            if not self._leased(self._retired[index][1]):
+                self._release_buffer(self._retired.pop(index)[0])
+
+    def _leased(self, lease):
+        return lease is not None and lease() is not None
+
+    def _allocate(self, size):
+        self.allocations += 1
+        if self._allocate_buffer is not None:
+            return self._allocate_buffer(size + self.ALIGNMENT)
+        return np.empty(size + self.ALIGNMENT, dtype=np.uint8)
+
+    def _view(self, buffer, shape, size):
+        address = np.frombuffer(buffer, dtype=np.uint8).ctypes.data
+        lease = CaptureLease(buffer, address + -address % self.ALIGNMENT, size)
+        return np.asarray(lease).reshape(shape), weakref.ref(lease)
+
+
+class FrameSource:
+    def __init__(self, slots=16):
+        self.ring = CaptureRing(slots)
+        self.frames = 0
+        self.capture_time = 0.0
+        self.last_latency = 0.0
+
+    def capture(self, max_y=None):
+        start = time.perf_counter()
+        frame = self.grab(max_y)
+        self.last_latency = time.perf_counter() - start
+        self.capture_time += self.last_latency
+        self.frames += 1
+        return frame
+
+    def capture_regions(self, regions):
+        start = time.perf_counter()
+        crops = self.grab_regions([tuple(int(value) for value in region) for region in regions])
+        self.last_latency = time.perf_counter() - start
+        self.capture_time += self.last_latency
+        self.frames += 1
+        return crops
+
+    def grab(self, max_y):
+        raise NotImplementedError
+
+    def grab_regions(self, regions):
+        # Backends that cannot read sub-rectangles grab the frame and crop it.
+        if not regions:
+            return []
+        frame = self.grab(max(y2 for _, _, _, y2 in regions))
+        return self.pack_regions(frame, regions)
+
+    def pack_regions(self, source, regions):
+        clipped = clip_regions(regions, source.shape)
+
+        # All crops share one ring buffer, so a poll costs a single slot however many boxes it reads.
+        sizes = [(y2 - y1) * (x2 - x1) * 3 for x1, y1, x2, y2 in clipped]
+        buffer = self.ring.acquire((sum(sizes),))
+        crops = []
+        offset = 0
+        for (x1, y1, x2, y2), size in zip(clipped, sizes):
+            crop = buffer[offset:offset + size].reshape(y2 - y1, x2 - x1, 3)
+            offset += size
+            if size:
+                if source.shape[2] == 4:
+                    cv2.cvtColor(source[y1:y2, x1:x2], cv2.COLOR_BGRA2BGR, dst=crop)
+                else:
+                    np.copyto(crop, source[y1:y2, x1:x2])
+            crops.append(crop)
+        return crops
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "mean_latency": self.capture_time / self.frames if self.frames else 0.0,
+            "allocations": self.ring.allocations,
+            "reuses": self.ring.reuses,
+            "overflows": self.ring.overflows,
+        }
+
+    def close(self):
+        pass
+
+
+class SyntheticFrameSource(FrameSource):
+    def __init__(self, width, height, slots=16, seed=0, patches=3, patch_size=24):
+        super().__init__(slots)
+        self.width = width
+        self.height = height
+        self.patches = patches
+        self.patch_size = patch_size
+        self._rng = np.random.default_rng(seed)
+        noise = self._rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        self.scene = cv2.GaussianBlur(noise, (9, 9), 0)
+
+    def grab(self, max_y):
+        height = self.height if max_y is None else min(self.height, max_y)
+        self._animate()
+        frame = self.ring.acquire((height, self.width, 3))
+        np.copyto(frame, self.scene[:height])
+        return frame
+
+    def grab_regions(self, regions):
+        self._animate()
+        return self.pack_regions(self.scene, regions)
+
+    def _animate(self):
+        for _ in range(self.patches):
+            x = int(self._rng.integers(0, max(1, self.width - self.patch_size)))
+            y = int(self._rng.integers(0, max(1, self.height - self.patch_size)))
+            self.scene[y:y + self.patch_size, x:x + self.patch_size] = self._rng.integers(0, 256, 3, dtype=np.uint8)
+
+
+class FileFrameSource(FrameSource):
+    EXTENSIONS = (".png", ".jpg", ".bmp")
+
+    def __init__(self, path, slots=16, loop=True, limit=None):
+        super().__init__(slots)
+        self.path = Path(path)
+        self.loop = loop
+        if self.path.is_dir():
+            paths = sorted(entry for entry in self.path.iterdir() if entry.suffix.lower() in self.EXTENSIONS)
+        else:
+            paths = [self.path]
+        self.images = []
+        for image_path in paths[:limit]:
+            image = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+            if image is not None:
+                self.images.append(image)
+        if not self.images:
+            raise FileNotFoundError(f"No frames found at {self.path}")
+        self._index = 0
+        logger.info(f"File frame source loaded {len(self.images)} frames from {self.path}")
+
+    def grab(self, max_y):
+        image = self._next_image()
+        if max_y is not None:
+            image = image[:max_y]
+        frame = self.ring.acquire(image.shape)
+        np.copyto(frame, image)
+        return frame
+
+    def grab_regions(self, regions):
+        return self.pack_regions(self._next_image(), regions)
+
+    def _next_image(self):
+        if self._index >= len(self.images):
+            if not self.loop:
+                raise EOFError(f"File frame source {self.path} is exhausted")
+            self._index = 0
+        image = self.images[self._index]
+        self._index += 1
+        return image
+
+
+class FramePublisher:
+    def __init__(self, source, interval=0.02, max_y=None, timeout=1.0):
+        self.source = source
+        self.interval = interval
+        self.max_y = max_y
+        self.timeout = timeout
+        self.errors = 0
+        self._frame = None
+        self._sequence = 0
+        self._timestamp = 0.0
+        self._started = 0
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="frame-capture", daemon=True)
+        self._thread.start()
+        logger.info(f"Capture thread started at {1.0 / self.interval if self.interval > 0 else float('inf'):.0f} fps")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        with self._condition:
+            self._frame = None
+        logger.info("Capture thread stopped")
+
+    def latest(self):
+        with self._condition:
+            if self._frame is None:
+                return None
+            return self._frame, self._sequence, self._timestamp
+
+    def request(self):
+        # Frames numbered above the returned sequence started their grab after this call.
+        with self._condition:
+            sequence = self._started
+        self._wake.set()
+        return sequence
+
+    def wait_newer(self, sequence, timeout=None):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._sequence > sequence or self._stop.is_set(),
+                timeout=self.timeout if timeout is None else timeout,
+            )
+            if self._sequence <= sequence or self._frame is None:
+                return None
+            return self._frame, self._sequence, self._timestamp
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._condition:
+                self._started += 1
+                sequence = self._started
+            self._wake.clear()
+            timestamp = time.monotonic()
+            try:
+                frame = self.source.capture(self.max_y)
+            except EOFError:
+                logger.info("Frame source exhausted, capture thread stopping")
+                break
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Capture failed: {e}")
+                self._stop.wait(max(self.interval, 0.1))
+                continue
+
+            with self._condition:
+                self._frame = frame
+                self._sequence = sequence
+                self._timestamp = timestamp
+                self._condition.notify_all()
+            del frame
+            self._wake.wait(max(0.0, self.interval - (time.monotonic() - timestamp)))
+
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+
+
+def clip_regions(regions, shape):
+    height, width = shape[:2]
+    clipped = []
+    for x1, y1, x2, y2 in regions:
+        x1 = min(max(0, x1), width)
+        y1 = min(max(0, y1), height)
+        clipped.append((x1, y1, max(x1, min(width, x2)), max(y1, min(height, y2))))
+    return clipped
+
+
+def crop_regions(frame, regions):
+    return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in clip_regions(regions, frame.shape)]
+
+
+def create_frame_source(backend, window_capture=None, slots=16, path=None, width=None, height=None):
+    if backend == "win32":
+        return window_capture.frame_source
+    if backend == "synthetic":
+        return SyntheticFrameSource(width, height, slots=slots)
+    if backend == "file":
+        return FileFrameSource(path, slots=slots)
+    raise ValueError(f"Unknown capture backend: {backend}")
@@ -2,35 +2,166 @@ import cv2
 import numpy as np
 import logging
 import os
+import threading
+import time
+import weakref
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from template_bank import CompiledTemplate, channel_spectra
 
 logger = logging.getLogger(__name__)
 
+MATCH_DTYPE = np.dtype([
+    ("template", np.int32),
+    ("confidence", np.float32),
+    ("x", np.int32),
+    ("y", np.int32),
+    ("w", np.int32),
+    ("h", np.int32),
+])
+
+HIT_DTYPE = np.dtype([
+    ("template", np.int32),
+    ("confidence", np.float32),
+    ("x", np.int32),
+    ("y", np.int32),
+])
+
+VOTE_DTYPE = np.dtype([
+    ("x", np.int32),
+    ("y", np.int32),
+    ("confidence", np.float32),
+    ("votes", np.int32),
+])
+
 
 class ImageMatcher:
-    def __init__(self, threshold=0.85):
+    COMPILED_CACHE_SIZE = 256
+    FEATURE_CACHE_SIZE = 8
+    STACKED_MAX_AREA = 64 * 64
+
+    def __init__(self, threshold=0.85, workers=None):
         self.threshold = threshold
         cv2.setUseOptimized(True)
         cpu_count = os.cpu_count() or 1
-        cv2.setNumThreads(cpu_count)
+        self.workers = max(1, min(workers or cpu_count // 2, cpu_count))
+        cv2.setNumThreads(max(1, cpu_count // self.workers))
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._worker_state = threading.local()
+        self._timing_lock = threading.Lock()
+        self._compiled_cache = {}
+        self._stacked_cache = {}
+        self._feature_cache = OrderedDict()
+        self._feature_lock = threading.Lock()
+        self._peak_kernel = np.ones((3, 3), dtype=np.uint8)
 
-    def is_red_dominant(self, image, x, y, size=12, min_ratio=1.15, min_mean=35):
-        half = max(1, size // 2)
-        x1 = max(0, x - half)
-        y1 = max(0, y - half)
-        x2 = min(image.shape[1], x + half)
-        y2 = min(image.shape[0], y + half)
+    def frame_features(self, image, create=True):
+        key = id(image)
+        with self._feature_lock:
+            entry = self._feature_cache.get(key)
+            if entry is not None and entry[0]() is image:
+                self._feature_cache.move_to_end(key)
+                return entry[1]
+            if not create:
+                return None
 
-        roi = image[y1:y2, x1:x2]
-        if roi.size == 0:
-            return True
+            features = FrameFeatures(image)
+            self._feature_cache[key] = (weakref.ref(image), features)
+            self._feature_cache.move_to_end(key)
+            while len(self._feature_cache) > self.FEATURE_CACHE_SIZE:
+                self._feature_cache.popitem(last=False)
+            return features
+
+    def as_bgr(self, image):
+        if image.ndim != 3 or image.shape[2] != 4:
+            return image
+        # Raw BGRA captures reuse the conversion cached with the frame's features; crops convert only their own pixels.
+        features = self.frame_features(image, create=False)
+        if features is not None:
+            return features.bgr
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
 
-        b, g, r, _ = cv2.mean(roi)
-        if r < min_mean:
-            return False
+    def is_red_dominant(self, image, x, y, size=12, min_ratio=1.15, min_mean=35):
+        return bool(self.red_dominant_mask(image, [(x, y)], size, min_ratio, min_mean)[0])
 
-        dominant_ratio = max(g, b) + 1e-6
-        return (r / dominant_ratio) >= min_ratio
+    def red_dominant_mask(self, image, points, size=12, min_ratio=1.15, min_mean=35):
+        return self.frame_features(image).red_dominant_mask(points, size, min_ratio, min_mean)
     
+    def map(self, func, items):
+        items = list(items)
+        if self.workers <= 1 or len(items) <= 1 or getattr(self._worker_state, "active", False):
+            return [func(item) for item in items]
+        timings = getattr(self._worker_state, "timings", None)
+        return list(self._get_executor().map(lambda item: self._run_in_worker(func, item, timings), items))
+
+    def _run_in_worker(self, func, item, timings):
+        # Pool threads time their templates into the scope of the thread that fanned the work out.
+        self._worker_state.active = True
+        self._worker_state.timings = timings
+        try:
+            return func(item)
+        finally:
+            self._worker_state.active = False
+            self._worker_state.timings = None
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="matcher")
+            return self._executor
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def score_maps(self, screenshot, templates, region=None):
+        height, width = screenshot.shape[:2]
+        x1, y1, x2, y2 = region or (0, 0, width, height)
+        region = (max(0, x1), max(0, y1), min(width, x2), min(height, y2))
+        features = self.frame_features(screenshot)
+
+        def lookup(compiled):
+            entry = features.score_map(compiled, region)
+            if entry is not None:
+                return entry
+            rx1, ry1, rx2, ry2 = region
+            roi = features.bgr[ry1:ry2, rx1:rx2]
+            result = None
+            if compiled.height <= roi.shape[0] and compiled.width <= roi.shape[1]:
+                result = cv2.matchTemplate(roi, compiled.image, cv2.TM_SQDIFF_NORMED, mask=compiled.mask)
+            return features.add_score_map(compiled, region, result)
+
+        templates = self.compile_bank(templates)
+        rx1, ry1, rx2, ry2 = region
+        if len(templates) > 1 and (rx2 - rx1) * (ry2 - ry1) <= self.STACKED_MAX_AREA:
+            # Tiny verify/refine windows: one batched pass beats per-template matchTemplate overhead.
+            entries = [features.score_map(compiled, region) for compiled in templates]
+            if any(entry is None for entry in entries):
+                maps = self.stacked_templates(templates).score(features.bgr[ry1:ry2, rx1:rx2])
+                entries = [
+                    features.add_score_map(compiled, region, result)
+                    for compiled, result in zip(templates, maps)
+                ]
+            return ScoreMaps(list(zip(templates, entries)))
+
+        return ScoreMaps(list(zip(templates, self.map(lookup, templates))))
+
+    def stacked_templates(self, templates):
+        templates = self.compile_bank(templates)
+        key = tuple(id(compiled) for compiled in templates)
+        with self._feature_lock:
+            stack = self._stacked_cache.get(key)
+            if stack is None or any(cached is not compiled for cached, compiled in zip(stack.templates, templates)):
+                if len(self._stacked_cache) >= self.COMPILED_CACHE_SIZE:
+                    self._stacked_cache.clear()
+                stack = StackedTemplates(templates)
+                self._stacked_cache[key] = stack
+        return stack
+
     def load_template(self, template_path):
         template = cv2.imread(str(template_path), cv2.IMREAD_UNCHANGED)
         if template is None:
@@ -39,32 +170,56 @@ class ImageMatcher:
         mask = None
         if len(template.shape) == 3 and template.shape[2] == 4:
             alpha = template[:, :, 3]
-            mask = np.zeros_like(alpha)
-            mask[alpha > 0] = 255
+            if cv2.countNonZero(alpha) < alpha.size:
+                mask = np.zeros_like(alpha)
+                mask[alpha > 0] = 255
             template = cv2.cvtColor(template, cv2.COLOR_BGRA2BGR)
         
         return template, mask
+
+    def compile_template(self, template, mask=None, name="Unknown"):
+        return CompiledTemplate(name, template, mask)
+
+    def compile(self, template, mask=None, name="Unknown"):
+        if isinstance(template, CompiledTemplate):
+            return template
+        key = (id(template), id(mask))
+        cached = self._compiled_cache.get(key)
+        if cached is None or cached[0] is not template or cached[1] is not mask:
+            if len(self._compiled_cache) >= self.COMPILED_CACHE_SIZE:
+                self._compiled_cache.clear()
+            cached = (template, mask, self.compile_template(template, mask, name))
+            self._compiled_cache[key] = cached
+        return cached[2]
     
-    def find_template(self, screenshot, template, mask=None, threshold=None, template_name="Unknown", check_color=False):
+    def find_template(self, screenshot, template, mask=None, threshold=None, template_name="Unknown", check_color=False,
+                      pyramid_levels=0):
         thresh = threshold if threshold else self.threshold
+        compiled = self.compile(template, mask, template_name)
         
-        if template.shape[0] > screenshot.shape[0] or template.shape[1] > screenshot.shape[1]:
-            logger.debug(f"Template is larger than screenshot. Template: {template.shape}, Screenshot: {screenshot.shape}")
+        if compiled.height > screenshot.shape[0] or compiled.width > screenshot.shape[1]:
+            logger.debug(f"Template is larger than screenshot. Template: {compiled.shape}, Screenshot: {screenshot.shape}")
             return False, 0.0, 0, 0
         
-        result = cv2.matchTemplate(screenshot, template, cv2.TM_SQDIFF_NORMED, mask=mask)
-        
+        min_val, min_loc = self.best_match(screenshot, compiled, pyramid_levels)
+        return self.evaluate_match(screenshot, compiled, min_val, min_loc, thresh, template_name, check_color)
+
+    def best_match(self, screenshot, compiled, pyramid_levels=0):
+        if pyramid_levels > 0 and compiled.pyramid:
+            return self._pyramid_search(self.as_bgr(screenshot), compiled, pyramid_levels)
+        result = cv2.matchTemplate(self.as_bgr(screenshot), compiled.image, cv2.TM_SQDIFF_NORMED, mask=compiled.mask)
         min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-        
+        return min_val, min_loc
+
+    def evaluate_match(self, screenshot, compiled, min_val, min_loc, threshold, template_name="Unknown", check_color=False):
         confidence = 1 - min_val
         
-        if confidence >= thresh:
-            h, w = template.shape[:2]
-            center_x = min_loc[0] + w // 2
-            center_y = min_loc[1] + h // 2
+        if confidence >= threshold:
+            center_x = min_loc[0] + compiled.anchor[0]
+            center_y = min_loc[1] + compiled.anchor[1]
             
             if check_color:
-                color_match = self._check_color_similarity(screenshot, template, min_loc, mask)
+                color_match = self._check_color_similarity(screenshot, compiled, min_loc)
                 if not color_match:
                     logger.debug(f"[{template_name}] Color check failed at ({center_x}, {center_y}), confidence: {confidence:.2%}")
                     return False, confidence, 0, 0
@@ -73,116 +228,713 @@ class ImageMatcher:
         
         return False, confidence, 0, 0
     
-    def _check_color_similarity(self, screenshot, template, location, mask=None):
-        x, y = location
+    def _pyramid_search(self, screenshot, compiled, pyramid_levels):
+        template = compiled.image
+        mask = compiled.mask
+        levels, small_template, small_mask = compiled.pyramid_level(pyramid_levels)
+        small_screenshot = screenshot
+        for _ in range(levels):
+            small_screenshot = cv2.pyrDown(small_screenshot)
+
+        if (
+            small_template.shape[0] > small_screenshot.shape[0]
+            or small_template.shape[1] > small_screenshot.shape[1]
+        ):
+            result = cv2.matchTemplate(screenshot, template, cv2.TM_SQDIFF_NORMED, mask=mask)
+            min_val, _, min_loc, _ = cv2.minMaxLoc(result)
+            return min_val, min_loc
+
+        coarse = cv2.matchTemplate(small_screenshot, small_template, cv2.TM_SQDIFF_NORMED, mask=small_mask)
+        _, _, coarse_loc, _ = cv2.minMaxLoc(coarse)
+
+        scale = 1 << levels
+        pad = 2 * scale
         h, w = template.shape[:2]
+        x1 = max(0, coarse_loc[0] * scale - pad)
+        y1 = max(0, coarse_loc[1] * scale - pad)
+        x2 = min(screenshot.shape[1], coarse_loc[0] * scale + w + pad)
+        y2 = min(screenshot.shape[0], coarse_loc[1] * scale + h + pad)
+
+        window = screenshot[y1:y2, x1:x2]
+        result = cv2.matchTemplate(window, template, cv2.TM_SQDIFF_NORMED, mask=mask)
+        min_val, _, min_loc, _ = cv2.minMaxLoc(result)
+        return min_val, (min_loc[0] + x1, min_loc[1] + y1)
+
+    def _check_color_similarity(self, screenshot, compiled, location):
+        x, y = location
+        h, w = compiled.height, compiled.width
         
         roi = screenshot[y:y+h, x:x+w]
         
-        if roi.shape[:2] != template.shape[:2]:
+        if roi.shape[:2] != (h, w) or not compiled.histograms:
             return True
         
-        if mask is not None:
-            template_masked = cv2.bitwise_and(template, template, mask=mask)
-            roi_masked = cv2.bitwise_and(roi, roi, mask=mask)
-        else:
-            template_masked = template
-            roi_masked = roi
-        
-        hist_template_b = cv2.calcHist([template_masked], [0], mask, [32], [0, 256])
-        hist_template_g = cv2.calcHist([template_masked], [1], mask, [32], [0, 256])
-        hist_template_r = cv2.calcHist([template_masked], [2], mask, [32], [0, 256])
-        
-        hist_roi_b = cv2.calcHist([roi_masked], [0], mask, [32], [0, 256])
-        hist_roi_g = cv2.calcHist([roi_masked], [1], mask, [32], [0, 256])
-        hist_roi_r = cv2.calcHist([roi_masked], [2], mask, [32], [0, 256])
-        
-        cv2.normalize(hist_template_b, hist_template_b, 0, 1, cv2.NORM_MINMAX)
-        cv2.normalize(hist_template_g, hist_template_g, 0, 1, cv2.NORM_MINMAX)
-        cv2.normalize(hist_template_r, hist_template_r, 0, 1, cv2.NORM_MINMAX)
-        cv2.normalize(hist_roi_b, hist_roi_b, 0, 1, cv2.NORM_MINMAX)
-        cv2.normalize(hist_roi_g, hist_roi_g, 0, 1, cv2.NORM_MINMAX)
-        cv2.normalize(hist_roi_r, hist_roi_r, 0, 1, cv2.NORM_MINMAX)
+        correlations = []
+        for channel, hist_template in enumerate(compiled.histograms):
+            hist_roi = cv2.calcHist([roi], [channel], compiled.mask, [compiled.HISTOGRAM_BINS], [0, 256])
+            cv2.normalize(hist_roi, hist_roi, 0, 1, cv2.NORM_MINMAX)
+            correlations.append(cv2.compareHist(hist_template, hist_roi, cv2.HISTCMP_CORREL))
         
-        corr_b = cv2.compareHist(hist_template_b, hist_roi_b, cv2.HISTCMP_CORREL)
-        corr_g = cv2.compareHist(hist_template_g, hist_roi_g, cv2.HISTCMP_CORREL)
-        corr_r = cv2.compareHist(hist_template_r, hist_roi_r, cv2.HISTCMP_CORREL)
-        
-        avg_corr = (corr_b + corr_g + corr_r) / 3
+        avg_corr = sum(correlations) / len(correlations)
         
         color_threshold = 0.7
         return avg_corr >= color_threshold
     
     def find_all_templates(self, screenshot, template, mask=None, threshold=None, min_distance=15, scales=None, template_name="Unknown"):
         thresh = threshold if threshold else self.threshold
+        compiled = self.compile(template, mask, template_name)
         all_matches = []
         
         if scales is None:
             scales = [1.0]
+        screenshot = self.as_bgr(screenshot)
         
-        if template.shape[0] > screenshot.shape[0] or template.shape[1] > screenshot.shape[1]:
-            logger.debug(f"Template is larger than screenshot. Template: {template.shape}, Screenshot: {screenshot.shape}")
+        if compiled.height > screenshot.shape[0] or compiled.width > screenshot.shape[1]:
+            logger.debug(f"Template is larger than screenshot. Template: {compiled.shape}, Screenshot: {screenshot.shape}")
             return []
         
         for scale in scales:
             if scale != 1.0:
-                scaled_template = cv2.resize(template, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                scaled_template = cv2.resize(compiled.image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
                 scaled_mask = None
-                if mask is not None:
-                    scaled_mask = cv2.resize(mask, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                if compiled.mask is not None:
+                    scaled_mask = cv2.resize(compiled.mask, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
                     scaled_mask[scaled_mask > 0] = 255
+                anchor = (int(compiled.anchor[0] * scale), int(compiled.anchor[1] * scale))
             else:
-                scaled_template = template
-                scaled_mask = mask
+                scaled_template = compiled.image
+                scaled_mask = compiled.mask
+                anchor = compiled.anchor
             
             if scaled_template.shape[0] > screenshot.shape[0] or scaled_template.shape[1] > screenshot.shape[1]:
                 continue
             
             result = cv2.matchTemplate(screenshot, scaled_template, cv2.TM_SQDIFF_NORMED, mask=scaled_mask)
             
-            locations = np.where(result <= (1 - thresh))
-            
             h, w = scaled_template.shape[:2]
-            for pt in zip(*locations[::-1]):
-                confidence = 1 - result[pt[1], pt[0]]
-                center_x = pt[0] + w // 2
-                center_y = pt[1] + h // 2
-                all_matches.append((confidence, center_x, center_y, w, h))
-        
-        if all_matches:
-            all_matches = self._non_max_suppression(all_matches, min_distance)
+            all_matches.append(self.extract_matches(result, thresh, w, h, anchor))
         
-        return [(conf, x, y) for conf, x, y, _, _ in all_matches]
-    
-    def _non_max_suppression(self, matches, min_distance):
-        if not matches:
+        if not all_matches:
             return []
         
-        matches = sorted(matches, key=lambda x: x[0], reverse=True)
-        filtered = []
-        
-        for conf, x, y, w, h in matches:
-            is_unique = True
-            for f_conf, fx, fy, fw, fh in filtered:
-                dx = abs(x - fx)
-                dy = abs(y - fy)
-                
-                if dx < min_distance and dy < min_distance:
-                    x1, y1 = max(x - w//2, fx - fw//2), max(y - h//2, fy - fh//2)
-                    x2, y2 = min(x + w//2, fx + fw//2), min(y + h//2, fy + fh//2)
-                    
-                    if x2 > x1 and y2 > y1:
-                        intersection = (x2 - x1) * (y2 - y1)
-                        area1 = w * h
-                        area2 = fw * fh
-                        union = area1 + area2 - intersection
-                        iou = intersection / union if union > 0 else 0
-                        
-                        if iou > 0.1:
-                            is_unique = False
-                            break
-            
-            if is_unique:
-                filtered.append((conf, x, y, w, h))
-        
-        return filtered
+        matches = self.non_max_suppression(np.concatenate(all_matches), min_distance)
+        return self.match_tuples(matches)
+
+    def find_all_templates_multi(self, screenshot, templates, threshold=None, min_distance=15, use_fft=True):
+        return [
+            (compiled.name, self.match_tuples(self.non_max_suppression(peaks, min_distance)))
+            for compiled, peaks in self.find_template_peaks(screenshot, templates, threshold, use_fft)
+        ]
+
+    def find_template_peaks(self, screenshot, templates, threshold=None, use_fft=True):
+        thresh = threshold if threshold else self.threshold
+        features = self.frame_features(screenshot)
+        templates = self.compile_bank(templates)
+
+        fft_shape = None
+        if use_fft:
+            fft_shape = features.dft_shape()
+        features.precompute(fft_shape)
+
+        peaks = self.map(
+            lambda compiled: self._template_peaks(features.bgr, features, compiled, thresh, fft_shape),
+            templates,
+        )
+        return list(zip(templates, peaks))
+
+    def start_template_timings(self):
+        self._worker_state.timings = defaultdict(float)
+
+    def add_template_timings(self, timings):
+        scope = getattr(self._worker_state, "timings", None)
+        if scope is None:
+            return
+        with self._timing_lock:
+            for name, elapsed in timings.items():
+                scope[name] += elapsed
+
+    def pop_template_timings(self):
+        timings = getattr(self._worker_state, "timings", None)
+        self._worker_state.timings = None
+        if timings is None:
+            return {}
+        with self._timing_lock:
+            return dict(timings)
+
+    def _template_peaks(self, screenshot, features, compiled, thresh, fft_shape):
+        start = time.perf_counter()
+        h, w = compiled.height, compiled.width
+        if h > screenshot.shape[0] or w > screenshot.shape[1]:
+            logger.debug(f"Template is larger than screenshot. Template: {compiled.shape}, Screenshot: {screenshot.shape}")
+            return np.empty(0, dtype=MATCH_DTYPE)
+
+        if compiled.mask is not None:
+            result = cv2.matchTemplate(screenshot, compiled.image, cv2.TM_SQDIFF_NORMED, mask=compiled.mask)
+        else:
+            if fft_shape is not None:
+                ccorr = self._fft_ccorr(features, compiled, fft_shape)
+            else:
+                ccorr = cv2.matchTemplate(features.float_image, compiled.image.astype(np.float32), cv2.TM_CCORR)
+            result = self._sqdiff_normed_from_ccorr(
+                ccorr,
+                features.window_sq_sums(h, w),
+                compiled.sq_sum,
+            )
+
+        matches = self.extract_matches(result, thresh, w, h, compiled.anchor)
+        timings = getattr(self._worker_state, "timings", None)
+        if timings is not None:
+            with self._timing_lock:
+                timings[compiled.name] += time.perf_counter() - start
+        return matches
+
+    def find_all_instances(self, screenshot, templates, threshold=None, min_distance=15, use_fft=True):
+        return self.merge_instances(self.find_template_peaks(screenshot, templates, threshold, use_fft), min_distance)
+
+    def merge_instances(self, peaks, min_distance):
+        if not peaks:
+            return []
+
+        tagged = []
+        for index, (_, found) in enumerate(peaks):
+            found = found.copy()
+            found["template"] = index
+            tagged.append(found)
+        matches = self.non_max_suppression(np.concatenate(tagged), min_distance)
+        names = [compiled.name for compiled, _ in peaks]
+        return [
+            (names[template], confidence, x, y)
+            for template, confidence, x, y in zip(
+                matches["template"].tolist(),
+                matches["confidence"].tolist(),
+                matches["x"].tolist(),
+                matches["y"].tolist(),
+            )
+        ]
+
+    def suppress_matches(self, matches, min_distance):
+        return self.match_tuples(self.non_max_suppression(matches, min_distance))
+
+    def compile_bank(self, templates):
+        compiled = []
+        for entry in templates:
+            if isinstance(entry, CompiledTemplate):
+                compiled.append(entry)
+            else:
+                template_name, template, mask = entry
+                compiled.append(self.compile(template, mask, template_name))
+        return compiled
+
+    def find_all_templates_in_rois(self, screenshot, templates, rois, threshold=None, min_distance=15, use_fft=False):
+        templates = self.compile_bank(templates)
+        combined = [(compiled.name, []) for compiled in templates]
+        for x1, y1, x2, y2 in rois:
+            roi = screenshot[y1:y2, x1:x2]
+            if roi.size == 0:
+                continue
+            roi_results = self.find_all_templates_multi(
+                roi,
+                templates,
+                threshold=threshold,
+                min_distance=min_distance,
+                use_fft=use_fft,
+            )
+            for index, (_, matches) in enumerate(roi_results):
+                combined[index][1].extend((conf, x + x1, y + y1) for conf, x, y in matches)
+        return combined
+
+    def red_candidate_rois(self, image, region=None, padding=0, size=12, min_ratio=1.15, min_mean=35,
+                           min_area=4, max_size=64):
+        height, width = image.shape[:2]
+        rx1, ry1, rx2, ry2 = region or (0, 0, width, height)
+        if rx1 >= rx2 or ry1 >= ry2:
+            return []
+
+        half = max(1, size // 2)
+        ex1 = max(0, rx1 - half)
+        ey1 = max(0, ry1 - half)
+        ex2 = min(width, rx2 + half)
+        ey2 = min(height, ry2 + half)
+        if (ex1, ey1, ex2, ey2) == (0, 0, width, height):
+            features = self.frame_features(image)
+        else:
+            features = FrameFeatures(image[ey1:ey2, ex1:ex2])
+        means = features.window_channel_means(size)[ry1 - ey1:ry2 - ey1, rx1 - ex1:rx2 - ex1]
+
+        red = means[:, :, 2]
+        dominant = np.maximum(means[:, :, 0], means[:, :, 1]) + 1e-6
+        candidates = ((red >= min_mean) & (red >= min_ratio * dominant)).astype(np.uint8)
+
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(candidates, connectivity=8)
+        boxes = []
+        for label in range(1, count):
+            x, y, w, h, area = (int(value) for value in stats[label])
+            if area < min_area:
+                continue
+            if w <= max_size and h <= max_size:
+                boxes.append((x, y, x + w, y + h))
+            else:
+                # An icon touching a larger red area joins its component, so big components are
+                # searched tile by tile wherever they have candidate pixels.
+                boxes.extend(self._component_tiles(labels[y:y + h, x:x + w] == label, x, y, max_size))
+
+        rois = [
+            (
+                max(rx1, rx1 + x1 - padding),
+                max(ry1, ry1 + y1 - padding),
+                min(rx2, rx1 + x2 + padding),
+                min(ry2, ry1 + y2 + padding),
+            )
+            for x1, y1, x2, y2 in boxes
+        ]
+        return self.merge_rois(rois)
+
+    def _component_tiles(self, component, x, y, tile):
+        tiles = []
+        height, width = component.shape
+        for ty in range(0, height, tile):
+            for tx in range(0, width, tile):
+                ys, xs = np.nonzero(component[ty:ty + tile, tx:tx + tile])
+                if ys.size:
+                    tiles.append((
+                        x + tx + int(xs.min()),
+                        y + ty + int(ys.min()),
+                        x + tx + int(xs.max()) + 1,
+                        y + ty + int(ys.max()) + 1,
+                    ))
+        return tiles
+
+    def collect_hits(self, bank_results, names):
+        ids = {name: index for index, name in enumerate(names)}
+        count = sum(len(matches) for _, matches in bank_results)
+        hits = np.empty(count, dtype=HIT_DTYPE)
+        start = 0
+        for template_name, matches in bank_results:
+            if not matches:
+                continue
+            end = start + len(matches)
+            values = np.asarray(matches, dtype=np.float64).reshape(-1, 3)
+            hits["template"][start:end] = ids[template_name]
+            hits["confidence"][start:end] = values[:, 0]
+            hits["x"][start:end] = values[:, 1]
+            hits["y"][start:end] = values[:, 2]
+            start = end
+        return hits
+
+    def aggregate_votes(self, hits, proximity=10):
+        if hits.size == 0:
+            return np.empty(0, dtype=VOTE_DTYPE), np.empty(0, dtype=np.int32)
+
+        count = hits.size
+        index = np.arange(count)
+        x = hits["x"].astype(np.int64)
+        y = hits["y"].astype(np.int64)
+
+        # Hit centres are quantised onto a grid of proximity-sized cells with an empty border, so
+        # every hit within proximity of another sits in one of the 3x3 cells around it.
+        cell_x = x // proximity
+        cell_y = y // proximity
+        cell_x -= cell_x.min() - 1
+        cell_y -= cell_y.min() - 1
+        span = int(cell_y.max()) + 2
+        cells = (int(cell_x.max()) + 2) * span
+        cell = cell_x * span + cell_y
+
+        # neighbours[rank, hit] is the cell at each offset, ranked in the old bucket walk order
+        # (dx outer, dy inner).
+        offsets = np.array([dx * span + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        neighbours = cell + offsets[:, np.newaxis]
+
+        # Seeds are at least proximity apart, so a cell holds at most one. A hit joins an earlier seed
+        # in reach; otherwise it seeds a cluster once every earlier hit around it is settled. Each round
+        # settles at least the earliest open hit, and in practice nearly all of them. Hit index `count`
+        # marks an empty cell and is never earlier than a real hit.
+        seed_of = np.full(cells, count)
+        x_at = np.append(x, 0)
+        y_at = np.append(y, 0)
+
+        def in_reach(hit_ids):
+            seeds = seed_of[neighbours[:, hit_ids]]
+            reach = (
+                (seeds < hit_ids)
+                & (np.abs(x_at[seeds] - x[hit_ids]) < proximity)
+                & (np.abs(y_at[seeds] - y[hit_ids]) < proximity)
+            )
+            return seeds, reach
+
+        open_hits = index
+        while open_hits.size:
+            open_hits = open_hits[~in_reach(open_hits)[1].any(axis=0)]
+            first = np.full(cells, count)
+            np.minimum.at(first, cell[open_hits], open_hits)
+            leader = first[cell[open_hits]] == open_hits
+            leader[leader] = (first[neighbours[:, open_hits[leader]]] >= open_hits[leader]).all(axis=0)
+            seed_of[cell[open_hits[leader]]] = open_hits[leader]
+            open_hits = open_hits[~leader]
+
+        # Members join the seed met first in the bucket walk.
+        seed_ids = np.sort(seed_of[seed_of < count])
+        cluster_of = np.full(count + 1, -1, dtype=np.int32)
+        cluster_of[seed_ids] = np.arange(seed_ids.size, dtype=np.int32)
+        seeds, reach = in_reach(index)
+        labels = cluster_of[seeds[reach.argmax(axis=0), index]]
+        labels[seed_ids] = cluster_of[seed_ids]
+
+        clusters = np.empty(seed_ids.size, dtype=VOTE_DTYPE)
+        clusters["x"] = hits["x"][seed_ids]
+        clusters["y"] = hits["y"][seed_ids]
+        clusters["confidence"] = -np.inf
+        np.maximum.at(clusters["confidence"], labels, hits["confidence"])
+        clusters["votes"] = 0
+        np.add.at(clusters["votes"], labels, 1)
+        return clusters, labels
+
+    def merge_rois(self, rois):
+        merged = list(rois)
+        changed = True
+        while changed:
+            changed = False
+            result = []
+            for roi in merged:
+                for index, other in enumerate(result):
+                    if roi[0] < other[2] and other[0] < roi[2] and roi[1] < other[3] and other[1] < roi[3]:
+                        result[index] = (
+                            min(roi[0], other[0]),
+                            min(roi[1], other[1]),
+                            max(roi[2], other[2]),
+                            max(roi[3], other[3]),
+                        )
+                        changed = True
+                        break
+                else:
+                    result.append(roi)
+            merged = result
+        return sorted(merged, key=lambda roi: (roi[1], roi[0]))
+
+    def extract_matches(self, result, thresh, w, h, anchor=None):
+        candidates = result <= (1 - thresh)
+        if not candidates.any():
+            return np.empty(0, dtype=MATCH_DTYPE)
+
+        local_min = cv2.erode(result, self._peak_kernel, borderType=cv2.BORDER_REPLICATE)
+        ys, xs = np.nonzero(candidates & (result <= local_min))
+
+        matches = np.empty(xs.size, dtype=MATCH_DTYPE)
+        matches["template"] = 0
+        matches["confidence"] = 1 - result[ys, xs]
+        anchor_x, anchor_y = anchor if anchor is not None else (w // 2, h // 2)
+        matches["x"] = xs + anchor_x
+        matches["y"] = ys + anchor_y
+        matches["w"] = w
+        matches["h"] = h
+        return matches
+
+    def match_tuples(self, matches):
+        return list(zip(
+            matches["confidence"].tolist(),
+            matches["x"].tolist(),
+            matches["y"].tolist(),
+        ))
+
+    def _fft_ccorr(self, features, compiled, fft_shape):
+        template_spectra = compiled.spectra(fft_shape)
+
+        frame_spectra = features.spectra(fft_shape)
+        acc = None
+        for frame_spectrum, template_spectrum in zip(frame_spectra, template_spectra):
+            product = cv2.mulSpectrums(frame_spectrum, template_spectrum, 0, conjB=True)
+            if acc is None:
+                acc = product
+            else:
+                acc += product
+
+        out_h = features.image.shape[0] - compiled.height + 1
+        out_w = features.image.shape[1] - compiled.width + 1
+        ccorr = cv2.idft(acc, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE, nonzeroRows=out_h)
+        return ccorr[:out_h, :out_w]
+
+    def _sqdiff_normed_from_ccorr(self, ccorr, window_sq, template_sq):
+        numerator = window_sq - 2.0 * ccorr + template_sq
+        np.maximum(numerator, 0.0, out=numerator)
+        denominator = np.sqrt(window_sq * template_sq)
+        result = np.ones_like(numerator)
+        np.divide(numerator, denominator, out=result, where=denominator > 0)
+        np.minimum(result, 1.0, out=result)
+        return result.astype(np.float32)
+    
+    def non_max_suppression(self, matches, min_distance):
+        if matches.size == 0:
+            return matches
+
+        order = np.argsort(-matches["confidence"], kind="stable")
+        matches = matches[order]
+        x = matches["x"]
+        y = matches["y"]
+        half_w = matches["w"] // 2
+        half_h = matches["h"] // 2
+        area = matches["w"] * matches["h"]
+
+        keep = []
+        remaining = np.arange(matches.size)
+        while remaining.size:
+            current = remaining[0]
+            keep.append(current)
+            others = remaining[1:]
+
+            close = (np.abs(x[others] - x[current]) < min_distance) & (np.abs(y[others] - y[current]) < min_distance)
+            x1 = np.maximum(x[others] - half_w[others], x[current] - half_w[current])
+            y1 = np.maximum(y[others] - half_h[others], y[current] - half_h[current])
+            x2 = np.minimum(x[others] + half_w[others], x[current] + half_w[current])
+            y2 = np.minimum(y[others] + half_h[others], y[current] + half_h[current])
+            intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+            union = area[others] + area[current] - intersection
+            iou = np.divide(
+                intersection,
+                union,
+                out=np.zeros(others.size, dtype=np.float64),
+                where=union > 0,
+            )
+
+            remaining = others[~(close & (iou > 0.1))]
+
+        return matches[np.asarray(keep, dtype=np.intp)]
+
+
+class ScoreMaps:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def _find(self, compiled, region, result, roi, threshold):
+        x1, y1, x2, y2 = roi
+        tx2 = x2 - compiled.width
+        ty2 = y2 - compiled.height
+        if result is None or tx2 < x1 or ty2 < y1:
+            return False, 0.0, 0, 0
+
+        ox, oy = region[0], region[1]
+        window = result[y1 - oy:ty2 - oy + 1, x1 - ox:tx2 - ox + 1]
+        min_val, _, min_loc, _ = cv2.minMaxLoc(window)
+        confidence = 1 - min_val
+        if confidence < threshold:
+            return False, confidence, 0, 0
+        return True, confidence, x1 + min_loc[0] + compiled.anchor[0], y1 + min_loc[1] + compiled.anchor[1]
+
+    def find_many(self, roi, threshold):
+        x1, y1, x2, y2 = roi
+        results = []
+        for compiled, (region, result) in self.entries:
+            clipped = (max(x1, region[0]), max(y1, region[1]), min(x2, region[2]), min(y2, region[3]))
+            results.append((compiled.name, self._find(compiled, region, result, clipped, threshold)))
+        return results
+
+
+class StackedTemplates:
+    def __init__(self, templates):
+        self.templates = list(templates)
+        self.sizes = np.array([(compiled.height, compiled.width) for compiled in self.templates], dtype=np.int64)
+        self.height, self.width = (int(size) for size in self.sizes.max(axis=0))
+        self.min_height, self.min_width = (int(size) for size in self.sizes.min(axis=0))
+        channels = self.templates[0].image.shape[2] if self.templates[0].image.ndim == 3 else 1
+
+        self.images = np.zeros((len(self.templates), self.height, self.width, channels), dtype=np.float32)
+        self.masks = np.zeros((len(self.templates), self.height, self.width), dtype=np.float32)
+        for index, compiled in enumerate(self.templates):
+            mask = 1.0 if compiled.mask is None else (compiled.mask > 0).astype(np.float32)
+            self.masks[index, :compiled.height, :compiled.width] = mask
+            image = compiled.image.reshape(compiled.height, compiled.width, channels)
+            self.images[index, :compiled.height, :compiled.width] = image * self.masks[index, :compiled.height, :compiled.width, np.newaxis]
+        self.sq_sums = np.square(self.images, dtype=np.float64).sum(axis=(1, 2, 3))
+        self.opaque = all(compiled.mask is None for compiled in self.templates)
+        self._spectra = {}
+
+    def spectra(self, fft_shape):
+        cached = self._spectra.get(fft_shape)
+        if cached is None:
+            # Laid out (y, x, channel, template) so one batched matmul sums the channels for every template.
+            images = np.conj(np.fft.rfft2(self.images, s=fft_shape, axes=(1, 2))).astype(np.complex64)
+            masks = None
+            if not self.opaque:
+                masks = np.conj(np.fft.rfft2(self.masks, s=fft_shape, axes=(1, 2))).astype(np.complex64)
+            cached = (np.ascontiguousarray(images.transpose(1, 2, 3, 0)), masks)
+            self._spectra[fft_shape] = cached
+        return cached
+
+    def score(self, roi):
+        roi_h, roi_w = roi.shape[:2]
+        if roi_h < self.min_height or roi_w < self.min_width:
+            return [None] * len(self.templates)
+
+        # Valid offsets never wrap around, so the DFT only has to hold the ROI and the template canvas.
+        fft_shape = (
+            cv2.getOptimalDFTSize(max(roi_h, self.height)),
+            cv2.getOptimalDFTSize(max(roi_w, self.width)),
+        )
+        out_h = roi_h - self.min_height + 1
+        out_w = roi_w - self.min_width + 1
+        image = roi.astype(np.float32).reshape(roi_h, roi_w, -1)
+        image_spectra, mask_spectra = self.spectra(fft_shape)
+
+        frame = np.fft.rfft2(image, s=fft_shape, axes=(0, 1)).astype(np.complex64, copy=False)
+        product = np.matmul(frame[:, :, np.newaxis, :], image_spectra)[:, :, 0, :]
+        ccorr = np.fft.irfft2(product, s=fft_shape, axes=(0, 1))[:out_h, :out_w].transpose(2, 0, 1)
+
+        squared = np.square(image).sum(axis=2)
+        if mask_spectra is None:
+            integral = cv2.integral(squared, sdepth=cv2.CV_64F)
+            window_sq = np.zeros((len(self.templates), out_h, out_w), dtype=np.float64)
+            for index, (height, width) in enumerate(self.sizes):
+                valid_h = roi_h - height + 1
+                valid_w = roi_w - width + 1
+                if valid_h <= 0 or valid_w <= 0:
+                    continue
+                window_sq[index, :valid_h, :valid_w] = (
+                    integral[height:height + valid_h, width:width + valid_w]
+                    - integral[:valid_h, width:width + valid_w]
+                    - integral[height:height + valid_h, :valid_w]
+                    + integral[:valid_h, :valid_w]
+                )
+        else:
+            squared_spectrum = np.fft.rfft2(squared, s=fft_shape)
+            window_sq = np.fft.irfft2(squared_spectrum[np.newaxis] * mask_spectra, s=fft_shape, axes=(1, 2))
+            window_sq = window_sq[:, :out_h, :out_w]
+
+        numerator = window_sq - 2.0 * ccorr + self.sq_sums[:, np.newaxis, np.newaxis]
+        np.maximum(numerator, 0.0, out=numerator)
+        denominator = np.sqrt(np.maximum(window_sq, 0.0) * self.sq_sums[:, np.newaxis, np.newaxis])
+        result = np.ones(numerator.shape, dtype=np.float32)
+        np.divide(numerator, denominator, out=result, where=denominator > 0, casting="unsafe")
+        np.minimum(result, 1.0, out=result)
+
+        maps = []
+        for (height, width), scores in zip(self.sizes, result):
+            valid_h = roi_h - height + 1
+            valid_w = roi_w - width + 1
+            maps.append(scores[:valid_h, :valid_w] if valid_h > 0 and valid_w > 0 else None)
+        return maps
+
+
+class FrameFeatures:
+    def __init__(self, image):
+        self.image = image
+        self._bgr = None
+        self._score_maps = {}
+        self._float_image = None
+        self._sq_integral = None
+        self._channel_integral = None
+        self._spectra = {}
+
+    @property
+    def bgr(self):
+        if self._bgr is None:
+            if self.image.ndim == 3 and self.image.shape[2] == 4:
+                self._bgr = cv2.cvtColor(self.image, cv2.COLOR_BGRA2BGR)
+            else:
+                self._bgr = self.image
+        return self._bgr
+
+    @property
+    def float_image(self):
+        if self._float_image is None:
+            self._float_image = self.bgr.astype(np.float32)
+        return self._float_image
+
+    def window_sq_sums(self, h, w):
+        if self._sq_integral is None:
+            image = self.float_image
+            squared = image * image
+            if squared.ndim == 3:
+                squared = squared.sum(axis=2)
+            self._sq_integral = cv2.integral(squared, sdepth=cv2.CV_64F)
+
+        integral = self._sq_integral
+        out_h = self.image.shape[0] - h + 1
+        out_w = self.image.shape[1] - w + 1
+        return (
+            integral[h:h + out_h, w:w + out_w]
+            - integral[:out_h, w:w + out_w]
+            - integral[h:h + out_h, :out_w]
+            + integral[:out_h, :out_w]
+        )
+
+    def channel_integral(self):
+        if self._channel_integral is None:
+            self._channel_integral = cv2.integral(self.image, sdepth=cv2.CV_64F)
+        return self._channel_integral
+
+    def red_dominant_mask(self, points, size=12, min_ratio=1.15, min_mean=35):
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        if points.shape[0] == 0 or self.image.ndim != 3 or self.image.shape[2] < 3:
+            return np.zeros(points.shape[0], dtype=bool)
+
+        integral = self.channel_integral()
+        height, width = self.image.shape[:2]
+        half = max(1, size // 2)
+        xs = points[:, 0]
+        ys = points[:, 1]
+        x1 = np.clip(xs - half, 0, width)
+        y1 = np.clip(ys - half, 0, height)
+        x2 = np.clip(xs + half, 0, width)
+        y2 = np.clip(ys + half, 0, height)
+
+        sums = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+        area = (y2 - y1) * (x2 - x1)
+        empty = area <= 0
+        means = sums[:, :3] / np.maximum(area, 1)[:, np.newaxis]
+
+        blue, green, red = means[:, 0], means[:, 1], means[:, 2]
+        dominant = np.maximum(green, blue) + 1e-6
+        passed = (red >= min_mean) & ((red / dominant) >= min_ratio)
+        return passed | empty
+
+    def window_channel_means(self, size):
+        integral = self.channel_integral()
+        height, width = self.image.shape[:2]
+        half = max(1, size // 2)
+        ys = np.arange(height)
+        xs = np.arange(width)
+        y1 = np.clip(ys - half, 0, height)
+        y2 = np.clip(ys + half, 0, height)
+        x1 = np.clip(xs - half, 0, width)
+        x2 = np.clip(xs + half, 0, width)
+
+        sums = (
+            integral[np.ix_(y2, x2)]
+            - integral[np.ix_(y1, x2)]
+            - integral[np.ix_(y2, x1)]
+            + integral[np.ix_(y1, x1)]
+        )
+        area = ((y2 - y1)[:, np.newaxis] * (x2 - x1)[np.newaxis, :]).astype(np.float64)
+        if sums.ndim == 3:
+            area = area[:, :, np.newaxis]
+        return (sums / area).astype(np.float32)
+
+    def score_map(self, compiled, region):
+        x1, y1, x2, y2 = region
+        for template, map_region, result in self._score_maps.get(id(compiled), []):
+            if (
+                template is compiled
+                and map_region[0] <= x1 and map_region[1] <= y1
+                and map_region[2] >= x2 and map_region[3] >= y2
+            ):
+                return map_region, result
+        return None
+
+    def add_score_map(self, compiled, region, result):
+        self._score_maps.setdefault(id(compiled), []).append((compiled, region, result))
+        return region, result
+
+    def precompute(self, fft_shape=None):
+        self.window_sq_sums(1, 1)
+        if fft_shape is not None:
+            self.spectra(fft_shape)
+
+    def dft_shape(self):
+        height, width = self.image.shape[:2]
+        return cv2.getOptimalDFTSize(height), cv2.getOptimalDFTSize(width)
+
+    def spectra(self, fft_shape):
+        spectra = self._spectra.get(fft_shape)
+        if spectra is None:
+            spectra = channel_spectra(self.float_image, fft_shape)
+            self._spectra[fft_shape] = spectra
+        return spectra
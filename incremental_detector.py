@@ -0,0 +1,219 @@
+import cv2
+import numpy as np
+import threading
+
+
+class DirtyTiles:
+    def __init__(self, grid, tile_size, frame_shape):
+        self.grid = grid
+        self.tile_size = tile_size
+        self.frame_shape = frame_shape[:2]
+        self._integral = cv2.integral(grid.astype(np.uint8))
+
+    @property
+    def ratio(self):
+        return float(np.count_nonzero(self.grid)) / self.grid.size if self.grid.size else 0.0
+
+    def any(self):
+        return bool(self.grid.any())
+
+    def windows_dirty(self, x1, y1, x2, y2):
+        # Windows are grown by one pixel so a clean window also has clean 3x3 peak neighbours.
+        rows, cols = self.grid.shape
+        tx1 = np.clip((np.asarray(x1) - 1) // self.tile_size, 0, cols - 1)
+        ty1 = np.clip((np.asarray(y1) - 1) // self.tile_size, 0, rows - 1)
+        tx2 = np.clip(np.asarray(x2) // self.tile_size, 0, cols - 1) + 1
+        ty2 = np.clip(np.asarray(y2) // self.tile_size, 0, rows - 1) + 1
+        integral = self._integral
+        counts = integral[ty2, tx2] - integral[ty1, tx2] - integral[ty2, tx1] + integral[ty1, tx1]
+        return counts > 0
+
+    def rois(self, margin_x, margin_y):
+        height, width = self.frame_shape
+        count, _, stats, _ = cv2.connectedComponentsWithStats(self.grid.astype(np.uint8), connectivity=8)
+        rois = []
+        for label in range(1, count):
+            x, y, w, h, _ = stats[label]
+            rois.append((
+                max(0, x * self.tile_size - margin_x),
+                max(0, y * self.tile_size - margin_y),
+                min(width, (x + w) * self.tile_size + margin_x),
+                min(height, (y + h) * self.tile_size + margin_y),
+            ))
+        return rois
+
+
+class IncrementalDetector:
+    def __init__(self, image_matcher, tile_size=32, diff_threshold=0, max_dirty_ratio=0.5):
+        self.image_matcher = image_matcher
+        self.tile_size = tile_size
+        self.diff_threshold = diff_threshold
+        self.max_dirty_ratio = max_dirty_ratio
+        self._states = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "frames": 0,
+            "reused": 0,
+            "incremental": 0,
+            "full": 0,
+            "dirty_tiles": 0,
+            "total_tiles": 0,
+        }
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None:
+                self._states.clear()
+                return
+            for state_key in [state_key for state_key in self._states if state_key[0] == key]:
+                del self._states[state_key]
+
+    def dirty_tiles(self, previous, frame):
+        diff = cv2.absdiff(previous, frame)
+        if diff.ndim == 3:
+            # Only colour changes count; the alpha plane of raw BGRA captures is not part of the picture.
+            diff = diff[:, :, :3].max(axis=2)
+
+        height, width = diff.shape
+        tile = self.tile_size
+        rows = -(-height // tile)
+        cols = -(-width // tile)
+        padded = np.zeros((rows * tile, cols * tile), dtype=diff.dtype)
+        padded[:height, :width] = diff
+        grid = padded.reshape(rows, tile, cols, tile).max(axis=(1, 3)) > self.diff_threshold
+        return DirtyTiles(grid, tile, frame.shape)
+
+    def find_template(self, key, screenshot, template, threshold=None, template_name="Unknown",
+                      check_color=False, pyramid_levels=0):
+        matcher = self.image_matcher
+        thresh = threshold if threshold else matcher.threshold
+        compiled = matcher.compile(template, None, template_name)
+
+        if compiled.height > screenshot.shape[0] or compiled.width > screenshot.shape[1]:
+            return matcher.find_template(screenshot, compiled, threshold=thresh, template_name=template_name)
+
+        state = self._state(key)
+        dirty = self._changes(state, screenshot, (compiled.name, pyramid_levels))
+        best = state.get("best")
+
+        if dirty is None or best is None:
+            best = matcher.best_match(screenshot, compiled, pyramid_levels)
+        elif dirty.any():
+            min_val, (x, y) = best
+            if dirty.windows_dirty(x, y, x + compiled.width, y + compiled.height):
+                best = matcher.best_match(screenshot, compiled, pyramid_levels)
+                self._count("full")
+            else:
+                rois = matcher.merge_rois(dirty.rois(compiled.width, compiled.height))
+                for x1, y1, x2, y2 in rois:
+                    roi = screenshot[y1:y2, x1:x2]
+                    if roi.shape[0] < compiled.height or roi.shape[1] < compiled.width:
+                        continue
+                    roi_val, roi_loc = matcher.best_match(roi, compiled)
+                    if roi_val < best[0]:
+                        best = (roi_val, (roi_loc[0] + x1, roi_loc[1] + y1))
+                self._count("incremental")
+        else:
+            self._count("reused")
+
+        state["best"] = best
+        return matcher.evaluate_match(screenshot, compiled, best[0], best[1], thresh, template_name, check_color)
+
+    def find_all_templates_multi(self, key, screenshot, templates, threshold=None, min_distance=15,
+                                 use_fft=True, base_threshold=None):
+        matcher = self.image_matcher
+        thresh = threshold if threshold else matcher.threshold
+        base = min(thresh, base_threshold) if base_threshold else thresh
+        templates = matcher.compile_bank(templates)
+        peaks = self._bank_peaks(key, screenshot, templates, base, use_fft)
+        results = []
+        for compiled, found in zip(templates, peaks):
+            found = found[found["confidence"] >= thresh]
+            results.append((compiled.name, matcher.suppress_matches(found, min_distance)))
+        return results
+
+    def find_all_instances(self, key, screenshot, templates, threshold=None, min_distance=15, use_fft=True):
+        matcher = self.image_matcher
+        thresh = threshold if threshold else matcher.threshold
+        templates = matcher.compile_bank(templates)
+        peaks = self._bank_peaks(key, screenshot, templates, thresh, use_fft)
+        return matcher.merge_instances(list(zip(templates, peaks)), min_distance)
+
+    def _bank_peaks(self, key, screenshot, templates, threshold, use_fft):
+        state = self._state(key)
+        signature = (tuple(compiled.name for compiled in templates), threshold)
+        dirty = self._changes(state, screenshot, signature)
+        peaks = state.get("peaks")
+
+        if dirty is None or peaks is None:
+            peaks = [found for _, found in self.image_matcher.find_template_peaks(screenshot, templates, threshold, use_fft)]
+        elif dirty.any():
+            peaks = self._update_peaks(screenshot, templates, peaks, dirty, threshold)
+            self._count("incremental")
+        else:
+            self._count("reused")
+
+        state["peaks"] = peaks
+        return peaks
+
+    def _update_peaks(self, screenshot, templates, peaks, dirty, threshold):
+        margin_x = max((compiled.width for compiled in templates), default=0) + 2
+        margin_y = max((compiled.height for compiled in templates), default=0) + 2
+        fresh = [[] for _ in templates]
+        for x1, y1, x2, y2 in self.image_matcher.merge_rois(dirty.rois(margin_x, margin_y)):
+            roi = screenshot[y1:y2, x1:x2]
+            if roi.size == 0:
+                continue
+            roi_peaks = self.image_matcher.find_template_peaks(roi, templates, threshold, use_fft=False)
+            for index, (_, found) in enumerate(roi_peaks):
+                found = found.copy()
+                found["x"] += x1
+                found["y"] += y1
+                fresh[index].append(found)
+
+        updated = []
+        for compiled, cached, found in zip(templates, peaks, fresh):
+            parts = [cached[~self._peaks_dirty(cached, compiled, dirty)]]
+            for roi_found in found:
+                parts.append(roi_found[self._peaks_dirty(roi_found, compiled, dirty)])
+            updated.append(np.concatenate(parts))
+        return updated
+
+    def _peaks_dirty(self, peaks, compiled, dirty):
+        if peaks.size == 0:
+            return np.zeros(0, dtype=bool)
+        x1 = peaks["x"] - compiled.anchor[0]
+        y1 = peaks["y"] - compiled.anchor[1]
+        return dirty.windows_dirty(x1, y1, x1 + compiled.width, y1 + compiled.height)
+
+    def _state(self, key):
+        state_key = (key, threading.get_ident())
+        with self._lock:
+            return self._states.setdefault(state_key, {})
+
+    def _changes(self, state, screenshot, signature):
+        previous = state.get("frame")
+        reusable = (
+            previous is not None
+            and previous.shape == screenshot.shape
+            and state.get("signature") == signature
+        )
+        dirty = self.dirty_tiles(previous, screenshot) if reusable else None
+
+        state["frame"] = screenshot.copy()
+        state["signature"] = signature
+        self._count("frames")
+        if dirty is None:
+            self._count("full")
+            return None
+
+        self._count("dirty_tiles", int(np.count_nonzero(dirty.grid)))
+        self._count("total_tiles", dirty.grid.size)
+        if dirty.ratio > self.max_dirty_ratio:
+            self._count("full")
+            return None
+        return dirty
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
@@ -1,6 +1,10 @@
-import win32api
-import win32con
-import win32gui
+try:
+    import win32api
+    import win32con
+    import win32gui
+except ImportError:
+    # Only the replay input sink can run without pywin32.
+    win32api = win32con = win32gui = None
 import time
 import logging
 import config
@@ -15,6 +19,11 @@ class MouseController:
         self._last_click_time = 0.0
         self._last_cursor_pos = None
         self._last_drag_time = 0.0
+        self.input_listeners = []
+
+    def _notify_input(self, action, *args):
+        for listener in self.input_listeners:
+            listener(action, *args)
 
     def _resolve_screen_position(self, x, y, relative=True, check_forbidden=True):
         if relative:
@@ -218,6 +227,7 @@ class MouseController:
 
         screen_x, screen_y = screen_pos
         self._send_click(screen_x, screen_y)
+        self._notify_input("click", x, y)
 
         logger.info(f"Clicked at ({screen_x}, {screen_y})")
 
@@ -233,6 +243,7 @@ class MouseController:
         screen_x, screen_y = screen_pos
         self._send_mouse_down(screen_x, screen_y)
         self._last_cursor_pos = (screen_x, screen_y)
+        self._notify_input("mouse_down", x, y)
         logger.info(f"Mouse down at ({screen_x}, {screen_y})")
         return True
 
@@ -244,6 +255,7 @@ class MouseController:
         screen_x, screen_y = screen_pos
         self._send_mouse_up(screen_x, screen_y)
         self._last_cursor_pos = (screen_x, screen_y)
+        self._notify_input("mouse_up", x, y)
         logger.info(f"Mouse up at ({screen_x}, {screen_y})")
         return True
     
@@ -271,6 +283,7 @@ class MouseController:
         self._send_mouse_down(screen_x, screen_y)
         time.sleep(duration)
         self._send_mouse_up(screen_x, screen_y)
+        self._notify_input("hold", x, y, duration)
         time.sleep(self.click_delay)
         return True
     
@@ -327,6 +340,7 @@ class MouseController:
         self._ensure_cursor_at_target(int(screen_to_x), int(screen_to_y))
         self._correct_cursor_position(int(screen_to_x), int(screen_to_y))
         self._last_cursor_pos = (int(screen_to_x), int(screen_to_y))
+        self._notify_input("drag", from_x, from_y, to_x, to_y, duration)
         logger.info(f"Dragged from ({from_x}, {from_y}) to ({to_x}, {to_y})")
         settle_delay = getattr(config, "SCROLL_SETTLE_DELAY", 0.0)
         time.sleep(settle_delay if settle_delay > 0 else self.click_delay)
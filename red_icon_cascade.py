@@ -0,0 +1,88 @@
+import numpy as np
+
+from vision_service import match_red_icon_bank
+
+
+def cascade_order(names, stats, voter_sets=()):
+    costs = [
+        stats[name]["full_time"] / stats[name]["full_scans"]
+        for name in names
+        if name in stats and stats[name]["full_scans"] > 0
+    ]
+    mean_cost = sum(costs) / len(costs) if costs else 0.0
+
+    def weight(name):
+        entry = stats.get(name)
+        if entry is None or entry["full_scans"] <= 0:
+            return 0.0
+        precision = (entry["full_votes"] + 1) / (entry["full_hits"] + 2)
+        cost = entry["full_time"] / entry["full_scans"]
+        relative_cost = cost / mean_cost if mean_cost > 0 else 1.0
+        return precision / max(relative_cost, 0.1)
+
+    def score(name):
+        entry = stats.get(name)
+        if entry is None or entry["full_scans"] <= 0:
+            return -1.0
+        return entry["full_votes"] / entry["full_scans"] * weight(name)
+
+    # Greedy set cover: every recorded detection needs one first-stage voter to become a candidate.
+    order = []
+    remaining = [name for name in names]
+    uncovered = [set(voters) for voters in voter_sets]
+    while uncovered:
+        best = max(
+            remaining,
+            key=lambda name: (sum(name in voters for voters in uncovered) * weight(name), -names.index(name)),
+            default=None,
+        )
+        if best is None or not any(best in voters for voters in uncovered):
+            break
+        order.append(best)
+        remaining.remove(best)
+        uncovered = [voters for voters in uncovered if best not in voters]
+    cover_size = len(order)
+
+    ranked = sorted(enumerate(remaining), key=lambda item: (-score(item[1]), item[0]))
+    return order + [name for _, name in ranked], cover_size
+
+
+def cascade_red_icon_bank(image_matcher, screenshot, bank, order, threshold, min_matches, stage_size,
+                          names=None, first_stage=None, gate=None, padding=8, proximity=10):
+    height, width = screenshot.shape[:2]
+    names = names or bank.names()
+    first, rest = list(order[:stage_size]), list(order[stage_size:])
+
+    if first_stage is None:
+        def first_stage(stage_bank):
+            return match_red_icon_bank(image_matcher, screenshot, stage_bank, threshold)
+
+    def collect(bank_results):
+        found = image_matcher.collect_hits(bank_results, names)
+        return gate(screenshot, found) if gate is not None else found
+
+    hits = collect(first_stage(bank.subset(first)))
+    evaluated = list(first)
+
+    reach = bank.max_extent() + proximity + padding
+    for index, name in enumerate(rest):
+        remaining = len(rest) - index
+        clusters, _ = image_matcher.aggregate_votes(hits, proximity)
+        votes = clusters["votes"]
+        pending = clusters[(votes < min_matches) & (votes + remaining >= min_matches)]
+        if pending.size == 0:
+            break
+        rois = image_matcher.merge_rois([
+            (max(0, x - reach), max(0, y - reach), min(width, x + reach), min(height, y + reach))
+            for x, y in zip(pending["x"].tolist(), pending["y"].tolist())
+        ])
+        evaluated.append(name)
+        hits = np.concatenate([hits, collect(image_matcher.find_all_templates_in_rois(
+            screenshot,
+            bank.subset([name]),
+            rois,
+            threshold=threshold,
+            min_distance=80,
+        ))])
+
+    return hits, evaluated
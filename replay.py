@@ -0,0 +1,109 @@
+"""
+Recorded session replay
+
+Usage:
+    python replay.py SESSION [--steps N] [--realtime] [--quiet]
+
+Sessions are recorded into config.SCREENSHOTS_DIR when config.SAVE_SCREENSHOTS
+is enabled. The replay drives EatventureBot step by step with the recorded
+frames and a fake input sink, so the full detection pipeline runs without the
+game or Windows. By default every capture takes the next recorded frame and
+the capture cache is off, so the same session always replays the same steps
+and inputs. The live bot may have reused a cached frame where the replay reads
+a new one, so inputs can drift from a recording made with a non-zero
+CAPTURE_CACHE_TTL or with the capture thread on. --realtime instead serves the
+frame that was on screen at the same offset into the recording. Replay stops
+once the last frame has been served. Learned vision state is kept in a
+temporary directory so a replay neither reads nor changes the live bot's files.
+
+The report lists step timings per state and compares the issued inputs with
+the recorded ones.
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+import config
+from session_recorder import ReplayFrameSource, ReplayInputSink, ReplayWindow
+
+
+def input_key(action, args):
+    return (action,) + tuple(round(value, 3) if isinstance(value, float) else value for value in args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the bot")
+    parser.add_argument("session")
+    parser.add_argument("--steps", type=int, default=0)
+    parser.add_argument("--realtime", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format="%(name)s - %(message)s")
+    state_dir = Path(tempfile.mkdtemp(prefix="eatventure-replay-"))
+    config.SAVE_SCREENSHOTS = False
+    config.TELEGRAM_ENABLED = False
+    config.VISION_SERVICE_ENABLED = False
+    config.CAPTURE_THREAD_ENABLED = args.realtime
+    if not args.realtime:
+        # The wall-clock capture cache would decide whether a capture takes the next frame.
+        config.CAPTURE_CACHE_TTL = 0
+    config.AI_VISION_STATE_FILE = str(state_dir / "vision_state.json")
+    config.LOCATION_PRIORS_FILE = str(state_dir / "location_priors.json")
+    config.TEMPLATE_STATS_FILE = str(state_dir / "template_stats.json")
+
+    from bot import EatventureBot
+
+    source = ReplayFrameSource(args.session, slots=config.CAPTURE_RING_SLOTS, realtime=args.realtime)
+    sink = ReplayInputSink()
+    bot = EatventureBot(window_capture=ReplayWindow(source), mouse_controller=sink, frame_source=source)
+    if bot.frame_publisher is not None:
+        bot.frame_publisher.start()
+
+    step_times = defaultdict(list)
+    steps = 0
+    start = time.perf_counter()
+    try:
+        while (not args.steps or steps < args.steps) and not source.exhausted:
+            state = bot.state_machine.get_state_name()
+            step_start = time.perf_counter()
+            try:
+                bot.step()
+            except EOFError:
+                break
+            step_times[state].append(time.perf_counter() - step_start)
+            steps += 1
+    finally:
+        bot.stop()
+    elapsed = time.perf_counter() - start
+
+    reader = source.reader
+    print(f"\nReplayed {source.index + 1}/{len(reader)} frames in {steps} steps, {elapsed:.2f}s")
+    print(f"{'state':<24} {'steps':>6} {'mean ms':>9} {'p95 ms':>9}")
+    for state, times in sorted(step_times.items()):
+        times = np.array(times) * 1000
+        print(f"{state:<24} {len(times):6d} {times.mean():9.2f} {np.percentile(times, 95):9.2f}")
+
+    recorded = [input_key(event["action"], event["args"]) for event in reader.inputs]
+    replayed = [input_key(action, args) for action, *args in sink.actions]
+    mismatch = next(
+        (index for index, (a, b) in enumerate(zip(recorded, replayed)) if a != b),
+        None if len(recorded) == len(replayed) else min(len(recorded), len(replayed)),
+    )
+    print(f"\nInputs: {len(recorded)} recorded, {len(replayed)} replayed")
+    if mismatch is None:
+        print("Replayed inputs match the recording")
+    else:
+        print(f"First difference at input {mismatch}: "
+              f"recorded {recorded[mismatch] if mismatch < len(recorded) else None}, "
+              f"replayed {replayed[mismatch] if mismatch < len(replayed) else None}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import config
+from frame_source import FrameSource
+from mouse_controller import MouseController
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRecorder:
+    MAGIC = b"EVSESSION1\n"
+    RECORD = struct.Struct("<BIdQ")
+    SHAPE = struct.Struct("<HHB")
+    KEYFRAME = 1
+    DELTA = 2
+    STATE = 3
+    INPUT = 4
+
+    def __init__(self, path, codec="delta", keyframe_interval=50, queue_size=64):
+        if codec not in ("delta", "png"):
+            raise ValueError(f"Unknown session codec: {codec}")
+        self.path = Path(path)
+        self.codec = codec
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.queue_size = queue_size
+        self.frames = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self._sequence = 0
+        self._queue = queue.Queue()
+        self._handle = None
+        self._previous = None
+        self._since_keyframe = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def record_frame(self, frame, timestamp=None):
+        # Frames are encoded on the writer thread. The queued copy keeps a slow writer from pinning capture buffers.
+        if self._queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(f"Session writer is behind, {self.dropped} frames dropped")
+            return
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        self._queue.put((None, sequence, time.monotonic() if timestamp is None else timestamp, frame.copy()))
+
+    def record_state(self, state, **details):
+        self._record_event(self.STATE, dict(details, state=state))
+
+    def record_input(self, action, *args):
+        self._record_event(self.INPUT, {"action": action, "args": list(args)})
+
+    def close(self):
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=10.0)
+        if self._handle is not None:
+            logger.info(
+                f"Session saved to {self.path}: {self.frames} frames, "
+                f"{self.bytes_written / 1e6:.1f} MB, {self.dropped} dropped"
+            )
+
+    def _record_event(self, kind, payload):
+        with self._lock:
+            sequence = self._sequence
+        self._queue.put((kind, sequence, time.monotonic(), json.dumps(payload).encode("utf-8")))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, sequence, timestamp, payload = item
+            try:
+                if kind is None:
+                    kind, payload = self._encode_frame(payload)
+                    self.frames += 1
+                self._write(kind, sequence, timestamp, payload)
+            except (OSError, cv2.error) as e:
+                logger.warning(f"Could not record session data: {e}")
+            del item, payload
+
+        if self._handle is not None:
+            self._handle.close()
+
+    def _encode_frame(self, frame):
+        previous = self._previous
+        self._previous = frame
+        if (
+            self.codec == "delta"
+            and previous is not None
+            and previous.shape == frame.shape
+            and self._since_keyframe < self.keyframe_interval
+        ):
+            self._since_keyframe += 1
+            # Consecutive frames are mostly identical, so the wrapped difference is mostly zeros.
+            delta = np.subtract(frame, previous, dtype=np.uint8)
+            channels = frame.shape[2] if frame.ndim == 3 else 0
+            return self.DELTA, self.SHAPE.pack(frame.shape[0], frame.shape[1], channels) + zlib.compress(delta, 1)
+
+        self._since_keyframe = 1
+        ok, encoded = cv2.imencode(".png", frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if not ok:
+            raise cv2.error("PNG encoding failed")
+        return self.KEYFRAME, encoded.tobytes()
+
+    def _write(self, kind, sequence, timestamp, payload):
+        if self._handle is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = open(self.path, "ab")
+            if self._handle.tell() == 0:
+                self._handle.write(self.MAGIC)
+        self._handle.write(self.RECORD.pack(kind, len(payload), timestamp, sequence))
+        self._handle.write(payload)
+        self.bytes_written += self.RECORD.size + len(payload)
+        if kind != self.DELTA:
+            self._handle.flush()
+
+
+class SessionReader:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        # mmap cannot map an empty file, so anything shorter than the header is rejected first.
+        if os.fstat(self._file.fileno()).st_size < len(SessionRecorder.MAGIC):
+            self._file.close()
+            raise ValueError(f"{self.path} is not a recorded session")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(SessionRecorder.MAGIC)] != SessionRecorder.MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a recorded session")
+
+        self._frames = []
+        self._keyframes = []
+        self.states = []
+        self.inputs = []
+        self._index()
+        self.start_time = self._frames[0][2] if self._frames else 0.0
+        self.timestamps = [timestamp - self.start_time for _, _, timestamp, _ in self._frames]
+        self._cached = None
+
+    def __len__(self):
+        return len(self._frames)
+
+    def frame(self, index):
+        keyframe = self._keyframes[bisect.bisect_right(self._keyframes, index) - 1]
+        if self._cached is not None and keyframe <= self._cached[0] <= index:
+            start, image = self._cached
+        else:
+            start, image = keyframe, self._decode_keyframe(keyframe)
+        for position in range(start + 1, index + 1):
+            image = self._apply_delta(position, image)
+        self._cached = (index, image)
+        return image
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _index(self):
+        record = SessionRecorder.RECORD
+        offset = len(SessionRecorder.MAGIC)
+        size = len(self._map)
+        while offset + record.size <= size:
+            kind, length, timestamp, sequence = record.unpack_from(self._map, offset)
+            start = offset + record.size
+            if start + length > size:
+                logger.warning(f"Ignoring truncated record at the end of {self.path}")
+                break
+            if kind == SessionRecorder.KEYFRAME:
+                self._keyframes.append(len(self._frames))
+                self._frames.append((start, length, timestamp, sequence))
+            elif kind == SessionRecorder.DELTA and self._keyframes:
+                self._frames.append((start, length, timestamp, sequence))
+            elif kind in (SessionRecorder.STATE, SessionRecorder.INPUT):
+                event = json.loads(bytes(self._map[start:start + length]).decode("utf-8"))
+                event["timestamp"] = timestamp
+                event["frame"] = sequence
+                (self.states if kind == SessionRecorder.STATE else self.inputs).append(event)
+            offset = start + length
+
+    def _payload(self, index):
+        start, length, _, _ = self._frames[index]
+        return np.frombuffer(self._map, dtype=np.uint8, count=length, offset=start)
+
+    def _decode_keyframe(self, index):
+        image = cv2.imdecode(self._payload(index), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError(f"Corrupt keyframe {index} in {self.path}")
+        return image
+
+    def _apply_delta(self, index, previous):
+        payload = self._payload(index)
+        height, width, channels = SessionRecorder.SHAPE.unpack_from(payload)
+        shape = (height, width, channels) if channels else (height, width)
+        delta = np.frombuffer(zlib.decompress(payload[SessionRecorder.SHAPE.size:]), dtype=np.uint8).reshape(shape)
+        return np.add(previous, delta, dtype=np.uint8)
+
+
+class RecordingFrameSource(FrameSource):
+    def __init__(self, source, recorder, region_frame_interval=10):
+        super().__init__(slots=1)
+        self.source = source
+        self.recorder = recorder
+        self.ring = source.ring
+        self.region_frame_interval = max(1, region_frame_interval)
+        self._region_polls = 0
+
+    def grab(self, max_y):
+        # Every recorded frame is full height, so the delta codec is not reset by the callers' different crops.
+        frame = self.source.grab(None)
+        self.recorder.record_frame(frame)
+        return frame if max_y is None else frame[:max_y]
+
+    def grab_regions(self, regions):
+        crops = self.source.grab_regions(regions)
+        # Region polls are too frequent to record each one; a full frame every few polls keeps the session in step.
+        self._region_polls += 1
+        if self._region_polls % self.region_frame_interval == 0:
+            self.recorder.record_frame(self.source.grab(None))
+        return crops
+
+    def close(self):
+        self.source.close()
+
+
+class ReplayFrameSource(FrameSource):
+    def __init__(self, path, slots=16, realtime=False, loop=False):
+        super().__init__(slots)
+        self.reader = SessionReader(path)
+        if not len(self.reader):
+            raise ValueError(f"{path} holds no frames")
+        self.realtime = realtime
+        self.loop = loop
+        self.index = -1
+        self._started = None
+        logger.info(f"Replaying {len(self.reader)} frames from {path}")
+
+    @property
+    def exhausted(self):
+        return not self.loop and self.index >= len(self.reader) - 1
+
+    def grab(self, max_y):
+        self.index = self._next_index()
+        image = self.reader.frame(self.index)
+        if max_y is not None:
+            image = image[:max_y]
+        frame = self.ring.acquire(image.shape)
+        np.copyto(frame, image)
+        return frame
+
+    def _next_index(self):
+        count = len(self.reader)
+        if self.realtime:
+            # Serve whichever frame was on screen at the same offset into the recording.
+            now = time.monotonic()
+            if self._started is None:
+                self._started = now
+            elapsed = now - self._started
+            if elapsed > self.reader.timestamps[-1] + config.CAPTURE_THREAD_TIMEOUT:
+                if not self.loop:
+                    raise EOFError("Session replay finished")
+                self._started = now
+                elapsed = 0.0
+            return max(0, bisect.bisect_right(self.reader.timestamps, elapsed) - 1)
+
+        if self.index + 1 >= count:
+            if not self.loop:
+                raise EOFError("Session replay finished")
+            return 0
+        return self.index + 1
+
+    def close(self):
+        self.reader.close()
+
+
+class ReplayWindow:
+    def __init__(self, frame_source):
+        self.frame_source = frame_source
+        self.hwnd = None
+
+    def is_window_active(self):
+        return not self.frame_source.exhausted
+
+
+class ReplayInputSink(MouseController):
+    def __init__(self, click_delay=0.0):
+        super().__init__(None, click_delay)
+        self.actions = []
+        self.input_listeners.append(lambda action, *args: self.actions.append((action,) + args))
+
+    def get_window_position(self):
+        return 0, 0
+
+    def move_to(self, x, y, relative=True):
+        self._last_cursor_pos = (int(x), int(y))
+
+    def _send_click(self, screen_x, screen_y, down_up_delay=None):
+        self._last_click_time = time.monotonic()
+
+    def _send_mouse_down(self, screen_x, screen_y):
+        pass
+
+    def _send_mouse_up(self, screen_x, screen_y):
+        self._last_click_time = time.monotonic()
+
+    def hold_at(self, x, y, duration=None, relative=True):
+        if self._resolve_screen_position(x, y, relative=relative) is None:
+            return False
+        self._notify_input("hold", x, y, config.UPGRADE_HOLD_DURATION if duration is None else duration)
+        return True
+
+    def drag(self, from_x, from_y, to_x, to_y, duration=0.3, relative=True):
+        self._notify_input("drag", from_x, from_y, to_x, to_y, duration)
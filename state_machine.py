@@ -24,6 +24,7 @@ class StateMachine:
         self.previous_state = None
         self.state_handlers = {}
         self.priority_resolver = None
+        self.transition_listeners = []
         logger.info(f"State machine initialized in state: {initial_state.name}")
     
     def register_handler(self, state, handler):
@@ -39,11 +40,16 @@ class StateMachine:
             logger.info(f"State transition: {self.current_state.name} -> {new_state.name}")
             self.previous_state = self.current_state
             self.current_state = new_state
+            for listener in self.transition_listeners:
+                listener(self.previous_state, new_state)
     
     def update(self):
         if self.priority_resolver is not None:
             try:
                 priority_state = self.priority_resolver(self.current_state)
+            except EOFError:
+                # A finite frame source ran out; the caller stops rather than logging a failure.
+                raise
             except Exception:
                 logger.exception("Priority resolver failed")
                 priority_state = None
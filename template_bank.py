@@ -0,0 +1,160 @@
+import cv2
+import numpy as np
+
+
+def channel_spectra(image, fft_shape):
+    if image.ndim == 2:
+        image = image[:, :, np.newaxis]
+    h, w, channels = image.shape
+    spectra = []
+    for channel in range(channels):
+        padded = np.zeros(fft_shape, dtype=np.float32)
+        padded[:h, :w] = image[:, :, channel]
+        spectra.append(cv2.dft(padded))
+    return spectra
+
+
+class CompiledTemplate:
+    PYRAMID_LEVELS = 2
+    PYRAMID_MIN_SIZE = 8
+    HISTOGRAM_BINS = 32
+
+    def __init__(self, name, image, mask=None):
+        full_h, full_w = image.shape[:2]
+        crop_x, crop_y = 0, 0
+        if mask is not None:
+            mask = np.where(mask > 0, 255, 0).astype(np.uint8)
+            points = cv2.findNonZero(mask)
+            if points is not None:
+                crop_x, crop_y, crop_w, crop_h = cv2.boundingRect(points)
+                image = image[crop_y:crop_y + crop_h, crop_x:crop_x + crop_w]
+                mask = mask[crop_y:crop_y + crop_h, crop_x:crop_x + crop_w]
+            if cv2.countNonZero(mask) == mask.size:
+                mask = None
+
+        self.name = name
+        self.image = np.ascontiguousarray(image)
+        self.mask = None if mask is None else np.ascontiguousarray(mask)
+        self.height, self.width = self.image.shape[:2]
+        self.anchor = (full_w // 2 - crop_x, full_h // 2 - crop_y)
+        self.gray = self._to_gray(self.image)
+        self.sq_sum = float(np.sum(np.square(self.image, dtype=np.float64)))
+        self.histograms = self._build_histograms()
+        self.pyramid = self._build_pyramid()
+        self._spectra = {}
+
+    @classmethod
+    def from_arrays(cls, name, arrays, anchor, sq_sum):
+        template = cls.__new__(cls)
+        template.name = name
+        template.image = arrays["image"]
+        template.mask = arrays.get("mask")
+        template.height, template.width = template.image.shape[:2]
+        template.anchor = tuple(anchor)
+        template.gray = arrays["gray"]
+        template.sq_sum = sq_sum
+        template.histograms = []
+        while f"histogram_{len(template.histograms)}" in arrays:
+            template.histograms.append(arrays[f"histogram_{len(template.histograms)}"])
+        template.pyramid = []
+        while f"pyramid_{len(template.pyramid)}_image" in arrays:
+            level = len(template.pyramid)
+            template.pyramid.append((arrays[f"pyramid_{level}_image"], arrays.get(f"pyramid_{level}_mask")))
+        template._spectra = {}
+        return template
+
+    def to_arrays(self):
+        arrays = {"image": self.image, "gray": self.gray}
+        if self.mask is not None:
+            arrays["mask"] = self.mask
+        for index, hist in enumerate(self.histograms):
+            arrays[f"histogram_{index}"] = hist
+        for level, (image, mask) in enumerate(self.pyramid):
+            arrays[f"pyramid_{level}_image"] = image
+            if mask is not None:
+                arrays[f"pyramid_{level}_mask"] = mask
+        return arrays
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def _to_gray(self, image):
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    def _build_histograms(self):
+        if self.image.ndim == 2:
+            return []
+        histograms = []
+        for channel in range(self.image.shape[2]):
+            hist = cv2.calcHist([self.image], [channel], self.mask, [self.HISTOGRAM_BINS], [0, 256])
+            cv2.normalize(hist, hist, 0, 1, cv2.NORM_MINMAX)
+            histograms.append(hist)
+        return histograms
+
+    def _build_pyramid(self):
+        levels = []
+        image = self.image
+        mask = self.mask
+        for _ in range(self.PYRAMID_LEVELS):
+            if min(image.shape[0], image.shape[1]) // 2 < self.PYRAMID_MIN_SIZE:
+                break
+            image = cv2.pyrDown(image)
+            if mask is not None:
+                mask = cv2.pyrDown(mask)
+                mask[mask > 0] = 255
+            levels.append((image, mask))
+        return levels
+
+    def pyramid_level(self, levels):
+        levels = min(levels, len(self.pyramid))
+        if levels <= 0:
+            return 0, self.image, self.mask
+        image, mask = self.pyramid[levels - 1]
+        return levels, image, mask
+
+    def spectra(self, fft_shape):
+        spectra = self._spectra.get(fft_shape)
+        if spectra is None:
+            spectra = channel_spectra(self.image, fft_shape)
+            self._spectra[fft_shape] = spectra
+        return spectra
+
+
+class TemplateBank:
+    def __init__(self, templates=None):
+        self._templates = {}
+        for template in templates or []:
+            self.add(template)
+
+    def add(self, template):
+        self._templates[template.name] = template
+
+    def subset(self, names):
+        return TemplateBank(self._templates[name] for name in names if name in self._templates)
+
+    def names(self):
+        return list(self._templates.keys())
+
+    def get(self, name, default=None):
+        return self._templates.get(name, default)
+
+    def max_extent(self):
+        return max((max(template.width, template.height) for template in self), default=0)
+
+    def __getitem__(self, name):
+        return self._templates[name]
+
+    def __contains__(self, name):
+        return name in self._templates
+
+    def __iter__(self):
+        return iter(self._templates.values())
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __bool__(self):
+        return bool(self._templates)
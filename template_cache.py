@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from template_bank import CompiledTemplate
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateCache:
+    VERSION = 1
+    INDEX_FILE = "index.json"
+    ALIGNMENT = 64
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self._entries = {}
+        self._blob = None
+        self._blob_name = None
+        self._fresh = {}
+        self._lock = threading.Lock()
+
+    def signature(self):
+        return [
+            self.VERSION,
+            CompiledTemplate.PYRAMID_LEVELS,
+            CompiledTemplate.PYRAMID_MIN_SIZE,
+            CompiledTemplate.HISTOGRAM_BINS,
+        ]
+
+    def stat_key(self, path):
+        try:
+            stat = Path(path).stat()
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def load(self):
+        index_path = self.cache_dir / self.INDEX_FILE
+        if not index_path.exists():
+            return False
+        try:
+            with open(index_path, "r", encoding="utf-8") as handle:
+                index = json.load(handle)
+            if index.get("signature") != self.signature():
+                logger.info("Template cache format changed, rebuilding")
+                return False
+            blob = np.load(self.cache_dir / index["blob"], mmap_mode="r")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable template cache: {e}")
+            return False
+
+        with self._lock:
+            self._entries = index.get("templates", {})
+            self._blob = blob
+            self._blob_name = index["blob"]
+        return True
+
+    def get(self, path, stat_key):
+        with self._lock:
+            entry = self._entries.get(str(path))
+            if entry is None or stat_key is None or entry["stat"] != stat_key:
+                return None
+            arrays = {
+                key: self._array(offset, shape, dtype)
+                for key, (offset, shape, dtype) in entry["arrays"].items()
+            }
+        return CompiledTemplate.from_arrays(entry["name"], arrays, entry["anchor"], entry["sq_sum"])
+
+    def put(self, path, stat_key, compiled):
+        if stat_key is None:
+            return
+        with self._lock:
+            self._fresh[str(path)] = (stat_key, compiled)
+
+    def save(self):
+        with self._lock:
+            if not self._fresh:
+                return False
+            templates = {}
+            for path, entry in self._entries.items():
+                if path in self._fresh or self.stat_key(path) != entry["stat"]:
+                    continue
+                arrays = {
+                    key: self._array(offset, shape, dtype)
+                    for key, (offset, shape, dtype) in entry["arrays"].items()
+                }
+                templates[path] = (entry["stat"], entry["name"], entry["anchor"], entry["sq_sum"], arrays)
+            for path, (stat_key, compiled) in self._fresh.items():
+                templates[path] = (stat_key, compiled.name, list(compiled.anchor), compiled.sq_sum, compiled.to_arrays())
+
+            try:
+                self._write(templates)
+            except OSError as e:
+                logger.warning(f"Could not write template cache: {e}")
+                return False
+            self._fresh.clear()
+        logger.info(f"Template cache updated with {len(templates)} templates")
+        return True
+
+    def _array(self, offset, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        return self._blob[offset:offset + size].view(dtype).reshape(shape)
+
+    def _write(self, templates):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        layout = {}
+        offset = 0
+        for path, (_, _, _, _, arrays) in templates.items():
+            layout[path] = {}
+            for key, array in arrays.items():
+                layout[path][key] = [offset, list(array.shape), array.dtype.str]
+                offset += -(-array.nbytes // self.ALIGNMENT) * self.ALIGNMENT
+
+        blob_name = f"templates-{uuid.uuid4().hex[:12]}.npy"
+        blob = np.lib.format.open_memmap(
+            self.cache_dir / blob_name,
+            mode="w+",
+            dtype=np.uint8,
+            shape=(max(offset, 1),),
+        )
+        for path, (_, _, _, _, arrays) in templates.items():
+            for key, array in arrays.items():
+                start = layout[path][key][0]
+                blob[start:start + array.nbytes] = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+        blob.flush()
+        del blob
+
+        index = {
+            "signature": self.signature(),
+            "blob": blob_name,
+            "templates": {
+                path: {
+                    "stat": stat_key,
+                    "name": name,
+                    "anchor": list(anchor),
+                    "sq_sum": float(sq_sum),
+                    "arrays": layout[path],
+                }
+                for path, (stat_key, name, anchor, sq_sum, _) in templates.items()
+            },
+        }
+        temp_index = self.cache_dir / f"{self.INDEX_FILE}.{os.getpid()}.tmp"
+        with open(temp_index, "w", encoding="utf-8") as handle:
+            json.dump(index, handle)
+        os.replace(temp_index, self.cache_dir / self.INDEX_FILE)
+
+        self._entries = index["templates"]
+        self._blob = np.load(self.cache_dir / blob_name, mmap_mode="r")
+        old_blob = self._blob_name
+        self._blob_name = blob_name
+        self._remove_stale_blobs(keep={blob_name, old_blob})
+
+    def _remove_stale_blobs(self, keep):
+        for blob_path in self.cache_dir.glob("templates-*.npy"):
+            if blob_path.name in keep:
+                continue
+            try:
+                blob_path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,180 @@
+"""
+Offline red icon template deduplication
+
+Usage:
+    python template_dedup.py [--prefix NAME] [--similarity S] [--frames DIR] [--count N] [--output FILE]
+
+Every pair of templates is cross-matched: each template is searched inside the
+other (padded by its own size so small offsets still line up) and the pair
+score is the lower of the two directions. Templates are grouped by complete
+linkage, so every member of a cluster matches every other member at or above
+--similarity, and the member closest to the rest of its cluster is kept as the
+representative.
+
+The recall report replays the full bank and each reduced bank over a frame
+corpus (config.SCREENSHOTS_DIR, or synthetic frames when it is empty) with the
+bot's voting rule and counts how many full-bank detections each merge keeps.
+"""
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+import config
+from image_matcher import ImageMatcher
+from vision_corpus import load_frames, load_templates, recall, red_icon_hits, vote
+from vision_service import match_red_icon_bank
+
+
+def cross_match(image_matcher, bank):
+    names = bank.names()
+    scores = np.eye(len(names), dtype=np.float32)
+    for i, name in enumerate(names):
+        for j, other in enumerate(names):
+            if i == j:
+                continue
+            template = bank[name]
+            target = bank[other].image
+            padded = cv2.copyMakeBorder(
+                target,
+                template.height,
+                template.height,
+                template.width,
+                template.width,
+                cv2.BORDER_REPLICATE,
+            )
+            min_val, _ = image_matcher.best_match(padded, template)
+            scores[i, j] = 1.0 - min_val
+    return names, np.minimum(scores, scores.T)
+
+
+def cluster(names, scores, similarity):
+    clusters = [[index] for index in range(len(names))]
+    while True:
+        best = None
+        for a in range(len(clusters)):
+            for b in range(a + 1, len(clusters)):
+                linkage = scores[np.ix_(clusters[a], clusters[b])].min()
+                if linkage >= similarity and (best is None or linkage > best[0]):
+                    best = (linkage, a, b)
+        if best is None:
+            break
+        _, a, b = best
+        clusters[a] = clusters[a] + clusters.pop(b)
+
+    result = []
+    for members in clusters:
+        if len(members) == 1:
+            representative = members[0]
+        else:
+            cohesion = scores[np.ix_(members, members)].sum(axis=1)
+            representative = members[int(np.argmax(cohesion))]
+        result.append((names[representative], sorted(names[index] for index in members)))
+    return sorted(result, key=lambda entry: entry[1])
+
+
+def detect(image_matcher, frames, bank, threshold, min_matches):
+    names = bank.names()
+    start = time.perf_counter()
+    found = [
+        vote(
+            image_matcher,
+            red_icon_hits(image_matcher, frame, match_red_icon_bank(image_matcher, frame, bank, threshold), names),
+            names,
+            min_matches,
+        )
+        for frame in frames
+    ]
+    elapsed = (time.perf_counter() - start) / max(1, len(frames))
+    return found, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate templates and report the recall cost of merging them")
+    parser.add_argument("--prefix", default="RedIcon")
+    parser.add_argument("--similarity", type=float, default=0.9)
+    parser.add_argument("--threshold", type=float, default=config.RED_ICON_THRESHOLD)
+    parser.add_argument("--min-matches", type=int, default=config.RED_ICON_MIN_MATCHES)
+    parser.add_argument("--frames", default=config.SCREENSHOTS_DIR)
+    parser.add_argument("--count", type=int, default=16)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD)
+    templates = load_templates(image_matcher)
+    bank = templates.subset(sorted(name for name in templates.names() if name.startswith(args.prefix)))
+    if len(bank) < 2:
+        print(f"Need at least two templates starting with {args.prefix!r}, found {len(bank)}")
+        return
+
+    names, scores = cross_match(image_matcher, bank)
+    print(f"Pairwise cross-match scores ({len(names)} templates, pair score = worse direction):")
+    pairs = sorted(
+        ((float(scores[i, j]), names[i], names[j]) for i in range(len(names)) for j in range(i + 1, len(names))),
+        reverse=True,
+    )
+    for score, a, b in pairs[:10]:
+        print(f"  {a:<14} {b:<14} {score:.3f}")
+
+    clusters = cluster(names, scores, args.similarity)
+    representatives = [representative for representative, _ in clusters]
+    merges = [(representative, members) for representative, members in clusters if len(members) > 1]
+    print(f"\n{len(clusters)} clusters at similarity >= {args.similarity}:")
+    for representative, members in clusters:
+        print(f"  keep {representative:<14} <- {', '.join(members)}")
+
+    frames = load_frames(args.frames, args.count, templates)
+    reference, full_time = detect(image_matcher, frames, bank, args.threshold, args.min_matches)
+    print(f"\nRecall against the full bank over {len(frames)} frames "
+          f"({sum(len(found) for found in reference)} detections, min matches {args.min_matches}):")
+    print(f"  {'full bank':<40} recall 1.000  extra   0  {full_time * 1000:7.2f} ms/frame  {len(bank)} templates")
+
+    report = []
+    for representative, members in merges:
+        kept = [name for name in names if name not in members or name == representative]
+        found, elapsed = detect(image_matcher, frames, bank.subset(kept), args.threshold, args.min_matches)
+        merge_recall, extra = recall(reference, found)
+        label = f"merge {', '.join(members)}"
+        print(f"  {label[:40]:<40} recall {merge_recall:.3f}  extra {extra:3d}  "
+              f"{elapsed * 1000:7.2f} ms/frame  {len(kept)} templates")
+        report.append({
+            "representative": representative,
+            "members": members,
+            "recall": merge_recall,
+            "extra": extra,
+            "ms_per_frame": elapsed * 1000,
+        })
+
+    found, elapsed = detect(image_matcher, frames, bank.subset(representatives), args.threshold, args.min_matches)
+    reduced_recall, extra = recall(reference, found)
+    print(f"  {'all merges':<40} recall {reduced_recall:.3f}  extra {extra:3d}  "
+          f"{elapsed * 1000:7.2f} ms/frame  {len(representatives)} templates")
+    print(f"\nReduced set: {', '.join(representatives)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(
+                {
+                    "similarity": args.similarity,
+                    "threshold": args.threshold,
+                    "min_matches": args.min_matches,
+                    "frames": len(frames),
+                    "names": names,
+                    "scores": scores.round(4).tolist(),
+                    "clusters": [{"representative": rep, "members": members} for rep, members in clusters],
+                    "reduced": representatives,
+                    "merges": report,
+                    "reduced_recall": reduced_recall,
+                    "reduced_extra": extra,
+                },
+                handle,
+                indent=2,
+            )
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
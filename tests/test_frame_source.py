@@ -0,0 +1,284 @@
+import ctypes
+
+import cv2
+import numpy as np
+import pytest
+
+from frame_source import (CaptureRing, FileFrameSource, FramePublisher, FrameSource, SyntheticFrameSource, clip_regions,
+                          crop_regions)
+
+SHAPE = (10, 20, 4)
+
+
+def base_address(frame):
+    return frame.ctypes.data - frame.ctypes.data % CaptureRing.ALIGNMENT
+
+
+class CtypesAllocator:
+    def __init__(self):
+        self.buffers = {}
+        self.released = []
+
+    def allocate(self, size):
+        buffer = (ctypes.c_ubyte * size)()
+        self.buffers[ctypes.addressof(buffer)] = buffer
+        return buffer
+
+    def release(self, buffer):
+        address = ctypes.addressof(buffer)
+        assert address in self.buffers
+        self.released.append(address)
+
+    def owner(self, frame):
+        address = frame.ctypes.data
+        for start, buffer in self.buffers.items():
+            if start <= address < start + ctypes.sizeof(buffer):
+                return start
+        return None
+
+
+def fill(ring, count):
+    return [ring.acquire(SHAPE) for _ in range(count)]
+
+
+@pytest.mark.parametrize("derive", [
+    lambda frame: frame,
+    lambda frame: frame[2:5],
+    lambda frame: frame[:, ::2, :3],
+    lambda frame: np.asarray(frame),
+    lambda frame: frame.reshape(-1),
+    lambda frame: frame.view(np.uint32),
+])
+def test_held_view_keeps_slot_in_use(derive):
+    ring = CaptureRing(3)
+    frames = fill(ring, 3)
+    held = derive(frames[0])
+    held_address = base_address(frames[0])
+    frames[0].fill(7)
+    del frames
+
+    assert ring.in_use() == 1
+    for _ in range(10):
+        frame = ring.acquire(SHAPE)
+        assert base_address(frame) != held_address
+        frame.fill(0)
+        del frame
+    assert (held.view(np.uint8) == 7).all()
+    assert ring.overflows == 0
+
+    del held
+    assert ring.in_use() == 0
+    addresses = {base_address(ring.acquire(SHAPE)) for _ in range(3)}
+    assert held_address in addresses
+
+
+def test_released_slots_are_reused():
+    ring = CaptureRing(2)
+    for _ in range(10):
+        ring.acquire(SHAPE)
+    assert ring.allocations == 1
+    assert ring.reuses == 9
+    assert ring.in_use() == 0
+
+
+def test_overflow_frames_are_never_recycled():
+    allocator = CtypesAllocator()
+    ring = CaptureRing(2, allocate=allocator.allocate, release=allocator.release)
+    held = fill(ring, 2)
+    ring_addresses = {base_address(frame) for frame in held}
+
+    overflow = fill(ring, 3)
+    assert ring.overflows == 3
+    assert len(allocator.buffers) == 2
+    for frame in overflow:
+        assert allocator.owner(frame) is None
+        assert base_address(frame) not in ring_addresses
+
+    del overflow
+    frame = ring.acquire(SHAPE)
+    assert ring.overflows == 4
+    assert allocator.owner(frame) is None
+    del frame
+
+    del held[0]
+    frame = ring.acquire(SHAPE)
+    assert allocator.owner(frame) is not None
+    assert ring.overflows == 4
+    assert allocator.released == []
+
+
+def test_reset_releases_free_buffers():
+    allocator = CtypesAllocator()
+    ring = CaptureRing(3, allocate=allocator.allocate, release=allocator.release)
+    fill(ring, 3)
+    assert len(allocator.buffers) == 3
+
+    ring.reset()
+    assert sorted(allocator.released) == sorted(allocator.buffers)
+    assert ring.in_use() == 0
+
+    frame = ring.acquire(SHAPE)
+    assert allocator.owner(frame) not in allocator.released
+    assert len(allocator.buffers) == 4
+
+
+def test_reset_defers_release_of_held_buffers():
+    allocator = CtypesAllocator()
+    ring = CaptureRing(3, allocate=allocator.allocate, release=allocator.release)
+    frames = fill(ring, 3)
+    held = frames[1][2:5]
+    held_buffer = allocator.owner(held)
+    del frames
+
+    ring.reset()
+    assert len(allocator.released) == 2
+    assert held_buffer not in allocator.released
+
+    frame = ring.acquire(SHAPE)
+    assert held_buffer not in allocator.released
+    del frame, held
+    ring.acquire(SHAPE)
+    assert held_buffer in allocator.released
+    assert len(allocator.released) == 3
+
+
+def test_resize_retires_old_buffer():
+    allocator = CtypesAllocator()
+    ring = CaptureRing(1, allocate=allocator.allocate, release=allocator.release)
+    ring.acquire(SHAPE)
+    frame = ring.acquire((40, 40, 4))
+    assert frame.shape == (40, 40, 4)
+    assert len(allocator.buffers) == 2
+    assert len(allocator.released) == 1
+
+
+class CountingFrameSource(FrameSource):
+    def __init__(self, limit=None):
+        super().__init__(slots=4)
+        self.limit = limit
+        self.grabs = 0
+
+    def grab(self, max_y):
+        if self.limit is not None and self.grabs >= self.limit:
+            raise EOFError("done")
+        self.grabs += 1
+        frame = self.ring.acquire((4, 4, 3))
+        frame.fill(self.grabs % 256)
+        return frame
+
+
+def test_synthetic_source_is_seeded_and_animated():
+    first = SyntheticFrameSource(64, 48, seed=3)
+    second = SyntheticFrameSource(64, 48, seed=3)
+    frame = first.grab(None)
+    assert frame.shape == (48, 64, 3)
+    assert np.array_equal(frame, second.grab(None))
+    assert not np.array_equal(frame, first.grab(None))
+    assert first.grab(20).shape == (20, 64, 3)
+    assert first.grab(500).shape == (48, 64, 3)
+
+
+def test_synthetic_source_regions_match_scene():
+    source = SyntheticFrameSource(64, 48, seed=1)
+    crops = source.grab_regions([(0, 0, 10, 10), (50, 40, 80, 60)])
+    assert np.array_equal(crops[0], source.scene[:10, :10])
+    assert np.array_equal(crops[1], source.scene[40:48, 50:64])
+
+
+@pytest.fixture
+def frames_dir(tmp_path):
+    for index in range(3):
+        cv2.imwrite(str(tmp_path / f"{index:02d}.png"), np.full((20, 30, 3), index * 50, dtype=np.uint8))
+    (tmp_path / "notes.txt").write_text("not a frame")
+    return tmp_path
+
+
+def test_file_source_loops_in_order(frames_dir):
+    source = FileFrameSource(frames_dir)
+    values = [int(source.grab(None)[0, 0, 0]) for _ in range(5)]
+    assert values == [0, 50, 100, 0, 50]
+    assert source.grab(8).shape == (8, 30, 3)
+
+
+def test_file_source_without_loop_raises_eof(frames_dir):
+    source = FileFrameSource(frames_dir, loop=False, limit=2)
+    source.grab(None)
+    crops = source.grab_regions([(5, 5, 10, 10)])
+    assert (crops[0] == 50).all()
+    with pytest.raises(EOFError):
+        source.grab(None)
+    with pytest.raises(EOFError):
+        source.grab_regions([(0, 0, 1, 1)])
+
+
+def test_file_source_requires_frames(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        FileFrameSource(tmp_path)
+
+
+@pytest.mark.parametrize("region, expected", [
+    ((2, 3, 6, 8), (2, 3, 6, 8)),
+    ((-5, -5, 4, 4), (0, 0, 4, 4)),
+    ((25, 15, 40, 30), (25, 15, 30, 20)),
+    ((40, 30, 50, 45), (30, 20, 30, 20)),
+    ((8, 8, 3, 3), (8, 8, 8, 8)),
+])
+def test_clip_regions(region, expected):
+    assert clip_regions([region], (20, 30, 3)) == [expected]
+
+
+def test_pack_regions_shares_one_slot():
+    source = FrameSource(slots=2)
+    image = np.arange(20 * 30 * 3, dtype=np.uint8).reshape(20, 30, 3)
+    regions = [(2, 3, 6, 8), (-5, -5, 4, 4), (40, 30, 50, 45), (8, 8, 3, 3)]
+    crops = source.pack_regions(image, regions)
+    assert [crop.shape for crop in crops] == [(5, 4, 3), (4, 4, 3), (0, 0, 3), (0, 0, 3)]
+    assert np.array_equal(crops[0], image[3:8, 2:6])
+    assert np.array_equal(crops[1], image[:4, :4])
+    assert source.ring.in_use() == 1
+    assert crop_regions(image, regions)[0].shape == crops[0].shape
+
+
+def test_pack_regions_converts_bgra():
+    source = FrameSource(slots=1)
+    image = np.zeros((10, 10, 4), dtype=np.uint8)
+    image[..., :3] = (10, 20, 30)
+    image[..., 3] = 255
+    crop = source.pack_regions(image, [(1, 1, 5, 5)])[0]
+    assert crop.shape == (4, 4, 3)
+    assert (crop == (10, 20, 30)).all()
+
+
+def test_publisher_request_waits_for_a_newer_grab():
+    source = CountingFrameSource()
+    publisher = FramePublisher(source, interval=10.0, timeout=2.0)
+    assert publisher.latest() is None
+    publisher.start()
+    try:
+        first = publisher.wait_newer(0)
+        assert first is not None
+        # With a long interval the thread only grabs again when a request wakes it.
+        sequence = publisher.request()
+        assert sequence >= first[1]
+        frame, newer, _ = publisher.wait_newer(sequence)
+        assert newer > sequence
+        assert frame[0, 0, 0] == newer % 256
+        assert publisher.latest()[1] == newer
+    finally:
+        publisher.stop()
+    assert not publisher.running
+    assert publisher.latest() is None
+
+
+def test_publisher_wait_newer_times_out():
+    source = CountingFrameSource(limit=1)
+    publisher = FramePublisher(source, interval=0.0, timeout=0.2)
+    publisher.start()
+    try:
+        first = publisher.wait_newer(0)
+        assert first is not None
+        # The source is exhausted, so the thread stops and no newer frame arrives.
+        assert publisher.wait_newer(first[1], timeout=0.2) is None
+    finally:
+        publisher.stop()
+    assert source.grabs == 1
@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+import pytest
+
+import config
+from asset_scanner import AssetScanner
+from image_matcher import HIT_DTYPE, ImageMatcher
+
+
+def merge_detection(hits, proximity=10, bucket_size=10):
+    # The per-hit bucket loop that aggregate_votes replaced, kept as the reference.
+    detections = {}
+    buckets = {}
+    for template, confidence, x, y in hits:
+        bucket_x = x // bucket_size
+        bucket_y = y // bucket_size
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for px, py in buckets.get((bucket_x + dx, bucket_y + dy), []):
+                    if abs(x - px) < proximity and abs(y - py) < proximity:
+                        detections[(px, py)].append((template, confidence))
+                        break
+                else:
+                    continue
+                break
+            else:
+                continue
+            break
+        else:
+            detections[(x, y)] = [(template, confidence)]
+            buckets.setdefault((bucket_x, bucket_y), []).append((x, y))
+    return sorted(
+        (x, y, max(confidence for _, confidence in matches), len(matches))
+        for (x, y), matches in detections.items()
+    )
+
+
+def aggregate(image_matcher, hits):
+    clusters, labels = image_matcher.aggregate_votes(hits)
+    for label, cluster in enumerate(clusters):
+        members = hits[labels == label]
+        assert cluster["votes"] == members.size
+        assert (cluster["x"], cluster["y"]) == (members[0]["x"], members[0]["y"])
+    return sorted(
+        (int(cluster["x"]), int(cluster["y"]), float(cluster["confidence"]), int(cluster["votes"]))
+        for cluster in clusters
+    )
+
+
+def as_hits(rows):
+    return np.array(rows, dtype=HIT_DTYPE)
+
+
+def reference(hits):
+    return merge_detection(
+        (int(hit["template"]), float(hit["confidence"]), int(hit["x"]), int(hit["y"])) for hit in hits
+    )
+
+
+@pytest.fixture(scope="module")
+def image_matcher():
+    return ImageMatcher(config.MATCH_THRESHOLD)
+
+
+def test_empty_hits(image_matcher):
+    clusters, labels = image_matcher.aggregate_votes(np.empty(0, dtype=HIT_DTYPE))
+    assert clusters.size == 0
+    assert labels.size == 0
+
+
+@pytest.mark.parametrize("rows", [
+    [(0, 0.9, 104, 50), (1, 0.8, 110, 50)],
+    [(0, 0.9, 100, 50), (1, 0.8, 108, 50), (2, 0.8, 116, 50), (3, 0.8, 124, 50)],
+    [(0, 0.7, 0, 0), (1, 0.8, 10, 0), (2, 0.9, 5, 5), (3, 0.6, -3, 9)],
+])
+def test_votes_match_bucket_merge(image_matcher, rows):
+    hits = as_hits(rows)
+    assert aggregate(image_matcher, hits) == reference(hits)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_hits_match_bucket_merge(image_matcher, seed):
+    rng = np.random.default_rng(seed)
+    count = int(rng.integers(1, 600))
+    hits = np.zeros(count, dtype=HIT_DTYPE)
+    hits["template"] = rng.integers(0, 16, count)
+    hits["confidence"] = rng.random(count)
+    if seed % 2:
+        centres = rng.integers(0, 300, (max(1, count // 30), 2))
+        picked = centres[rng.integers(0, len(centres), count)]
+        hits["x"] = picked[:, 0] + rng.integers(-8, 9, count)
+        hits["y"] = picked[:, 1] + rng.integers(-8, 9, count)
+    else:
+        hits["x"] = rng.integers(-20, 300, count)
+        hits["y"] = rng.integers(0, 200, count)
+    assert aggregate(image_matcher, hits) == reference(hits)
+
+
+def test_matched_hits_match_bucket_merge(image_matcher):
+    templates = AssetScanner(image_matcher).scan(config.ASSETS_DIR)
+    names = sorted(name for name in templates.names() if name.startswith("RedIcon"))
+    bank = templates.subset(names)
+    rng = np.random.default_rng(7)
+    total = 0
+    for _ in range(3):
+        frame = cv2.GaussianBlur(rng.integers(0, 256, (400, 360, 3), dtype=np.uint8), (9, 9), 0)
+        for _ in range(6):
+            icon = bank[names[int(rng.integers(len(names)))]].image
+            h, w = icon.shape[:2]
+            x = int(rng.integers(0, 360 - w))
+            y = int(rng.integers(0, 400 - h))
+            frame[y:y + h, x:x + w] = icon
+        hits = image_matcher.collect_hits(
+            image_matcher.find_all_templates_multi(frame, bank, threshold=0.6, min_distance=4),
+            names,
+        )
+        total += hits.size
+        assert aggregate(image_matcher, hits) == reference(hits)
+    assert total > 0
@@ -0,0 +1,127 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import config
+from asset_scanner import AssetScanner
+
+
+FRAME_WIDTH = 360
+FIXED_UI_TEMPLATES = ("newLevel", "unlock", "upgradeStation")
+
+
+def load_templates(image_matcher):
+    scanner = AssetScanner(image_matcher)
+    return scanner.scan(config.ASSETS_DIR)
+
+
+def red_icon_bank(templates):
+    names = sorted(
+        (name for name in templates.names() if name.startswith("RedIcon")),
+        key=lambda name: (len(name), name),
+    )
+    return templates.subset(names)
+
+
+def load_frames(frames_dir, count, templates, max_y=config.MAX_SEARCH_Y, synthetic=None):
+    frames = []
+    frames_path = Path(frames_dir) if frames_dir else None
+    if frames_path and frames_path.is_dir():
+        for path in sorted(frames_path.iterdir()):
+            if path.suffix.lower() not in (".png", ".jpg", ".bmp"):
+                continue
+            frame = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            frames.append(np.ascontiguousarray(frame[:max_y, :]))
+            if len(frames) >= count:
+                break
+
+    if frames:
+        print(f"Loaded {len(frames)} frames from {frames_path}")
+        return frames
+
+    print(f"No frames found in {frames_dir!r}; using {count} synthetic frames")
+    return (synthetic or synthetic_frames)(count, templates, max_y)
+
+
+def synthetic_frames(count, templates, max_y=config.MAX_SEARCH_Y, seed=1234):
+    rng = np.random.default_rng(seed)
+    icons = [template.image for template in red_icon_bank(templates)]
+    buttons = [templates[name].image for name in FIXED_UI_TEMPLATES if name in templates]
+    frames = []
+    for _ in range(count):
+        noise = rng.integers(0, 256, (max_y, FRAME_WIDTH, 3), dtype=np.uint8)
+        frame = cv2.GaussianBlur(noise, (9, 9), 0)
+        if buttons:
+            paste(frame, buttons[int(rng.integers(len(buttons)))], rng)
+        for _ in range(int(rng.integers(3, 7))):
+            paste(frame, icons[int(rng.integers(len(icons)))], rng)
+        frames.append(frame)
+    return frames
+
+
+def synthetic_sequence(count, templates, max_y=config.MAX_SEARCH_Y, seed=4321, patches=3, patch_size=24):
+    rng = np.random.default_rng(seed)
+    frame = synthetic_frames(1, templates, max_y, seed)[0]
+    frames = [frame]
+    for _ in range(count - 1):
+        frame = frame.copy()
+        for _ in range(patches):
+            x = int(rng.integers(0, frame.shape[1] - patch_size))
+            y = int(rng.integers(0, frame.shape[0] - patch_size))
+            frame[y:y + patch_size, x:x + patch_size] = rng.integers(0, 256, 3, dtype=np.uint8)
+        frames.append(frame)
+    return frames
+
+
+def paste(frame, image, rng):
+    h, w = image.shape[:2]
+    x = int(rng.integers(0, frame.shape[1] - w))
+    y = int(rng.integers(0, frame.shape[0] - h))
+    frame[y:y + h, x:x + w] = image
+    return x + w // 2, y + h // 2
+
+
+def red_icon_hits(image_matcher, frame, bank_results, names):
+    return gate_red_icon_hits(image_matcher, frame, image_matcher.collect_hits(bank_results, names))
+
+
+def gate_red_icon_hits(image_matcher, frame, hits):
+    if hits.size == 0 or not config.RED_ICON_COLOR_CHECK:
+        return hits
+    passed = image_matcher.red_dominant_mask(
+        frame,
+        np.stack([hits["x"], hits["y"]], axis=1),
+        size=config.RED_ICON_COLOR_SAMPLE_SIZE,
+        min_ratio=config.RED_ICON_COLOR_MIN_RATIO,
+        min_mean=config.RED_ICON_COLOR_MIN_MEAN,
+    )
+    return hits[passed]
+
+
+def vote(image_matcher, hits, names, min_matches):
+    clusters, labels = image_matcher.aggregate_votes(hits)
+    return [
+        (int(clusters["x"][label]), int(clusters["y"][label]),
+         [names[index] for index in np.unique(hits["template"][labels == label])])
+        for label in np.flatnonzero(clusters["votes"] >= min_matches)
+    ]
+
+
+def recall(reference, found, proximity=10):
+    kept = 0
+    total = 0
+    extra = 0
+    for expected, actual in zip(reference, found):
+        total += len(expected)
+        unmatched = [(x, y) for x, y, *_ in actual]
+        for x, y, *_ in expected:
+            for index, (fx, fy) in enumerate(unmatched):
+                if abs(x - fx) <= proximity and abs(y - fy) <= proximity:
+                    kept += 1
+                    del unmatched[index]
+                    break
+        extra += len(unmatched)
+    return (kept / total if total else 1.0), extra
@@ -0,0 +1,316 @@
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import config
+from asset_scanner import AssetScanner
+from image_matcher import ImageMatcher
+
+logger = logging.getLogger(__name__)
+
+
+def match_red_icon_bank(image_matcher, screenshot, bank, threshold, region=None, use_fft=None):
+    height, width = screenshot.shape[:2]
+    x_min, y_min, x_max, y_max = region or (0, 0, width, height)
+
+    if config.RED_ICON_CANDIDATE_GATING and config.RED_ICON_COLOR_CHECK:
+        rois = image_matcher.red_candidate_rois(
+            screenshot,
+            region=(x_min, y_min, x_max, y_max),
+            padding=bank.max_extent(),
+            size=config.RED_ICON_COLOR_SAMPLE_SIZE,
+            min_ratio=config.RED_ICON_COLOR_MIN_RATIO,
+            min_mean=config.RED_ICON_COLOR_MIN_MEAN,
+            min_area=config.RED_ICON_CANDIDATE_MIN_AREA,
+            max_size=config.RED_ICON_CANDIDATE_MAX_SIZE,
+        )
+        use_fft = False
+    else:
+        rois = [(x_min, y_min, x_max, y_max)]
+        if use_fft is None:
+            use_fft = config.RED_ICON_BANK_USE_FFT and region is None
+
+    return image_matcher.find_all_templates_in_rois(
+        screenshot,
+        bank,
+        rois,
+        threshold=threshold,
+        min_distance=80,
+        use_fft=use_fft,
+    )
+
+
+class FrameRing:
+    HEADER_FIELDS = 4
+
+    def __init__(self, slots, max_shape, name=None, create=True):
+        self.slots = slots
+        self.max_shape = tuple(max_shape)
+        self.slot_bytes = int(np.prod(self.max_shape))
+        header_bytes = slots * self.HEADER_FIELDS * np.dtype(np.int64).itemsize
+        self.shm = shared_memory.SharedMemory(
+            name=name,
+            create=create,
+            size=header_bytes + slots * self.slot_bytes if create else 0,
+        )
+        self.name = self.shm.name
+        self.headers = np.ndarray((slots, self.HEADER_FIELDS), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=self.shm.buf, offset=header_bytes)
+
+    def write(self, slot, frame, sequence):
+        bgra = frame.ndim == 3 and frame.shape[2] == 4
+        shape = frame.shape[:2] + (3,) if bgra else frame.shape
+        size = int(np.prod(shape))
+        if frame.dtype != np.uint8 or size > self.slot_bytes:
+            raise ValueError(f"Frame {frame.shape} {frame.dtype} does not fit ring slot of {self.max_shape}")
+        height, width = shape[:2]
+        channels = shape[2] if len(shape) == 3 else 0
+        target = self.data[slot, :size].reshape(shape)
+        if bgra:
+            # BGRA captures lose their alpha in the copy into shared memory that happens anyway.
+            cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=target)
+        else:
+            np.copyto(target, frame)
+        self.headers[slot] = (sequence, height, width, channels)
+
+    def read(self, slot):
+        sequence, height, width, channels = (int(value) for value in self.headers[slot])
+        shape = (height, width, channels) if channels else (height, width)
+        return self.data[slot, :int(np.prod(shape))].reshape(shape), sequence
+
+    def close(self):
+        self.headers = None
+        self.data = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def _worker_main(ring_name, slots, max_shape, red_icon_names, tasks, results):
+    ring = FrameRing(slots, max_shape, name=ring_name, create=False)
+    image_matcher = ImageMatcher(config.MATCH_THRESHOLD, workers=1)
+    scanner = AssetScanner(
+        image_matcher,
+        cache_dir=config.TEMPLATE_CACHE_DIR if config.TEMPLATE_CACHE_ENABLED else None,
+    )
+    templates = scanner.scan(config.ASSETS_DIR)
+    bank = templates.subset(red_icon_names)
+    results.put((None, True, len(templates)))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, slot, detector, params = task
+        frame, _ = ring.read(slot)
+        try:
+            if detector == "red_icon_bank":
+                names = params.pop("names", None)
+                image_matcher.start_template_timings()
+                payload = match_red_icon_bank(image_matcher, frame, bank.subset(names) if names else bank, **params)
+                payload = (payload, image_matcher.pop_template_timings())
+            elif detector == "template":
+                name = params.pop("template_name")
+                payload = image_matcher.find_template(frame, templates[name], template_name=name, **params)
+                payload = (bool(payload[0]), float(payload[1]), int(payload[2]), int(payload[3]))
+            else:
+                raise ValueError(f"Unknown detector: {detector}")
+            results.put((request_id, True, payload))
+        except Exception as e:
+            results.put((request_id, False, repr(e)))
+        finally:
+            del frame
+
+    ring.close()
+
+
+class VisionService:
+    STARTUP_TIMEOUT = 60.0
+    HEALTH_INTERVAL = 0.25
+    MAX_WORKER_FAILURES = 3
+
+    def __init__(self, red_icon_names, workers=2, slots=4, max_shape=None, timeout=2.0):
+        self.red_icon_names = list(red_icon_names)
+        self.workers = max(1, workers)
+        self.slots = max(self.workers, slots)
+        self.max_shape = tuple(int(size) for size in (max_shape or (config.WINDOW_HEIGHT, config.WINDOW_WIDTH, 3)))
+        self.timeout = timeout
+        self.ring = None
+        self._processes = []
+        self._tasks = None
+        self._results = None
+        self._collector = None
+        self._context = None
+        self._pending = {}
+        self._ready = 0
+        self._failures = 0
+        self._disabled = False
+        self._stopping = False
+        self._free_slots = []
+        self._slot_ready = threading.Condition()
+        self._request_ids = itertools.count(1)
+        self._sequence = itertools.count(1)
+
+    @property
+    def running(self):
+        return self.ring is not None and not self._disabled
+
+    def start(self):
+        if self.ring is not None:
+            return
+        self._context = multiprocessing.get_context("spawn")
+        self.ring = FrameRing(self.slots, self.max_shape)
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        self._free_slots = list(range(self.slots))
+        self._ready = 0
+        self._failures = 0
+        self._disabled = False
+        self._stopping = False
+        self._processes = [self._spawn(index) for index in range(self.workers)]
+        self._collector = threading.Thread(target=self._collect, name="vision-results", daemon=True)
+        self._collector.start()
+        with self._slot_ready:
+            ready = self._slot_ready.wait_for(
+                lambda: self._ready >= self.workers or self._disabled,
+                timeout=self.STARTUP_TIMEOUT,
+            )
+        if not ready:
+            logger.warning(f"Only {self._ready}/{self.workers} vision workers reported ready")
+        logger.info(f"Vision service started with {self.workers} workers and {self.slots} frame slots")
+
+    def stop(self):
+        if self.ring is None:
+            return
+        self._stopping = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        self._collector.join(timeout=2.0)
+        with self._slot_ready:
+            for future, _ in self._pending.values():
+                future.set_exception(RuntimeError("Vision service stopped"))
+            self._pending.clear()
+        self.ring.close()
+        self.ring.unlink()
+        self.ring = None
+        self._processes = []
+        logger.info("Vision service stopped")
+
+    def submit(self, frame, detector, **params):
+        if not self.running:
+            raise RuntimeError("Vision service is not running")
+        with self._slot_ready:
+            if not self._slot_ready.wait_for(lambda: self._free_slots, timeout=self.timeout):
+                raise TimeoutError("No free vision frame slot")
+            slot = self._free_slots.pop()
+            request_id = next(self._request_ids)
+            future = Future()
+            self._pending[request_id] = (future, slot)
+        try:
+            self.ring.write(slot, frame, next(self._sequence))
+        except ValueError:
+            with self._slot_ready:
+                self._pending.pop(request_id)
+                self._free_slots.append(slot)
+                self._slot_ready.notify_all()
+            raise
+        self._tasks.put((request_id, slot, detector, params))
+        return future
+
+    def match_red_icon_bank(self, frame, threshold, region=None, names=None):
+        return self._wait(self.submit(frame, "red_icon_bank", threshold=threshold, region=region, names=names))
+
+    def find_template(self, frame, template_name, threshold=None, check_color=False, pyramid_levels=0):
+        future = self.submit(
+            frame,
+            "template",
+            template_name=template_name,
+            threshold=threshold,
+            check_color=check_color,
+            pyramid_levels=pyramid_levels,
+        )
+        return self._wait(future)
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Vision worker did not answer within {self.timeout}s")
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.ring.name, self.slots, self.max_shape, self.red_icon_names, self._tasks, self._results),
+            name=f"vision-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def _check_workers(self):
+        dead = [index for index, process in enumerate(self._processes) if not process.is_alive()]
+        if not dead or self._stopping or self._disabled:
+            return
+
+        # Tasks share one queue, so any pending request may have been taken by the dead worker.
+        with self._slot_ready:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._free_slots.extend(slot for _, slot in pending)
+            self._failures += len(dead)
+            self._disabled = self._failures >= self.MAX_WORKER_FAILURES
+            self._slot_ready.notify_all()
+        for future, _ in pending:
+            future.set_exception(RuntimeError("Vision worker exited"))
+
+        for index in dead:
+            logger.warning(f"Vision worker {index} exited with code {self._processes[index].exitcode}")
+            if not self._disabled:
+                self._processes[index] = self._spawn(index)
+        if self._disabled:
+            logger.error(f"Vision service disabled after {self._failures} worker failures, matching in-process")
+
+    def _collect(self):
+        checked = time.monotonic()
+        while True:
+            try:
+                message = self._results.get(timeout=self.HEALTH_INTERVAL)
+            except queue.Empty:
+                message = ()
+            if time.monotonic() - checked >= self.HEALTH_INTERVAL:
+                self._check_workers()
+                checked = time.monotonic()
+            if message is None:
+                break
+            if not message:
+                continue
+            request_id, ok, payload = message
+            with self._slot_ready:
+                if request_id is None:
+                    self._ready += 1
+                    self._slot_ready.notify_all()
+                    continue
+                entry = self._pending.pop(request_id, None)
+                if entry is None:
+                    continue
+                future, slot = entry
+                self._free_slots.append(slot)
+                self._slot_ready.notify_all()
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(f"Vision worker failed: {payload}"))
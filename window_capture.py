@@ -1,12 +1,18 @@
-import win32gui
-import win32ui
-import win32con
-import win32api
+try:
+    import win32gui
+    import win32con
+    import win32api
+except ImportError:
+    # Frame sources other than Win32FrameSource can run without pywin32.
+    win32gui = win32con = win32api = None
 import ctypes
+from ctypes import wintypes
+import cv2
 import numpy as np
 from PIL import Image
 import logging
 import threading
+from frame_source import CaptureRing, FrameSource
 
 logger = logging.getLogger(__name__)
 
@@ -20,14 +26,196 @@ def _set_dpi_awareness():
 _set_dpi_awareness()
 
 
+class BITMAPINFOHEADER(ctypes.Structure):
+    _fields_ = [
+        ("biSize", wintypes.DWORD),
+        ("biWidth", wintypes.LONG),
+        ("biHeight", wintypes.LONG),
+        ("biPlanes", wintypes.WORD),
+        ("biBitCount", wintypes.WORD),
+        ("biCompression", wintypes.DWORD),
+        ("biSizeImage", wintypes.DWORD),
+        ("biXPelsPerMeter", wintypes.LONG),
+        ("biYPelsPerMeter", wintypes.LONG),
+        ("biClrUsed", wintypes.DWORD),
+        ("biClrImportant", wintypes.DWORD),
+    ]
+
+
+class BITMAPINFO(ctypes.Structure):
+    _fields_ = [("bmiHeader", BITMAPINFOHEADER), ("bmiColors", wintypes.DWORD * 3)]
+
+
+def _gdi_functions():
+    gdi32 = ctypes.windll.gdi32
+    user32 = ctypes.windll.user32
+    gdi32.CreateCompatibleDC.argtypes = [wintypes.HDC]
+    gdi32.CreateCompatibleDC.restype = wintypes.HDC
+    gdi32.CreateDIBSection.argtypes = [
+        wintypes.HDC,
+        ctypes.POINTER(BITMAPINFO),
+        wintypes.UINT,
+        ctypes.POINTER(ctypes.c_void_p),
+        wintypes.HANDLE,
+        wintypes.DWORD,
+    ]
+    gdi32.CreateDIBSection.restype = wintypes.HBITMAP
+    gdi32.SelectObject.argtypes = [wintypes.HDC, wintypes.HGDIOBJ]
+    gdi32.SelectObject.restype = wintypes.HGDIOBJ
+    gdi32.DeleteObject.argtypes = [wintypes.HGDIOBJ]
+    gdi32.DeleteObject.restype = wintypes.BOOL
+    gdi32.DeleteDC.argtypes = [wintypes.HDC]
+    user32.GetWindowDC.argtypes = [wintypes.HWND]
+    user32.GetWindowDC.restype = wintypes.HDC
+    user32.ReleaseDC.argtypes = [wintypes.HWND, wintypes.HDC]
+    user32.PrintWindow.argtypes = [wintypes.HWND, wintypes.HDC, wintypes.UINT]
+    user32.PrintWindow.restype = wintypes.BOOL
+    return gdi32, user32
+
+
+class Win32FrameSource(FrameSource):
+    PW_CLIENTONLY = 0x1
+    PW_RENDERFULLCONTENT = 0x2
+
+    def __init__(self, window_capture, slots=16, bgra=False):
+        super().__init__(slots)
+        self.window_capture = window_capture
+        self.bgra = bgra
+        self._gdi32, self._user32 = _gdi_functions()
+        self._memory_dc = None
+        self._bitmap = None
+        self._old_bitmap = None
+        self._pixels = None
+        self._size = None
+        self._dibs = {}
+        if bgra:
+            # Every ring slot is a DIB section, so PrintWindow renders straight into the frame that is handed out.
+            self.ring = CaptureRing(slots, allocate=self._allocate_dib, release=self._release_dib)
+
+    def grab(self, max_y):
+        width, height = self._prepare()
+        if max_y is not None:
+            height = min(height, max_y)
+
+        if not self.bgra:
+            frame = self.ring.acquire((height, width, 3))
+            cv2.cvtColor(self._render(self._bitmap)[:height], cv2.COLOR_BGRA2BGR, dst=frame)
+            return frame
+
+        frame = self.ring.acquire((height, width, 4))
+        bitmap = self._dibs.get(frame.ctypes.data)
+        if bitmap is None:
+            # Overflow frames are plain numpy memory, so they are copied out of the scratch bitmap.
+            np.copyto(frame, self._render(self._bitmap)[:height])
+        else:
+            self._render(bitmap)
+        return frame
+
+    def grab_regions(self, regions):
+        # PrintWindow still renders the whole client area, but only the requested boxes are converted and copied.
+        self._prepare()
+        return self.pack_regions(self._render(self._bitmap), regions)
+
+    def _prepare(self):
+        if not self.window_capture.hwnd:
+            self.window_capture.find_window()
+
+        _, _, width, height = self.window_capture.get_window_rect()
+        self._ensure_bitmap(width, height)
+        return width, height
+
+    def _render(self, bitmap):
+        # Ring DIBs are selected only for the render: a bitmap still selected into a DC cannot be deleted.
+        if bitmap != self._bitmap:
+            self._gdi32.SelectObject(self._memory_dc, bitmap)
+        try:
+            self._user32.PrintWindow(self.window_capture.hwnd, self._memory_dc, self.PW_CLIENTONLY | self.PW_RENDERFULLCONTENT)
+            self._gdi32.GdiFlush()
+        finally:
+            if bitmap != self._bitmap:
+                self._gdi32.SelectObject(self._memory_dc, self._bitmap)
+        return self._pixels
+
+    def _ensure_bitmap(self, width, height):
+        if self._size == (width, height):
+            return
+        self.close()
+
+        hwnd = self.window_capture.hwnd
+        window_dc = self._user32.GetWindowDC(hwnd)
+        try:
+            self._memory_dc = self._gdi32.CreateCompatibleDC(window_dc)
+        finally:
+            self._user32.ReleaseDC(hwnd, window_dc)
+
+        self._size = (width, height)
+        try:
+            self._bitmap, bits = self._create_dib(width, height)
+        except OSError:
+            self.close()
+            raise
+        self._old_bitmap = self._gdi32.SelectObject(self._memory_dc, self._bitmap)
+
+        buffer = (ctypes.c_ubyte * (width * height * 4)).from_address(bits)
+        self._pixels = np.ctypeslib.as_array(buffer).reshape(height, width, 4)
+        logger.debug(f"Capture bitmap allocated at {width}x{height}")
+
+    def _create_dib(self, width, height):
+        info = BITMAPINFO()
+        info.bmiHeader.biSize = ctypes.sizeof(BITMAPINFOHEADER)
+        info.bmiHeader.biWidth = width
+        info.bmiHeader.biHeight = -height
+        info.bmiHeader.biPlanes = 1
+        info.bmiHeader.biBitCount = 32
+        bits = ctypes.c_void_p()
+        bitmap = self._gdi32.CreateDIBSection(self._memory_dc, ctypes.byref(info), 0, ctypes.byref(bits), None, 0)
+        if not bitmap or not bits.value:
+            if bitmap:
+                self._delete_object(bitmap)
+            raise ctypes.WinError()
+        return bitmap, bits.value
+
+    def _allocate_dib(self, size):
+        # Top-down 32bpp rows are contiguous, so the first rows of the section form the frame.
+        width = self._size[0]
+        bitmap, bits = self._create_dib(width, -(-size // (width * 4)))
+        self._dibs[bits] = bitmap
+        return (ctypes.c_ubyte * size).from_address(bits)
+
+    def _release_dib(self, buffer):
+        bitmap = self._dibs.pop(ctypes.addressof(buffer), None)
+        if bitmap:
+            self._delete_object(bitmap)
+
+    def _delete_object(self, handle):
+        if not self._gdi32.DeleteObject(handle):
+            logger.warning(f"DeleteObject failed for GDI handle {handle:#x}; the bitmap is leaked")
+
+    def close(self):
+        self._pixels = None
+        self._size = None
+        if self._memory_dc:
+            if self._old_bitmap:
+                self._gdi32.SelectObject(self._memory_dc, self._old_bitmap)
+            self._gdi32.DeleteDC(self._memory_dc)
+        if self.bgra:
+            self.ring.reset()
+        if self._bitmap:
+            self._delete_object(self._bitmap)
+        self._memory_dc = None
+        self._bitmap = None
+        self._old_bitmap = None
+
+
 class WindowCapture:
-    def __init__(self, window_title, target_width=800, target_height=600):
+    def __init__(self, window_title, target_width=800, target_height=600, slots=16, bgra=False):
         self.window_title = window_title
         self.hwnd = None
         self.target_width = target_width
         self.target_height = target_height
         self.find_window()
         self.resize_window()
+        self.frame_source = Win32FrameSource(self, slots, bgra)
     
     def find_window(self):
         self.hwnd = win32gui.FindWindow(None, self.window_title)
@@ -62,38 +250,10 @@ class WindowCapture:
         return x, y, width, height
     
     def capture(self, max_y=None):
-        if not self.hwnd:
-            self.find_window()
-        
-        x, y, width, height = self.get_window_rect()
-        
-        if max_y is not None:
-            height = min(height, max_y)
-        
-        hwndDC = win32gui.GetWindowDC(self.hwnd)
-        mfcDC = win32ui.CreateDCFromHandle(hwndDC)
-        saveDC = mfcDC.CreateCompatibleDC()
-        
-        saveBitMap = win32ui.CreateBitmap()
-        saveBitMap.CreateCompatibleBitmap(mfcDC, width, height)
-        saveDC.SelectObject(saveBitMap)
-        
-        result = ctypes.windll.user32.PrintWindow(self.hwnd, saveDC.GetSafeHdc(), 3)
-        
-        bmpinfo = saveBitMap.GetInfo()
-        bmpstr = saveBitMap.GetBitmapBits(True)
-        img = np.frombuffer(bmpstr, dtype=np.uint8)
-        img.shape = (height, width, 4)
-        
-        win32gui.DeleteObject(saveBitMap.GetHandle())
-        saveDC.DeleteDC()
-        mfcDC.DeleteDC()
-        win32gui.ReleaseDC(self.hwnd, hwndDC)
-        
-        img = img[:, :, :3]
-        img = np.ascontiguousarray(img)
-        
-        return img
+        return self.frame_source.capture(max_y=max_y)
+
+    def capture_regions(self, regions):
+        return self.frame_source.capture_regions(regions)
     
     def is_window_active(self):
         return win32gui.IsWindow(self.hwnd) if self.hwnd else False